@@ -20,8 +20,9 @@
 
 import fzz2scadLib as lib
 import argparse
+import atexit
 import os
-import json
+import sys
 
 # ####################### SCRIPT PART ########################
 
@@ -31,19 +32,74 @@ if __name__ == "__main__":
     parser.add_argument("INPUT_FILE", help="The Fritzing Sketch File (.fzz) to use.")
     parser.add_argument("-m", "--module-name", default=None, help="The name of the OpenSCAD module that will be created. (default: 'foo.fzz' creates 'module foo()') If there are names set in the Sketch, this becomes a prefix.")
     parser.add_argument("-g", "--show-groundplate", help="Show a 'groundplate' for each part. This might be helpful when creating and testing new modules.", action="store_true")
+    parser.add_argument("--multmatrix", action="store_true", help="Place each part with a single multmatrix() instead of nested translate(), rotate() and mirror().")
+    parser.add_argument("--lod", action="store_true", help="Let the preview (F5) show bounding boxes and coarse holes instead of the models of the parts. The final render (F6) shows the models.")
+    parser.add_argument("--lod-height", default="{}mm".format(lib.LOD_HEIGHT), help="The height of the bounding boxes of --lod and --gltf. (default: {}mm)".format(lib.LOD_HEIGHT))
+    parser.add_argument("--lod-fn", type=int, default=lib.LOD_FN, help="The $fn of the holes of --lod. (default: {})".format(lib.LOD_FN))
+    parser.add_argument("--placement", action="store_true", help="Write the placement and the bounding box of each part and of each module as variables MODULE_placement and MODULE_bbox.")
     parser.add_argument("-r", "--round", help="Try to round coordinates as Fritzing is not able to place parts in eg. x=0;y=0 (NOT IMPLEMENTED YET).", action="store_true")
     parser.add_argument("-v", "--verbose", action="count", default=0, help="-v -vv- -vvv increase output verbosity")
+    parser.add_argument("--log-json", action="store_true", help="Write the messages of -v -vv -vvv as JSON lines to stderr.")
     parser.add_argument("-l", "--list", help="List the parts and their position in the given input file and exit.", action="store_true")
     parser.add_argument('-V', '--version', action='version', version="%(prog)s " + str(lib.VERSION))
     parser.add_argument("-o", "--output", nargs="?", default=None, const="", help="Write output to an .scad File instead to console. (if not defined further 'foo.fzz' becomes 'foo.scad')")
-    parser.add_argument("--override", action="store_true", help="Override existing output files without asking.")
+    parser.add_argument("--split", action="store_true", help="Write each module to its own file ('foo.scad' becomes 'foo.MODULE.scad') and the export variables to 'foo.export.scad'. The output file includes them. Needs --output.")
+    parser.add_argument("--override", action="store_true", help="Override existing output files without asking. Files are only written if their content changes.")
     parser.add_argument("--dont-override", action="store_true", help="Do not override any existing output files - Print to console instead.")
-    parser.add_argument("--ask", default="true", action="store_true", help="Ask if an existing file should be overwritten. (default)")
+    parser.add_argument("--ask", default="true", action="store_true", help="Ask if an existing file should be overwritten. Without a terminal to ask, it is not. (default)")
+    parser.add_argument("--stl", nargs="?", default=None, const=".", metavar="DIRECTORY", help="Write a frontplate (binary STL) for each module to DIRECTORY (default: '.') instead of the .scad output. OpenSCAD is not needed for that.")
+    parser.add_argument("--cut", nargs="?", default=None, const=".", metavar="DIRECTORY", help="Write a 2D cut file (board outlines, holes and cut-outs) for each module to DIRECTORY (default: '.') instead of the .scad output.")
+    parser.add_argument("--cut-format", choices=["dxf", "svg"], default="dxf", help="The format of the cut files. (default: dxf)")
+    parser.add_argument("--gltf", nargs="?", default=None, const="", metavar="FILE", help="Write the parts as glTF scene to FILE (.glb or .gltf, default: 'foo.fzz' becomes 'foo.glb') instead of the .scad output.")
+    parser.add_argument("--gltf-meshes", default=None, metavar="JSON_FILE", help="A table {\"MODULE_NAME\": \"FILE.stl\"} of the meshes --gltf uses instead of boxes.")
+    parser.add_argument("--cutouts", default=None, metavar="JSON_FILE", help="The table of cut-outs for the parts (see CUTOUTS.md). Used by --stl and --cut.")
+    parser.add_argument("--thickness", default=None, help="The thickness of the frontplates. (default: the 'pcbHeight' of the PCB)")
+    parser.add_argument("--fn", type=int, default=32, help="The number of segments of holes and round cut-outs. (default: 32)")
+    parser.add_argument("--render", nargs="?", default=None, const=".", metavar="DIRECTORY", help="Render each module to DIRECTORY/MODULE.stl (default: '.') instead of the .scad output. Unchanged modules are taken from the cache.")
+    parser.add_argument("--include", action="append", default=[], metavar="SCAD_FILE", help="A library file that is included when rendering or rendering models for --import-models. (may be given more than once)")
+    parser.add_argument("--import-models", default=None, metavar="CACHE_DIRECTORY", help="Import the model of each part as STL from CACHE_DIRECTORY instead of calling its module. Missing models are rendered with --openscad and the --include files first.")
+    parser.add_argument("--openscad", default="openscad", metavar="EXECUTABLE", help="The OpenSCAD compatible executable used by --render and --import-models. It is called like 'EXECUTABLE -o OUT.stl IN.scad'. (default: openscad)")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="The number of processes creating prototypes (only for sketches with many parts) and of parallel renders. (default: number of CPUs)")
+    parser.add_argument("--cache", default=None, metavar="DIRECTORY", help="The cache for rendered modules. (default: DIRECTORY/.cache of --render)")
+    parser.add_argument("--exclude", action="append", default=[], metavar="PATTERN", help="Ignore parts whose moduleIdRef matches this regular expression. (may be given more than once)")
+    parser.add_argument("--keep", action="append", default=[], metavar="PATTERN", help="Use parts whose moduleIdRef matches this regular expression, even if they are excluded. (may be given more than once)")
+    parser.add_argument("--layer", action="append", default=[], metavar="PATTERN", help="Also use parts whose pcbView layer matches this regular expression. (may be given more than once)")
+    parser.add_argument("--no-prototype-table", action="store_true", help="Take all parts from the sketch, not the core parts from the bundled prototype table.")
+    parser.add_argument("--parts-index", default=None, metavar="INDEX_FILE", help="Take the parts that are not embedded in the sketch from this index of local Fritzing parts (see fzz2scadPartsIndex.py).")
+    parser.add_argument("--memory-report", action="store_true", help="Report the peak memory allocation and the top allocation sites of each stage (to stderr).")
+    parser.add_argument("--max-memory", default=None, metavar="SIZE", help="Fail if a stage needs more memory than SIZE (e.g. '512M', '1G').")
 
     args = parser.parse_args()
     lib.args = args
-
-    lib.printConsole("fzz2scad " + str(lib.VERSION), 1)  # Say hi
+    lib.usePrototypeTable = not args.no_prototype_table
+    if args.parts_index is not None:
+        import fzz2scadPartsIndex
+        if not os.path.isfile(args.parts_index):
+            parser.error("The parts index '{}' does not exist. Create it with fzz2scadPartsIndex.py.".format(args.parts_index))
+        lib.partsIndex = fzz2scadPartsIndex.PartsIndex(args.parts_index)
+
+    if args.split and args.output is None:
+        parser.error("--split needs --output")
+
+    lib.printConsole("fzz2scad {}", 1, lib.VERSION)  # Say hi
+
+    maxMemory = None
+    if args.max_memory is not None:
+        try:
+            maxMemory = lib.parseByteSize(args.max_memory)
+        except ValueError as err:
+            parser.error("--max-memory: {}".format(err))
+    memory = lib.MemoryReport(args.memory_report, maxMemory)
+    lib.memoryReport = memory
+    if args.memory_report:
+        atexit.register(lambda: lib.printErrorConsole(memory.reportString(), 0))
+
+    def memoryExceededHook(excType, excValue, traceback, defaultHook=sys.excepthook):
+        if issubclass(excType, lib.MemoryExceededError):
+            lib.printErrorConsole("ERROR: {}".format(excValue), 0)
+        else:
+            defaultHook(excType, excValue, traceback)
+    sys.excepthook = memoryExceededHook
 
     # get filename
     inputFzzFileName = args.INPUT_FILE
@@ -55,7 +111,11 @@ if __name__ == "__main__":
     inputFzFileName = lib.getFilesThatEndWith(inputFzzFileName, ".fz")[0]  # We take the first and hope the best.
 
     lib.printConsole("PROGRESS: Taking XML Root from input file...", 1)
-    xmlRoot = lib.getXMLRoot(inputFzzFileName, inputFzFileName)
+    with memory.stage("archive read"):
+        inputFzContent = lib.readFileFromZip(inputFzzFileName, inputFzFileName)
+    with memory.stage("parse"):
+        xmlRoot = lib.parseXML(inputFzContent)
+        del inputFzContent
     lib.xmlRoot = xmlRoot
 
     lib.printConsole("PROGRESS: Taking the Configturation from the xml tree...", 1)
@@ -65,12 +125,22 @@ if __name__ == "__main__":
     else:
         moduleNameOrPrefix = str(os.path.split(inputFzzFileName)[-1]).split(".")[0]
 
-    configuration = lib.getConfig(xmlRoot, moduleNameOrPrefix)
-    lib.printConsole("CONFIGURATION:" + json.dumps(configuration, sort_keys=True, indent=4), 1)
+    with memory.stage("configuration"):
+        configuration = lib.getConfig(xmlRoot, moduleNameOrPrefix)
+    if lib.logEnabled(1):
+        import json
+        lib.printConsole("CONFIGURATION:{}", 1, json.dumps(configuration, sort_keys=True, indent=4))
+
+    partFilter = lib.getPartFilter(configuration, args.exclude, args.keep, args.layer)
+
+    lib.printConsole("PROGRESS: Creating the prototypes of the parts...", 1)
+    with memory.stage("prototypes"):
+        lib.buildPrototypes(xmlRoot, partFilter, args.jobs)
 
     lib.printConsole("PROGRESS: Extracting Parts from the xml tree...", 1)
-    parts = lib.getParts(xmlRoot, configuration['attributes'])
-    lib.printConsole("PARTS:" + repr(parts), 1)
+    with memory.stage("parts"):
+        parts = lib.getParts(xmlRoot, configuration['attributes'], partFilter)
+    lib.printConsole("PARTS:{!r}", 1, parts)
 
     # list parts and exit
     if args.list:
@@ -79,13 +149,72 @@ if __name__ == "__main__":
             lib.printConsole(part, 0)
         exit(0)
 
-    exportString = lib.createExportString(parts, configuration)
+    with memory.stage("export"):
+        exportString = lib.createExportString(parts, configuration)
+        if args.lod:
+            exportString = lib.createLodString(lib.Dimension(args.lod_height).asMm(), args.lod_fn) + ("\n" + exportString if exportString else "")
 
     lib.printConsole("PROGRESS: Sorting parts into modules...", 1)
-    modules = lib.splitPartsToModules(xmlRoot, parts, configuration['modules'])
+    with memory.stage("modules"):
+        modules = lib.splitPartsToModules(xmlRoot, parts, configuration['modules'])
     for moduleName, moduleParts in modules.items():
-        lib.printConsole("MODULE '{}':".format(moduleName), 1)
-        lib.printConsole("    PARTS: {}".format(moduleParts.keys()), 1)
+        lib.printConsole("MODULE '{}':", 1, moduleName)
+        lib.printConsole("    PARTS: {}", 1, moduleParts.keys())
+
+    # write frontplates and exit
+    if args.stl is not None:
+        import fzz2scadGeometry
+        import fzz2scadStl
+        cutoutTable = fzz2scadGeometry.loadCutoutTable(args.cutouts)
+        thickness = None
+        if args.thickness is not None:
+            thickness = lib.Dimension(args.thickness).asMm()
+        lib.printConsole("PROGRESS: Creating frontplates...", 1)
+        os.makedirs(args.stl, exist_ok=True)
+        failed = False
+        with memory.stage("frontplates"):
+            for moduleName, moduleParts in sorted(modules.items()):
+                try:
+                    mesh = fzz2scadStl.createFrontplateMesh(moduleName, moduleParts, configuration, cutoutTable, thickness, args.fn)
+                except fzz2scadStl.FrontplateError as err:
+                    lib.printErrorConsole("ERROR: {}".format(err), 0)
+                    failed = True
+                    continue
+                if mesh is not None:
+                    stlFileName = os.path.join(args.stl, moduleName + ".stl")
+                    lib.printConsole("INFO: Writing '{}' ({} vertices, {} triangles).", 1, stlFileName, len(mesh.vertices), len(mesh.triangles))
+                    mesh.writeBinaryStl(stlFileName, moduleName)
+                lib.checkMemory()
+        exit(1 if failed else 0)
+
+    # write cut files and exit
+    if args.cut is not None:
+        import fzz2scadGeometry
+        import fzz2scadCut
+        cutoutTable = fzz2scadGeometry.loadCutoutTable(args.cutouts)
+        lib.printConsole("PROGRESS: Creating cut files...", 1)
+        os.makedirs(args.cut, exist_ok=True)
+        with memory.stage("cut files"):
+            for moduleName, moduleParts in sorted(modules.items()):
+                cutString = fzz2scadCut.createCutString(moduleName, moduleParts, configuration, cutoutTable, args.cut_format, args.fn)
+                if cutString is not None:
+                    cutFileName = os.path.join(args.cut, moduleName + "." + args.cut_format)
+                    lib.printConsole("INFO: Writing '{}'.", 1, cutFileName)
+                    lib.writeFileIfChanged(cutFileName, cutString)
+                lib.checkMemory()
+        exit(0)
+
+    # write the glTF scene and exit
+    if args.gltf is not None:
+        import fzz2scadGltf
+        gltfFileName = args.gltf or os.path.basename(inputFzzFileName).rsplit(".", 1)[0] + ".glb"
+        meshTable = fzz2scadGltf.loadMeshTable(args.gltf_meshes)
+        lib.printConsole("PROGRESS: Creating the glTF scene...", 1)
+        os.makedirs(os.path.dirname(gltfFileName) or ".", exist_ok=True)
+        with memory.stage("gltf"):
+            fzz2scadGltf.createGltfFile(gltfFileName, modules, configuration, meshTable, lib.Dimension(args.lod_height).asMm(), args.fn)
+        lib.printConsole("INFO: Wrote '{}'.", 1, gltfFileName)
+        exit(0)
 
     fileCommentTemplate = """@filename: {filename}
 @created-with: fzz2scad v{version!s} (https://github.com/htho/fzz2scad)
@@ -105,21 +234,83 @@ if __name__ == "__main__":
     # where to write to?
     fileValues['filename'] = outputFileName
 
+    # render the models of the parts that are not cached yet
+    modelFiles = None
+    if args.import_models is not None:
+        import fzz2scadModels
+        lib.printConsole("PROGRESS: Preparing the models of the parts...", 1)
+        # paths in import() are relative to the file that imports
+        if args.render is not None:
+            relativeTo = args.render
+        else:
+            relativeTo = os.path.dirname(outputFileName or "") or "."
+        with memory.stage("models"):
+            modelFiles, results = fzz2scadModels.prepareModels(modules, args.include, args.import_models, args.openscad, args.jobs, relativeTo)
+        for call, status, output in results:
+            if status == "failed":
+                lib.printErrorConsole("WARNING: Rendering the model '{}' failed, it is not imported:\n{}".format(call, lib.txt_prefix_each_line(output, "    ")), 0)
+
     lib.printConsole("PROGRESS: Creating modules...", 1)
-    fileValues['modules'] = []
-    for moduleName, moduleParts in modules.items():
-        fileValues['modules'].append(lib.createModuleString(moduleName, moduleParts, configuration, args.show_groundplate))
+    moduleStrings = dict()
+    with memory.stage("module strings"):
+        for moduleName, moduleParts in modules.items():
+            moduleStrings[moduleName] = lib.createModuleString(moduleName, moduleParts, configuration, args.show_groundplate, args.multmatrix, args.lod, modelFiles)
+            if args.placement:
+                import fzz2scadGeometry
+                moduleStrings[moduleName] = moduleStrings[moduleName] + "\n" + fzz2scadGeometry.createPlacementString(moduleName, moduleParts, configuration)
+            lib.checkMemory()
+
+    # render modules and exit
+    if args.render is not None:
+        import fzz2scadRender
+        lib.printConsole("PROGRESS: Rendering modules...", 1)
+        with memory.stage("render"):
+            results = fzz2scadRender.renderModules(moduleStrings, exportString, args.include, args.render, args.openscad, args.jobs, args.cache)
+        failed = False
+        for moduleName, status, stlFile, output in results:
+            lib.printConsole("{}: {} {}".format(moduleName, status, stlFile if stlFile is not None else ""), 0)
+            if status == "failed":
+                failed = True
+                lib.printErrorConsole("ERROR: Rendering the module '{}' failed:\n{}".format(moduleName, lib.txt_prefix_each_line(output, "    ")), 0)
+        exit(1 if failed else 0)
+
+    # write each module and the export to its own file, the output includes them
+    if args.split:
+        if "export" in moduleStrings:
+            lib.printErrorConsole("ERROR: The module 'export' would be written to the file of the export variables '{}'. Rename the module to use --split.".format(lib.infixFileName(outputFileName, "export")), 0)
+            exit(1)
+        with memory.stage("output"):
+            files = [(lib.infixFileName(outputFileName, "export"), exportString)]
+            for moduleName, moduleString in sorted(moduleStrings.items()):
+                files.append((lib.infixFileName(outputFileName, moduleName), moduleString))
+            # files of modules that are gone are left alone, they might be someone else's
+            import glob
+            for fileName in sorted(glob.glob(lib.infixFileName(glob.escape(outputFileName), "*"))):
+                if os.path.normpath(fileName) not in [os.path.normpath(f) for f, content in files]:
+                    lib.printErrorConsole("WARNING: '{}' is not included by '{}' any more. Remove it if it is the file of an old module.".format(fileName, outputFileName), 0)
+            includes = list()
+            for fileName, content in files:
+                fileComment = fileCommentTemplate.format(filename=fileName, version=lib.VERSION)
+                fileComment = "/**\n" + lib.txt_prefix_each_line(fileComment, " * ") + "\n */"
+                lib.outputHelper("{}\n{}\n".format(fileComment, content), fileName)
+                includes.append("include <{}>".format(os.path.basename(fileName)))
+
+            fileValues['fileComment'] = fileCommentTemplate.format(**fileValues)
+            fileValues['fileComment'] = "/**\n" + lib.txt_prefix_each_line(fileValues['fileComment'], " * ") + "\n */"
+            lib.outputHelper("{}\n{}\n".format(fileValues['fileComment'], "\n".join(includes)), outputFileName)
+        exit(0)
 
-    fileValues['modules'] = sorted(fileValues['modules'])
-    fileValues['modules'] = "\n\n\n".join(fileValues['modules'])
+    with memory.stage("output"):
+        fileValues['modules'] = sorted(moduleStrings.values())
+        fileValues['modules'] = "\n\n\n".join(fileValues['modules'])
 
-    fileValues['export'] = exportString
+        fileValues['export'] = exportString
 
-    # The complete file as a string
-    fileValues['fileComment'] = fileCommentTemplate.format(**fileValues)
-    fileValues['fileComment'] = "/**\n" + lib.txt_prefix_each_line(fileValues['fileComment'], " * ") + "\n */"
+        # The complete file as a string
+        fileValues['fileComment'] = fileCommentTemplate.format(**fileValues)
+        fileValues['fileComment'] = "/**\n" + lib.txt_prefix_each_line(fileValues['fileComment'], " * ") + "\n */"
 
-    outString = fileTemplate.format(**fileValues)
+        outString = fileTemplate.format(**fileValues)
 
-    lib.outputHelper(outString, outputFileName)
+        lib.outputHelper(outString, outputFileName)
     exit(0)
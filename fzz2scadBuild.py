@@ -0,0 +1,272 @@
+'''
+    fzz2scadBuild.py from fzz2scad: Builds the outputs of a project of
+    several Fritzing Sketches. Only outputs whose inputs changed are
+    created again.
+
+    Copyright (C) 2015  Hauke Thorenz <htho@thorenz.net>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+    The manifest (fzz2scad_project.json) lists the targets:
+        {"targets": {"NAME": {
+            "sketch": "SKETCH.fzz",
+            "moduleName": "PREFIX",             (default: derived from the sketch)
+            "output": "OUT.scad",               (default: 'SKETCH.fzz' becomes 'SKETCH.scad')
+            "args": ["--multmatrix"],           (more arguments for fzz2scad.py)
+            "mappings": ["MAPPING.json"],       (inputs the output depends on)
+            "includes": ["LIBRARY.scad"],       (inputs, given to --render as --include)
+            "after": ["OTHER_TARGET"]           (targets that are built before)
+        }}}
+    Paths are relative to the manifest. A target is also built after the
+    targets whose output is one of its mappings or includes.
+    The content hashes of the last build are kept in .fzz2scad_build.json
+    next to the manifest.
+'''
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import fzz2scadLib as lib
+
+VERSION = 0.1
+
+MANIFEST_FILE = "fzz2scad_project.json"
+STATE_FILE = ".fzz2scad_build.json"
+
+FZZ2SCAD = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fzz2scad.py")
+
+
+class BuildError(Exception):
+    pass
+
+
+def sketchHash(fzzFileName):
+    """The hash of the content of a sketch. Only the names and CRCs of the
+    files in the archive are used, so saving the sketch again without a
+    change (which changes the timestamps in the archive) does not count.
+    return the hash or None if the file does not exist"""
+    import zipfile
+    if not os.path.isfile(fzzFileName):
+        return None
+    with zipfile.ZipFile(fzzFileName, 'r') as zf:
+        members = sorted([(info.filename, info.CRC, info.file_size) for info in zf.infolist()])
+    return hashlib.sha256(json.dumps(members).encode("utf-8")).hexdigest()
+
+
+def loadManifest(manifestFileName):
+    """Load the manifest and fill in the defaults.
+    return dict(name: target) with all paths relative to the directory of the manifest"""
+    with open(manifestFileName, 'r') as f:
+        manifest = json.load(f)
+    ret = dict()
+    for name, target in manifest.get("targets", dict()).items():
+        if "sketch" not in target:
+            raise BuildError("The target '{}' has no 'sketch'.".format(name))
+        target = dict(target)
+        target.setdefault("output", os.path.basename(target["sketch"]).rsplit(".", 1)[0] + ".scad")
+        for key in ("args", "mappings", "includes", "after"):
+            target.setdefault(key, list())
+        ret[name] = target
+    return ret
+
+
+def getBuildOrder(targets):
+    """Sort the targets so that each one comes after the targets it
+    depends on ('after' or an output that is one of its inputs).
+    return (list of names, dict(name: set of names it depends on))"""
+    outputs = {os.path.normpath(target["output"]): name for name, target in targets.items()}
+    dependencies = dict()
+    for name, target in targets.items():
+        dependencies[name] = set(target["after"])
+        for inputFile in target["mappings"] + target["includes"]:
+            if os.path.normpath(inputFile) in outputs:
+                dependencies[name].add(outputs[os.path.normpath(inputFile)])
+        for dependency in dependencies[name]:
+            if dependency not in targets:
+                raise BuildError("The target '{}' depends on the unknown target '{}'.".format(name, dependency))
+
+    ret = list()
+    state = dict()  # name: "visiting" or "done"
+
+    def visit(name, path):
+        if state.get(name) == "done":
+            return
+        if state.get(name) == "visiting":
+            raise BuildError("The targets depend on each other: {}".format(" -> ".join(path + [name])))
+        state[name] = "visiting"
+        for dependency in sorted(dependencies[name]):
+            visit(dependency, path + [name])
+        state[name] = "done"
+        ret.append(name)
+
+    for name in sorted(targets.keys()):
+        visit(name, list())
+    return ret, dependencies
+
+
+def targetCommand(target):
+    command = [sys.executable, FZZ2SCAD, target["sketch"], "-o", target["output"], "--override"]
+    if target.get("moduleName") is not None:
+        command = command + ["-m", target["moduleName"]]
+    for include in target["includes"]:
+        command = command + ["--include", include]
+    return command + list(target["args"])
+
+
+def targetSignature(projectDir, target):
+    """The hash of everything the output of a target depends on: the
+    sketch (including its configuration note), the mappings, the
+    includes, the command and the version of fzz2scad.
+    return (signature, dict(input: hash))"""
+    inputs = dict()
+    inputs[target["sketch"]] = sketchHash(os.path.join(projectDir, target["sketch"]))
+    for inputFile in target["mappings"] + target["includes"]:
+        inputs[inputFile] = lib.fileHash(os.path.join(projectDir, inputFile))
+    data = {"version": lib.VERSION, "command": targetCommand(target)[2:], "inputs": inputs}
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode("utf-8")).hexdigest(), inputs
+
+
+def staleReason(projectDir, target, record):
+    """Why the output of the target has to be built again.
+    return a string or None if it is up to date"""
+    signature, inputs = targetSignature(projectDir, target)
+    missing = [inputFile for inputFile, inputHash in inputs.items() if inputHash is None]
+    if missing:
+        return "missing input {}".format(", ".join(missing))
+    if record is None:
+        return "never built"
+    if lib.fileHash(os.path.join(projectDir, target["output"])) != record.get("output"):
+        return "output changed or missing"
+    if signature != record.get("signature"):
+        changed = sorted([inputFile for inputFile, inputHash in inputs.items() if record.get("inputs", dict()).get(inputFile) != inputHash])
+        return "changed {}".format(", ".join(changed)) if changed else "changed command"
+    return None
+
+
+def runTarget(projectDir, name, target):
+    """Build the output of the target with fzz2scad.py.
+    return (name, returncode, output)"""
+    outputDir = os.path.dirname(os.path.join(projectDir, target["output"]))
+    os.makedirs(outputDir, exist_ok=True)
+    completed = subprocess.run(targetCommand(target), cwd=projectDir, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL)
+    return name, completed.returncode, completed.stdout.decode("utf-8", "replace")
+
+
+def loadState(projectDir):
+    try:
+        with open(os.path.join(projectDir, STATE_FILE), 'r') as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return dict()
+
+
+def build(manifestFileName, names=None, jobs=None, force=False, dryRun=False):
+    """Build the stale targets (names and the targets they depend on, or
+    all) in dependency order. Targets that don't depend on each other are
+    built in parallel by jobs (default: number of CPUs) processes.
+    return dict(name: 'built', 'up to date', 'stale' (dry run), 'failed'
+    or 'skipped')"""
+    import concurrent.futures
+    projectDir = os.path.dirname(os.path.abspath(manifestFileName))
+    targets = loadManifest(manifestFileName)
+    order, dependencies = getBuildOrder(targets)
+
+    if names:
+        wanted = set()
+
+        def want(name):
+            if name not in targets:
+                raise BuildError("There is no target '{}'.".format(name))
+            if name not in wanted:
+                wanted.add(name)
+                for dependency in dependencies[name]:
+                    want(dependency)
+        for name in names:
+            want(name)
+        order = [name for name in order if name in wanted]
+
+    state = loadState(projectDir)
+    results = dict()
+    pending = list(order)
+    running = dict()
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs or os.cpu_count() or 1) as executor:
+        while pending or running:
+            for name in list(pending):
+                if any([results.get(d) in ("failed", "skipped") for d in dependencies[name]]):
+                    lib.printConsole("{}: skipped (a dependency failed)", 0, name)
+                    results[name] = "skipped"
+                    pending.remove(name)
+                    continue
+                if any([d not in results for d in dependencies[name] if d in order]):
+                    continue  # wait for the dependencies
+                pending.remove(name)
+                # the inputs are only hashed now, after the outputs of the dependencies are built
+                staleDependencies = sorted([d for d in dependencies[name] if results.get(d) == "stale"])
+                if force:
+                    reason = "forced"
+                elif staleDependencies:
+                    # a dry run does not build them, so their outputs can't be compared yet
+                    reason = "dependency {} is stale".format(", ".join(staleDependencies))
+                else:
+                    reason = staleReason(projectDir, targets[name], state.get(name))
+                if reason is None:
+                    lib.printConsole("{}: up to date", 1, name)
+                    results[name] = "up to date"
+                elif dryRun:
+                    lib.printConsole("{}: stale ({})", 0, name, reason)
+                    results[name] = "stale"
+                else:
+                    lib.printConsole("{}: building ({})", 0, name, reason)
+                    running[executor.submit(runTarget, projectDir, name, targets[name])] = name
+            if not running:
+                continue
+            done, notDone = concurrent.futures.wait(running.keys(), return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                del running[future]
+                name, returncode, output = future.result()
+                if returncode != 0:
+                    results[name] = "failed"
+                    lib.printErrorConsole("ERROR: Building '{}' failed:\n{}".format(name, lib.txt_prefix_each_line(output, "    ")), 0)
+                    continue
+                results[name] = "built"
+                signature, inputs = targetSignature(projectDir, targets[name])
+                state[name] = {"signature": signature, "inputs": inputs, "output": lib.fileHash(os.path.join(projectDir, targets[name]["output"]))}
+                lib.writeFileIfChanged(os.path.join(projectDir, STATE_FILE), json.dumps(state, sort_keys=True, indent=4) + "\n")
+                lib.printConsole("{}: built {}", 0, name, targets[name]["output"])
+    return results
+
+# ####################### SCRIPT PART ########################
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Builds the outputs of the sketches of a project manifest. Only outputs whose sketch, configuration, mappings or includes changed are built again. The exit status is 1 if a target failed.")
+    parser.add_argument("TARGETS", nargs="*", help="The targets to build (and the targets they depend on). (default: all)")
+    parser.add_argument("-f", "--manifest", default=MANIFEST_FILE, help="The project manifest. (default: {})".format(MANIFEST_FILE))
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="The number of targets built in parallel. (default: number of CPUs)")
+    parser.add_argument("-B", "--always-make", action="store_true", help="Build all targets, even if they are up to date.")
+    parser.add_argument("-n", "--dry-run", action="store_true", help="Only print which targets are stale and why.")
+    parser.add_argument("-v", "--verbose", action="count", default=0, help="-v -vv- -vvv increase output verbosity")
+    parser.add_argument('-V', '--version', action='version', version="%(prog)s " + str(VERSION))
+
+    args = parser.parse_args()
+    lib.args = args
+
+    try:
+        results = build(args.manifest, args.TARGETS, args.jobs, args.always_make, args.dry_run)
+    except (BuildError, IOError, ValueError) as err:
+        lib.printErrorConsole("ERROR: {}".format(err), 0)
+        sys.exit(2)
+    sys.exit(1 if any([result in ("failed", "skipped") for result in results.values()]) else 0)
@@ -0,0 +1,269 @@
+'''
+    fzz2scadCheck.py from fzz2scad: Checks the footprints of the parts of
+    a Fritzing Sketch for overlaps and clearances without OpenSCAD.
+
+    Copyright (C) 2015  Hauke Thorenz <htho@thorenz.net>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+import argparse
+import json
+import math
+import os
+import sys
+import fzz2scadLib as lib
+
+VERSION = 0.1
+
+# The clearances (see getClearances()) and their defaults.
+DEFAULT_CLEARANCES = {"parts": "0mm", "holes": "0mm", "edges": "0mm"}
+
+# Distances below this (mm) are taken as touching, not as overlapping.
+EPSILON = 1e-6
+
+# ####################### 2D GEOMETRY ########################
+
+
+def segmentDistance(xy, a, b):
+    """The distance of the point xy to the line segment a-b."""
+    dx, dy = b[0] - a[0], b[1] - a[1]
+    length2 = dx * dx + dy * dy
+    t = 0 if length2 == 0 else max(0, min(1, ((xy[0] - a[0]) * dx + (xy[1] - a[1]) * dy) / length2))
+    return math.hypot(xy[0] - a[0] - t * dx, xy[1] - a[1] - t * dy)
+
+
+def boundaryDistance(xy, polygon):
+    """The distance of the point xy to the edges of the polygon."""
+    return min([segmentDistance(xy, polygon[i - 1], polygon[i]) for i in range(len(polygon))])
+
+
+def convexPolygonsOverlap(p, q):
+    """Check if the convex polygons p and q overlap by more than EPSILON
+    (separating axis test)."""
+    for polygon in (p, q):
+        for i in range(len(polygon)):
+            nx, ny = polygon[i][1] - polygon[i - 1][1], polygon[i - 1][0] - polygon[i][0]
+            length = math.hypot(nx, ny)
+            if length == 0:
+                continue
+            pp = [(x * nx + y * ny) / length for x, y in p]
+            qq = [(x * nx + y * ny) / length for x, y in q]
+            if min(max(pp), max(qq)) - max(min(pp), min(qq)) <= EPSILON:
+                return False
+    return True
+
+
+def polygonDistance(p, q):
+    """The distance of the convex polygons p and q, 0 if they overlap."""
+    if convexPolygonsOverlap(p, q):
+        return 0.0
+    return min(min([boundaryDistance(xy, q) for xy in p]), min([boundaryDistance(xy, p) for xy in q]))
+
+
+def pointPolygonDistance(xy, polygon):
+    """The distance of the point xy to the convex polygon, 0 if it is inside."""
+    if lib.xyInConvexPolygon(xy, polygon):
+        return 0.0
+    return boundaryDistance(xy, polygon)
+
+
+class SpatialHash:
+    """A uniform grid of boxes. Only boxes that share a cell are tested
+    against each other, so finding the close pairs of n small items is
+    about linear in n."""
+
+    def __init__(self, cellSize):
+        self.cellSize = cellSize if cellSize > 0 else 1
+        self.cells = dict()
+
+    def _cell(self, v):
+        return int(math.floor(v / self.cellSize))
+
+    def insert(self, key, box):
+        """box: (xMin, yMin, xMax, yMax)"""
+        for cx in range(self._cell(box[0]), self._cell(box[2]) + 1):
+            for cy in range(self._cell(box[1]), self._cell(box[3]) + 1):
+                self.cells.setdefault((cx, cy), list()).append(key)
+
+    def pairs(self):
+        """The pairs (a, b) of keys whose boxes share a cell, each once."""
+        seen = set()
+        for keys in self.cells.values():
+            for i in range(len(keys)):
+                for j in range(i + 1, len(keys)):
+                    pair = (keys[i], keys[j]) if keys[i] < keys[j] else (keys[j], keys[i])
+                    if pair not in seen:
+                        seen.add(pair)
+                        yield pair
+
+# ####################### CHECKS ########################
+
+
+def getClearances(configuration=dict(), overrides=dict()):
+    """The clearances (in mm) from the 'check' section of the
+    configuration, overridden by the given ones (e.g. from the command
+    line).
+    return dict('parts', 'holes', 'edges')"""
+    ret = dict(DEFAULT_CLEARANCES)
+    ret.update(configuration.get("check", dict()))
+    ret.update({key: value for key, value in overrides.items() if value is not None})
+    return {key: lib.Dimension(value).asMm() for key, value in ret.items() if key in DEFAULT_CLEARANCES}
+
+
+def getCheckItems(moduleParts):
+    """The footprints (in mm, sketch coordinates) of the parts and holes
+    and the outlines of the boards of a module.
+    return (items, boards) with items as dict(title, kind, bottom, outline, center, radius)
+    and boards as list of (title, outline)"""
+    items = list()
+    boards = list()
+    for title in sorted(moduleParts.keys()):
+        part = moduleParts[title]
+        if isinstance(part, lib.PCB):
+            boards.append((title, lib.boardOutline(part)))
+        elif isinstance(part, lib.Hole):
+            center = lib.applyMatrix(part.transformMatrix(), (0, 0, 0))[0:2]
+            items.append({"title": title, "kind": "hole", "bottom": None, "center": center, "radius": part.diameter.asMm() / 2, "outline": None})
+        else:
+            m = part.transformMatrix(False)
+            width, height = lib.Dimension.dimensionList2MmList(part.svgDimension)[0:2]
+            outline = [lib.applyMatrix(m, p)[0:2] for p in ((0, -height, 0), (width, -height, 0), (width, 0, 0), (0, 0, 0))]
+            center = (sum([p[0] for p in outline]) / 4, sum([p[1] for p in outline]) / 4)
+            items.append({"title": title, "kind": "part", "bottom": bool(part.bottom), "center": center, "radius": None, "outline": outline})
+    return items, boards
+
+
+def _itemBox(item):
+    if item["outline"] is not None:
+        xs = [p[0] for p in item["outline"]]
+        ys = [p[1] for p in item["outline"]]
+        return (min(xs), min(ys), max(xs), max(ys))
+    x, y = item["center"]
+    r = item["radius"]
+    return (x - r, y - r, x + r, y + r)
+
+
+def itemDistance(a, b):
+    """The distance of the footprints of two items, 0 if they overlap."""
+    if a["kind"] == "hole" and b["kind"] == "hole":
+        return max(0.0, math.hypot(a["center"][0] - b["center"][0], a["center"][1] - b["center"][1]) - a["radius"] - b["radius"])
+    if a["kind"] == "hole":
+        a, b = b, a
+    if b["kind"] == "hole":
+        return max(0.0, pointPolygonDistance(b["center"], a["outline"]) - b["radius"])
+    return polygonDistance(a["outline"], b["outline"])
+
+
+def itemsOverlap(a, b):
+    """Check if the footprints of two items overlap by more than EPSILON,
+    footprints that only touch do not overlap."""
+    if a["kind"] == "hole" and b["kind"] == "hole":
+        return math.hypot(a["center"][0] - b["center"][0], a["center"][1] - b["center"][1]) < a["radius"] + b["radius"] - EPSILON
+    if a["kind"] == "hole":
+        a, b = b, a
+    if b["kind"] == "hole":
+        return lib.xyInConvexPolygon(b["center"], a["outline"]) or boundaryDistance(b["center"], a["outline"]) < b["radius"] - EPSILON
+    return convexPolygonsOverlap(a["outline"], b["outline"])
+
+
+def checkModule(moduleName, moduleParts, clearances):
+    """Check the parts of a module for overlaps, parts and holes that are
+    closer to each other than the clearances and parts and holes that are
+    closer to the edge of their board than clearances['edges'].
+    Parts on different sides of a board are not checked against each other.
+    Footprints that only touch are a 'clearance' problem, not an 'overlap'.
+    return a list of dict(module, kind, a, b, distance, clearance)
+    kind is 'overlap', 'clearance' or 'edge' (b is the board)"""
+    items, boards = getCheckItems(moduleParts)
+    ret = list()
+
+    boxes = [_itemBox(item) for item in items]
+    margin = max(clearances["parts"], clearances["holes"])
+    extents = [max(b[2] - b[0], b[3] - b[1]) for b in boxes]
+    spatialHash = SpatialHash((sum(extents) / len(extents) if extents else 1) + margin)
+    for i, box in enumerate(boxes):
+        spatialHash.insert(i, (box[0] - margin / 2, box[1] - margin / 2, box[2] + margin / 2, box[3] + margin / 2))
+
+    for i, j in spatialHash.pairs():
+        a, b = items[i], items[j]
+        if a["kind"] == "part" and b["kind"] == "part" and a["bottom"] != b["bottom"]:
+            continue
+        clearance = clearances["holes"] if "hole" in (a["kind"], b["kind"]) else clearances["parts"]
+        if itemsOverlap(a, b):
+            ret.append({"module": moduleName, "kind": "overlap", "a": a["title"], "b": b["title"], "distance": 0.0, "clearance": clearance})
+            continue
+        distance = itemDistance(a, b)
+        # touching footprints violate any clearance, even 0
+        if distance < clearance - EPSILON or distance <= EPSILON:
+            ret.append({"module": moduleName, "kind": "clearance", "a": a["title"], "b": b["title"], "distance": distance, "clearance": clearance})
+
+    boardIndex = lib.BoardIndex(boards)
+    outlines = dict(boards)
+    for item in items:
+        boardTitle = boardIndex.find(item["center"])
+        if boardTitle is None:
+            continue  # not on a board, e.g. on the frontplate
+        board = outlines[boardTitle]
+        if item["kind"] == "hole":
+            distance = boundaryDistance(item["center"], board) - item["radius"]
+        else:
+            # negative if a corner is off the board
+            distance = min([boundaryDistance(xy, board) if lib.xyInConvexPolygon(xy, board) else -boundaryDistance(xy, board) for xy in item["outline"]])
+        if distance < clearances["edges"] - EPSILON:
+            ret.append({"module": moduleName, "kind": "edge", "a": item["title"], "b": boardTitle, "distance": distance, "clearance": clearances["edges"]})
+
+    ret.sort(key=lambda problem: (problem["module"], problem["kind"], problem["a"], problem["b"]))
+    return ret
+
+
+def problemAsString(problem):
+    if problem["kind"] == "overlap":
+        return "OVERLAP   '{a}' and '{b}' in module '{module}'".format(**problem)
+    elif problem["kind"] == "clearance":
+        return "CLEARANCE '{a}' and '{b}' in module '{module}': {distance:.3f}mm < {clearance:.3f}mm".format(**problem)
+    return "EDGE      '{a}' on '{b}' in module '{module}': {distance:.3f}mm < {clearance:.3f}mm".format(**problem)
+
+# ####################### SCRIPT PART ########################
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Checks the footprints of the parts of a Fritzing Sketch (.fzz) for overlaps and clearances. The exit status is 0 if there are no problems and 1 if there are.")
+    parser.add_argument("INPUT_FILE", help="The Fritzing Sketch File (.fzz) to check.")
+    parser.add_argument("-m", "--module-name", default=None, help="The module name (prefix). (default: derived from INPUT_FILE)")
+    parser.add_argument("--part-clearance", default=None, metavar="DIMENSION", help="The minimal distance between parts. (default: 'parts' of the 'check' configuration or 0mm)")
+    parser.add_argument("--hole-clearance", default=None, metavar="DIMENSION", help="The minimal distance between holes and anything else. (default: 'holes' of the 'check' configuration or 0mm)")
+    parser.add_argument("--edge-clearance", default=None, metavar="DIMENSION", help="The minimal distance of parts and holes to the edge of their board. (default: 'edges' of the 'check' configuration or 0mm)")
+    parser.add_argument("--json", action="store_true", help="Write the problems as JSON.")
+    parser.add_argument("-v", "--verbose", action="count", default=0, help="-v -vv- -vvv increase output verbosity")
+    parser.add_argument('-V', '--version', action='version', version="%(prog)s " + str(VERSION))
+
+    args = parser.parse_args()
+    lib.args = args
+
+    xmlRoot, configuration, parts = lib.loadSketch(args.INPUT_FILE, args.module_name)
+    clearances = getClearances(configuration, {"parts": args.part_clearance, "holes": args.hole_clearance, "edges": args.edge_clearance})
+    lib.printConsole("INFO: Clearances (mm): {}", 1, clearances)
+    modules = lib.splitPartsToModules(xmlRoot, parts, configuration['modules'])
+
+    problems = list()
+    for moduleName, moduleParts in sorted(modules.items()):
+        problems.extend(checkModule(moduleName, moduleParts, clearances))
+
+    if args.json:
+        lib.printConsole(json.dumps(problems, sort_keys=True, indent=4), 0)
+    elif problems:
+        lib.printConsole("\n".join([problemAsString(problem) for problem in problems]), 0)
+    else:
+        lib.printConsole("No problems in '{}'.", 1, os.path.basename(args.INPUT_FILE))
+
+    sys.exit(1 if problems else 0)
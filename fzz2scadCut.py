@@ -0,0 +1,127 @@
+'''
+    fzz2scadCut.py from fzz2scad: Writes the board outlines, holes and
+    cut-outs of a module as 2D cut file (DXF or SVG) for laser cutters and
+    CNC mills.
+
+    Copyright (C) 2015  Hauke Thorenz <htho@thorenz.net>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import html
+import fzz2scadLib as lib
+import fzz2scadGeometry as geometry
+
+# The formats createCutString() can write.
+FORMATS = ("dxf", "svg")
+
+# The layers (DXF) or groups (SVG) of the outlines.
+LAYER_BOARD = "BOARD"
+LAYER_HOLES = "HOLES"
+LAYER_CUTOUTS = "CUTOUTS"
+
+
+def _cutoutLayer(cutout):
+    return LAYER_HOLES if cutout["kind"] == "hole" else LAYER_CUTOUTS
+
+# ####################### DXF ########################
+
+
+def _dxfPairs(*pairs):
+    return "".join(["{}\n{}\n".format(code, value) for code, value in pairs])
+
+
+def createDxfString(footprints):
+    """Create an AutoCAD R12 DXF of the footprints (see
+    fzz2scadGeometry.getModuleFootprints()). Circles become CIRCLEs, all
+    other outlines closed POLYLINEs.
+    R12 can not store the unit of a drawing, the coordinates are in mm."""
+    ret = list()
+    ret.append(_dxfPairs((0, "SECTION"), (2, "HEADER"), (0, "ENDSEC")))
+    ret.append(_dxfPairs((0, "SECTION"), (2, "TABLES"), (0, "TABLE"), (2, "LAYER"), (70, 3)))
+    for color, layer in enumerate((LAYER_BOARD, LAYER_HOLES, LAYER_CUTOUTS), 1):
+        ret.append(_dxfPairs((0, "LAYER"), (2, layer), (70, 0), (62, color), (6, "CONTINUOUS")))
+    ret.append(_dxfPairs((0, "ENDTAB"), (0, "ENDSEC")))
+
+    ret.append(_dxfPairs((0, "SECTION"), (2, "ENTITIES")))
+    outlines = [(LAYER_BOARD, board) for board in footprints["boards"]] + [(_cutoutLayer(cutout), cutout) for cutout in footprints["cutouts"]]
+    for layer, record in outlines:
+        if record.get("shape") == "circle":
+            ret.append(_dxfPairs((0, "CIRCLE"), (8, layer), (10, record["center"][0]), (20, record["center"][1]), (30, 0.0), (40, record["diameter"] / 2)))
+        else:
+            ret.append(_dxfPairs((0, "POLYLINE"), (8, layer), (66, 1), (10, 0.0), (20, 0.0), (30, 0.0), (70, 1)))
+            for x, y in record["outline"]:
+                ret.append(_dxfPairs((0, "VERTEX"), (8, layer), (10, x), (20, y), (30, 0.0)))
+            ret.append(_dxfPairs((0, "SEQEND"), (8, layer)))
+    ret.append(_dxfPairs((0, "ENDSEC"), (0, "EOF")))
+    return "".join(ret)
+
+# ####################### SVG ########################
+
+
+def createSvgString(footprints, margin=1.0):
+    """Create an SVG (in mm) of the footprints (see
+    fzz2scadGeometry.getModuleFootprints()). Each layer is a group. The
+    outlines are stroked, not filled, as most laser cutters expect it."""
+    outlines = [board["outline"] for board in footprints["boards"]] + [cutout["outline"] for cutout in footprints["cutouts"]]
+    points = [p for outline in outlines for p in outline]
+    if not points:
+        points = [(0, 0)]
+    xMin = min([p[0] for p in points]) - margin
+    xMax = max([p[0] for p in points]) + margin
+    yMin = min([p[1] for p in points]) - margin
+    yMax = max([p[1] for p in points]) + margin
+
+    def svgPoint(p):
+        # svg has its y axis downwards
+        return "{!r},{!r}".format(p[0] - xMin, yMax - p[1])
+
+    groups = dict([(LAYER_BOARD, list()), (LAYER_HOLES, list()), (LAYER_CUTOUTS, list())])
+    for board in footprints["boards"]:
+        groups[LAYER_BOARD].append('<polygon id="{}" points="{}"/>'.format(html.escape(board["title"], True), " ".join([svgPoint(p) for p in board["outline"]])))
+    for cutout in footprints["cutouts"]:
+        if cutout["shape"] == "circle":
+            cx, cy = svgPoint(cutout["center"]).split(",")
+            groups[_cutoutLayer(cutout)].append('<circle cx="{}" cy="{}" r="{!r}"/>'.format(cx, cy, cutout["diameter"] / 2))
+        else:
+            groups[_cutoutLayer(cutout)].append('<polygon points="{}"/>'.format(" ".join([svgPoint(p) for p in cutout["outline"]])))
+
+    ret = list()
+    ret.append('<?xml version="1.0" encoding="UTF-8"?>')
+    ret.append('<svg xmlns="http://www.w3.org/2000/svg" width="{0!r}mm" height="{1!r}mm" viewBox="0 0 {0!r} {1!r}">'.format(xMax - xMin, yMax - yMin))
+    ret.append('<!-- created-with: fzz2scad v{!s} (https://github.com/htho/fzz2scad) -->'.format(lib.VERSION))
+    for layer in (LAYER_BOARD, LAYER_HOLES, LAYER_CUTOUTS):
+        ret.append('<g id="{}" fill="none" stroke="black" stroke-width="0.1">'.format(layer))
+        ret.extend(["  " + element for element in groups[layer]])
+        ret.append('</g>')
+    ret.append('</svg>')
+    return "\n".join(ret) + "\n"
+
+# ####################### CUT FILES ########################
+
+
+def createCutString(moduleName, moduleParts, configuration, cutoutTable=dict(), fileFormat="dxf", fn=geometry.DEFAULT_FN):
+    """Create the cut file (fileFormat: 'dxf' or 'svg') of a module. The
+    'center' of the module is honoured like in createModuleString().
+    return the content of the file or None if there is nothing to cut."""
+    footprints = geometry.getModuleFootprints(moduleName, moduleParts, configuration, cutoutTable, None, fn)
+    if not footprints["boards"] and not footprints["cutouts"]:
+        lib.printConsole("WARNING: There is nothing to cut in the module '{}'.", 1, moduleName)
+        return None
+    lib.printConsole("INFO: Module '{}': {} boards, {} holes and cut-outs.", 2, moduleName, len(footprints["boards"]), len(footprints["cutouts"]))
+    if fileFormat == "dxf":
+        return createDxfString(footprints)
+    elif fileFormat == "svg":
+        return createSvgString(footprints)
+    raise ValueError("The format '{}' is not known! Use one of {}.".format(fileFormat, FORMATS))
@@ -0,0 +1,280 @@
+'''
+    fzz2scadGeometry.py from fzz2scad: Resolves the 2D footprints (board
+    outlines, holes and cut-outs) and the bounding boxes of the parts in a
+    module.
+
+    Copyright (C) 2015  Hauke Thorenz <htho@thorenz.net>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import json
+import math
+import fzz2scadLib as lib
+
+# The number of segments used to approximate a circle.
+DEFAULT_FN = 32
+
+# ####################### CUT-OUT TABLE ########################
+
+
+def loadCutoutTable(fileName):
+    """Load a cut-out table (see CUTOUTS.md) from the given json file.
+    return dict(moduleIdRef: [cutout, ...])"""
+    if fileName is None:
+        return dict()
+    with open(fileName, 'r') as f:
+        jsonData = json.load(f)
+
+    ret = dict()
+    for moduleIdRef, cutouts in jsonData.get("cutouts", dict()).items():
+        if isinstance(cutouts, dict):
+            cutouts = [cutouts]
+        for cutout in cutouts:
+            shape = cutout.get("shape", "circle")
+            if shape == "circle":
+                if "diameter" not in cutout:
+                    raise ValueError("The circle cut-out for '{}' needs a 'diameter'.".format(moduleIdRef))
+            elif shape == "rect":
+                if "width" not in cutout or "height" not in cutout:
+                    raise ValueError("The rect cut-out for '{}' needs a 'width' and a 'height'.".format(moduleIdRef))
+            else:
+                raise ValueError("The shape '{}' of the cut-out for '{}' is not known!".format(shape, moduleIdRef))
+        ret[moduleIdRef] = cutouts
+    return ret
+
+# ####################### 2D HELPERS ########################
+
+
+def circlePolygon(center, diameter, fn=DEFAULT_FN):
+    """Approximate a circle with a counter clockwise polygon of fn points.
+    The polygon is the same as OpenSCADs circle(d=diameter, $fn=fn)."""
+    r = diameter / 2
+    return [(center[0] + r * math.cos(2 * math.pi * i / fn), center[1] + r * math.sin(2 * math.pi * i / fn)) for i in range(fn)]
+
+
+def rectPolygon(center, width, height, angle=0):
+    """A counter clockwise rectangle around center, rotated by angle (degrees)."""
+    s, c = math.sin(math.radians(angle)), math.cos(math.radians(angle))
+    ret = list()
+    for x, y in ((-width / 2, -height / 2), (width / 2, -height / 2), (width / 2, height / 2), (-width / 2, height / 2)):
+        ret.append((center[0] + c * x - s * y, center[1] + s * x + c * y))
+    return ret
+
+
+def polygonArea(polygon):
+    """The signed area of the polygon (positive if counter clockwise)."""
+    ret = 0
+    for i in range(len(polygon)):
+        x1, y1 = polygon[i - 1]
+        x2, y2 = polygon[i]
+        ret = ret + (x1 * y2 - x2 * y1)
+    return ret / 2
+
+
+def pointInPolygon(xy, polygon):
+    """Even-odd test if the point xy is inside the polygon."""
+    ret = False
+    for i in range(len(polygon)):
+        x1, y1 = polygon[i - 1]
+        x2, y2 = polygon[i]
+        if (y1 > xy[1]) != (y2 > xy[1]):
+            if xy[0] < x1 + (xy[1] - y1) * (x2 - x1) / (y2 - y1):
+                ret = not ret
+    return ret
+
+
+
+def _segmentsIntersect(a, b, c, d):
+    """Check if the segments ab and cd cross or touch."""
+    def orientation(p, q, r):
+        v = (q[0] - p[0]) * (r[1] - p[1]) - (q[1] - p[1]) * (r[0] - p[0])
+        return (v > 0) - (v < 0)
+
+    def onSegment(p, q, r):
+        return min(p[0], q[0]) <= r[0] <= max(p[0], q[0]) and min(p[1], q[1]) <= r[1] <= max(p[1], q[1])
+
+    o1, o2, o3, o4 = orientation(a, b, c), orientation(a, b, d), orientation(c, d, a), orientation(c, d, b)
+    if o1 != o2 and o3 != o4:
+        return True
+    return (o1 == 0 and onSegment(a, b, c)) or (o2 == 0 and onSegment(a, b, d)) or (o3 == 0 and onSegment(c, d, a)) or (o4 == 0 and onSegment(c, d, b))
+
+
+def polygonsCross(p, q):
+    """Check if the outlines of the polygons p and q cross or touch."""
+    if max(x for x, y in p) < min(x for x, y in q) or max(x for x, y in q) < min(x for x, y in p):
+        return False
+    if max(y for x, y in p) < min(y for x, y in q) or max(y for x, y in q) < min(y for x, y in p):
+        return False
+    for i in range(len(p)):
+        for j in range(len(q)):
+            if _segmentsIntersect(p[i - 1], p[i], q[j - 1], q[j]):
+                return True
+    return False
+
+
+def polygonsOverlap(p, q):
+    """Check if the outlines of the polygons p and q cross or touch or one
+    is inside the other."""
+    return polygonsCross(p, q) or pointInPolygon(p[0], q) or pointInPolygon(q[0], p)
+
+# ####################### FOOTPRINTS ########################
+
+
+def _rotationZ(matrix):
+    """The rotation around the z axis (degrees) of the given 4x4 matrix."""
+    return math.degrees(math.atan2(matrix[1][0], matrix[0][0]))
+
+
+def getModuleFootprints(moduleName, moduleParts, configuration, cutoutTable=dict(), thickness=None, fn=DEFAULT_FN):
+    """Resolve the 2D geometry (in mm) of a module as it is placed by
+    createModuleString().
+    thickness overrides the 'pcbHeight' of the boards.
+    return dict(
+        'boards': [dict('title', 'outline', 'z', 'thickness')],
+        'cutouts': [dict('title', 'moduleIdRef', 'kind', 'shape', 'center', 'diameter', 'outline', 'depth')]
+    )
+    kind is 'hole' or 'cutout', shape is 'circle' or 'rect'. diameter is
+    only set for circles. depth is None for cut-outs through the board."""
+    translate = lib.getModuleTranslation(moduleName, moduleParts, configuration)
+    moduleMatrix = lib.translationMatrix(translate)
+
+    ret = dict({"boards": list(), "cutouts": list()})
+
+    for title in sorted(moduleParts.keys()):
+        part = moduleParts[title]
+        m = lib.matrixMultiply(moduleMatrix, part.transformMatrix())
+        if isinstance(part, lib.PCB):
+            width = part.dimensions[0].asMm()
+            depth = part.dimensions[1].asMm()
+            outline = [lib.applyMatrix(m, p)[0:2] for p in ((0, -depth, 0), (width, -depth, 0), (width, 0, 0), (0, 0, 0))]
+            if polygonArea(outline) < 0:
+                outline.reverse()
+            ret["boards"].append({
+                "title": title,
+                "outline": outline,
+                "z": lib.applyMatrix(m, (0, 0, 0))[2],
+                "thickness": part.dimensions[2].asMm() if thickness is None else thickness
+            })
+        elif isinstance(part, lib.Hole):
+            center = lib.applyMatrix(m, (0, 0, 0))[0:2]
+            diameter = part.diameter.asMm()
+            ret["cutouts"].append({
+                "title": title,
+                "moduleIdRef": part.moduleIdRef,
+                "kind": "hole",
+                "shape": "circle",
+                "center": center,
+                "diameter": diameter,
+                "outline": circlePolygon(center, diameter, fn),
+                "depth": lib.Dimension(part.parameters["drillDepth"]).asMm()
+            })
+        elif part.moduleIdRef in cutoutTable:
+            angle = _rotationZ(m)
+            for cutout in cutoutTable[part.moduleIdRef]:
+                offset = [lib.Dimension(v).asMm() for v in cutout.get("offset", ["0mm", "0mm"])]
+                center = lib.applyMatrix(m, (offset[0], offset[1], 0))[0:2]
+                record = {
+                    "title": title,
+                    "moduleIdRef": part.moduleIdRef,
+                    "kind": "cutout",
+                    "shape": cutout.get("shape", "circle"),
+                    "center": center,
+                    "depth": lib.Dimension(cutout["depth"]).asMm() if "depth" in cutout else None
+                }
+                if record["shape"] == "circle":
+                    record["diameter"] = lib.Dimension(cutout["diameter"]).asMm()
+                    record["outline"] = circlePolygon(center, record["diameter"], fn)
+                else:
+                    record["outline"] = rectPolygon(center, lib.Dimension(cutout["width"]).asMm(), lib.Dimension(cutout["height"]).asMm(), angle + cutout.get("rotation", 0))
+                ret["cutouts"].append(record)
+        else:
+            lib.printConsole("INFO: There is no cut-out for '{}' ({}).", 3, title, part.moduleIdRef)
+    return ret
+
+# ####################### BOUNDING BOXES ########################
+
+
+def _localBox(part):
+    """The box (min, max) of the geometry of a part in its own
+    coordinates and the matrix that places it. Parts are their flat
+    footprint, holes the box of the drill and PCBs the board."""
+    if isinstance(part, lib.PCB):
+        width, depth, height = lib.Dimension.dimensionList2MmList(part.dimensions)
+        return ((0, -depth, -height), (width, 0, 0)), part.transformMatrix()
+    elif isinstance(part, lib.Hole):
+        radius = part.diameter.asMm() / 2
+        halfDepth = lib.Dimension(part.parameters["drillDepth"]).asMm() / 2
+        return ((-radius, -radius, -halfDepth), (radius, radius, halfDepth)), part.transformMatrix()
+    width, height = lib.Dimension.dimensionList2MmList(part.svgDimension)[0:2]
+    return ((0, -height, 0), (width, 0, 0)), part.transformMatrix(False)
+
+
+def boxUnion(boxes):
+    """The box (min, max) around all boxes or None if there are none."""
+    boxes = list(boxes)
+    if not boxes:
+        return None
+    return (tuple(min([b[0][i] for b in boxes]) for i in range(3)), tuple(max([b[1][i] for b in boxes]) for i in range(3)))
+
+
+def getModuleBoundingBoxes(moduleName, moduleParts, configuration):
+    """Resolve the axis aligned bounding box (in mm) of each part of a
+    module as it is placed by createModuleString().
+    return dict(title: (min, max)) with min and max as (x, y, z)"""
+    moduleMatrix = lib.translationMatrix(lib.getModuleTranslation(moduleName, moduleParts, configuration))
+    ret = dict()
+    for title, part in moduleParts.items():
+        (lo, hi), m = _localBox(part)
+        m = lib.matrixMultiply(moduleMatrix, m)
+        corners = [lib.applyMatrix(m, (x, y, z)) for x in (lo[0], hi[0]) for y in (lo[1], hi[1]) for z in (lo[2], hi[2])]
+        ret[title] = boxUnion([(c, c) for c in corners])
+    return ret
+
+
+def _scadString(string):
+    return '"' + string.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def _scadVector(values, precision):
+    return "[" + ", ".join([repr(lib.roundedFloat(v, precision)) for v in values]) + "]"
+
+
+def createPlacementString(moduleName, moduleParts, configuration, precision=6):
+    """Create the placement table and the bounding boxes of a module as
+    OpenSCAD variables MODULE_placement and MODULE_bbox, so enclosures can
+    use the sizes without rendering the module. Lengths are in mm,
+    rounded to precision digits."""
+    moduleMatrix = lib.translationMatrix(lib.getModuleTranslation(moduleName, moduleParts, configuration))
+    boxes = getModuleBoundingBoxes(moduleName, moduleParts, configuration)
+
+    rows = list()
+    for title in sorted(moduleParts.keys()):
+        part = moduleParts[title]
+        # where the origin of the model of the part ends up
+        origin = lib.applyMatrix(lib.matrixMultiply(moduleMatrix, part.transformMatrix()), (0, 0, 0))
+        rows.append("  [{}, {}, {}, {}, {}, {}, [{}, {}]]".format(
+            _scadString(title), _scadString(type(part).__name__), _scadString(part.moduleIdRef),
+            _scadVector(origin, precision), _scadVector(part.export("rotation"), precision),
+            "true" if getattr(part, "bottom", False) else "false",
+            _scadVector(boxes[title][0], precision), _scadVector(boxes[title][1], precision)))
+
+    ret = list()
+    ret.append("// The parts of '{}' as placed in the module (mm):".format(moduleName))
+    ret.append("// [title, kind, moduleIdRef, origin, rotation, bottom, [bboxMin, bboxMax]]")
+    ret.append("{}_placement = [\n{}\n];".format(moduleName, ",\n".join(rows)) if rows else "{}_placement = [];".format(moduleName))
+    moduleBox = boxUnion(boxes.values())
+    ret.append("// The bounding box [min, max] of all parts of '{}' (mm).".format(moduleName))
+    ret.append("{}_bbox = {};".format(moduleName, "[{}, {}]".format(_scadVector(moduleBox[0], precision), _scadVector(moduleBox[1], precision)) if moduleBox is not None else "undef"))
+    return "\n".join(ret) + "\n"
@@ -0,0 +1,223 @@
+'''
+    fzz2scadGltf.py from fzz2scad: Writes the parts of a Fritzing Sketch as
+    glTF scene (.glb or .gltf) for quick placement previews in any viewer.
+
+    Copyright (C) 2015  Hauke Thorenz <htho@thorenz.net>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+    Each distinct module_name becomes one mesh, each part a node that
+    uses it. Viewers draw the nodes of a mesh as instances, so even boards
+    with thousands of parts show up at once.
+'''
+
+import json
+import os
+import struct
+import fzz2scadLib as lib
+import fzz2scadGeometry as geometry
+import fzz2scadStl as stl
+
+# glTF constants
+_FLOAT = 5126
+_UNSIGNED_INT = 5125
+_ARRAY_BUFFER = 34962
+_ELEMENT_ARRAY_BUFFER = 34963
+
+# The base colors (RGBA) of the placeholders.
+COLORS = {"PCB": [0.1, 0.45, 0.2, 1.0], "Part": [0.7, 0.7, 0.7, 1.0], "Hole": [0.6, 0.1, 0.1, 1.0]}
+
+# fzz2scad works in mm with z up, glTF in m with y up.
+ROOT_MATRIX = [
+    [0.001, 0, 0, 0],
+    [0, 0, 0.001, 0],
+    [0, -0.001, 0, 0],
+    [0, 0, 0, 1]
+]
+
+
+def loadMeshTable(fileName):
+    """Load the table of meshes (dict(module_name: STL file)) for the
+    parts. Relative paths are relative to the table. The meshes are in the
+    coordinates of the OpenSCAD module of the part.
+    return dict(module_name: stl.Mesh)"""
+    if fileName is None:
+        return dict()
+    with open(fileName, 'r') as f:
+        table = json.load(f)
+    directory = os.path.dirname(os.path.abspath(fileName))
+    ret = dict()
+    for moduleName, stlFileName in table.items():
+        ret[moduleName] = stl.readStl(os.path.join(directory, stlFileName))
+        lib.printConsole("INFO: Mesh of '{}': {} triangles from '{}'.", 2, moduleName, len(ret[moduleName].triangles), stlFileName)
+    return ret
+
+
+def unitBox():
+    """The box from [0, 0, 0] to [1, 1, 1]."""
+    return stl.extrudeWithHoles([(0, 0), (1, 0), (1, 1), (0, 1)], [], 0, 1)
+
+
+def unitCylinder(fn=16):
+    """The cylinder(d=1, h=1, center=true)."""
+    return stl.extrudeWithHoles(geometry.circlePolygon((0, 0), 1, fn), [], -0.5, 1)
+
+
+def _placeholderMatrix(part, height):
+    """The matrix that places the unit mesh (see unitBox() and
+    unitCylinder()) as placeholder of the part."""
+    if isinstance(part, lib.PCB):
+        width, depth, thickness = lib.Dimension.dimensionList2MmList(part.dimensions)
+        m = lib.matrixMultiply(part.transformMatrix(), lib.translationMatrix((0, -depth, -thickness)))
+        return lib.matrixMultiply(m, _scaleMatrix((width, depth, thickness)))
+    elif isinstance(part, lib.Hole):
+        diameter = part.diameter.asMm()
+        return lib.matrixMultiply(part.transformMatrix(), _scaleMatrix((diameter, diameter, lib.Dimension(part.parameters["drillDepth"]).asMm())))
+    width, depth = lib.Dimension.dimensionList2MmList(part.svgDimension)[0:2]
+    m = lib.matrixMultiply(part.transformMatrix(False), lib.translationMatrix((0, -depth, 0)))
+    return lib.matrixMultiply(m, _scaleMatrix((width, depth, height)))
+
+
+def _scaleMatrix(s):
+    return [[s[0], 0, 0, 0], [0, s[1], 0, 0], [0, 0, s[2], 0], [0, 0, 0, 1]]
+
+
+def _columnMajor(m):
+    return [lib.roundedFloat(m[r][c], 12) for c in range(4) for r in range(4)]
+
+
+class _Buffer:
+    """Collects the binary data of the meshes."""
+
+    def __init__(self):
+        self.chunks = list()
+        self.length = 0
+        self.bufferViews = list()
+        self.accessors = list()
+
+    def _add(self, data, target):
+        padding = (4 - self.length % 4) % 4
+        self.chunks.append(b"\0" * padding)
+        self.length = self.length + padding
+        self.bufferViews.append({"buffer": 0, "byteOffset": self.length, "byteLength": len(data), "target": target})
+        self.chunks.append(data)
+        self.length = self.length + len(data)
+        return len(self.bufferViews) - 1
+
+    def addMesh(self, mesh):
+        """return the accessors (positions, indices) of the mesh"""
+        positions = [v for vertex in mesh.vertices for v in vertex]
+        indices = [i for triangle in mesh.triangles for i in triangle]
+        lo, hi = mesh.bounds()
+        self.accessors.append({"bufferView": self._add(struct.pack("<{}f".format(len(positions)), *positions), _ARRAY_BUFFER),
+                               "componentType": _FLOAT, "count": len(mesh.vertices), "type": "VEC3", "min": list(lo), "max": list(hi)})
+        self.accessors.append({"bufferView": self._add(struct.pack("<{}I".format(len(indices)), *indices), _ELEMENT_ARRAY_BUFFER),
+                               "componentType": _UNSIGNED_INT, "count": len(indices), "type": "SCALAR"})
+        return len(self.accessors) - 2, len(self.accessors) - 1
+
+    def data(self):
+        return b"".join(self.chunks)
+
+
+def createGltf(modules, configuration, meshTable=dict(), height=lib.LOD_HEIGHT, fn=16):
+    """Create the glTF scene of the modules: one node per module (with
+    the translation of its 'center' and 'z') and one node per part with
+    the transformation createModuleString() gives it. The parts of a
+    module_name share one mesh: the mesh of meshTable (see
+    loadMeshTable()) or a placeholder - the footprint (height high) of
+    parts, the drill of holes and the board of PCBs.
+    return (gltf, binary data)"""
+    buffer = _Buffer()
+    gltf = {
+        "asset": {"version": "2.0", "generator": "fzz2scad v{} (https://github.com/htho/fzz2scad)".format(lib.VERSION)},
+        "scene": 0,
+        "scenes": [{"nodes": [0]}],
+        "nodes": [{"name": "fzz2scad", "matrix": _columnMajor(ROOT_MATRIX), "children": list()}],
+        "meshes": list(),
+        "materials": list()
+    }
+    materials = dict()
+    meshes = dict()
+
+    def meshIndex(part):
+        key = part.module_name
+        if key not in meshes:
+            kind = type(part).__name__
+            if key in meshTable:
+                mesh = meshTable[key]
+            elif isinstance(part, lib.Hole):
+                mesh = unitCylinder(fn)
+            else:
+                mesh = unitBox()
+            if kind not in materials:
+                materials[kind] = len(gltf["materials"])
+                gltf["materials"].append({"name": kind, "pbrMetallicRoughness": {"baseColorFactor": COLORS[kind], "metallicFactor": 0.0}, "doubleSided": True})
+            positions, indices = buffer.addMesh(mesh)
+            meshes[key] = len(gltf["meshes"])
+            gltf["meshes"].append({"name": key, "primitives": [{"attributes": {"POSITION": positions}, "indices": indices, "material": materials[kind]}]})
+        return meshes[key]
+
+    for moduleName, moduleParts in sorted(modules.items()):
+        translate = lib.getModuleTranslation(moduleName, moduleParts, configuration)
+        moduleNode = {"name": moduleName, "translation": [float(v) for v in translate], "children": list()}
+        gltf["nodes"][0]["children"].append(len(gltf["nodes"]))
+        gltf["nodes"].append(moduleNode)
+        for title in sorted(moduleParts.keys()):
+            part = moduleParts[title]
+            if part.module_name in meshTable:
+                m = part.transformMatrix()
+            else:
+                m = _placeholderMatrix(part, height)
+            moduleNode["children"].append(len(gltf["nodes"]))
+            gltf["nodes"].append({"name": title, "mesh": meshIndex(part), "matrix": _columnMajor(m), "extras": {"moduleIdRef": part.moduleIdRef}})
+        lib.printConsole("INFO: Module '{}': {} parts.", 2, moduleName, len(moduleParts))
+
+    data = buffer.data()
+    gltf["buffers"] = [{"byteLength": len(data)}]
+    gltf["bufferViews"] = buffer.bufferViews
+    gltf["accessors"] = buffer.accessors
+    if not gltf["meshes"]:
+        # glTF does not allow empty arrays
+        for key in ("meshes", "materials", "buffers", "bufferViews", "accessors"):
+            del gltf[key]
+    return gltf, data
+
+
+def asGlb(gltf, data):
+    """The binary glTF (bytes) of the scene."""
+    content = json.dumps(gltf, sort_keys=True, separators=(",", ":")).encode("utf-8")
+    content = content + b" " * ((4 - len(content) % 4) % 4)
+    chunks = struct.pack("<II", len(content), 0x4E4F534A) + content
+    if data:
+        data = data + b"\0" * ((4 - len(data) % 4) % 4)
+        chunks = chunks + struct.pack("<II", len(data), 0x004E4942) + data
+    return struct.pack("<III", 0x46546C67, 2, 12 + len(chunks)) + chunks
+
+
+def asGltf(gltf, data):
+    """The JSON glTF (str) of the scene, the binary data is embedded."""
+    import base64
+    if data:
+        gltf = dict(gltf)
+        gltf["buffers"] = [{"byteLength": len(data), "uri": "data:application/octet-stream;base64," + base64.b64encode(data).decode("ascii")}]
+    return json.dumps(gltf, sort_keys=True, indent=2) + "\n"
+
+
+def createGltfFile(fileName, modules, configuration, meshTable=dict(), height=lib.LOD_HEIGHT, fn=16):
+    """Write the scene (see createGltf()) as .glb or, if fileName ends
+    with .gltf, as .gltf (see lib.writeFileIfChanged())."""
+    gltf, data = createGltf(modules, configuration, meshTable, height, fn)
+    if fileName.endswith(".gltf"):
+        return lib.writeFileIfChanged(fileName, asGltf(gltf, data))
+    return lib.writeFileIfChanged(fileName, asGlb(gltf, data))
@@ -18,16 +18,12 @@
 '''
 
 # import statements: We use pythons included batteries!
-import zipfile
-import xml.etree.ElementTree as ET
-import html
+# Only cheap modules are imported here. The others (zipfile, xml.etree,
+# html, json, copy, re, ...) are imported where they are used, so calls
+# like --version or --list don't pay for what they don't use.
 import os
 import math
-import re
 import sys
-import collections
-import copy
-import json
 VERSION = 0.1
 
 # This is a blacklist for modules fzz2oscad can't handle.
@@ -39,7 +35,6 @@ moduleIdRef_blacklist = frozenset([
     "generic_male_pin_header_.*",
     "generic_female_pin_header_.*"
 ])
-moduleIdRef_blacklist_pattern = frozenset([re.compile(s) for s in moduleIdRef_blacklist])
 
 # This is a whitelist for <pcbView layer="x"> that determine if a part
 # belongs to the pcbView.
@@ -47,17 +42,40 @@ pcbView_layer_whitelist = frozenset([
     "board",
     "copper0"
 ])
-pcbView_layer_whitelist_pattern = frozenset([re.compile(s) for s in pcbView_layer_whitelist])
 
 # ####################### I/O HELPER FUNCTIONS ########################
 
 
-def printConsole(message, minimumVerbosityLevel):
+def logEnabled(minimumVerbosityLevel):
+    """Check if messages of the given level are printed (see printConsole())."""
+    return args.verbose >= minimumVerbosityLevel
+
+
+def printConsole(message, minimumVerbosityLevel, *formatArgs, **fields):
     """Write the given string to the console. To be printed
-    args.verbose needs to be >= minimumVerbosityLevel."""
+    args.verbose needs to be >= minimumVerbosityLevel.
+    If formatArgs or fields are given, message is a format string that is
+    only formatted if it is printed, so expensive arguments (e.g. repr()
+    of all parts) are only rendered when needed. Even more expensive
+    messages can be guarded with logEnabled().
+    With args.log_json the messages of level 1 and above are written as
+    JSON lines (with the fields) to stderr instead."""
     global args
-    if args.verbose >= minimumVerbosityLevel:
-        print(message)
+    if args.verbose < minimumVerbosityLevel:
+        return
+    if formatArgs or fields:
+        message = message.format(*formatArgs, **fields)
+    if minimumVerbosityLevel > 0 and getattr(args, "log_json", False):
+        import json
+        import time
+        record = {"time": time.time(), "level": minimumVerbosityLevel, "message": str(message).strip()}
+        kind = str(message).split(":", 1)[0].strip()
+        if kind.isupper():
+            record["kind"] = kind
+        record.update(fields)
+        print(json.dumps(record, sort_keys=True, default=str), file=sys.stderr)
+        return
+    print(message)
 
 
 def printErrorConsole(message, minimumVerbosityLevel):
@@ -66,6 +84,8 @@ def printErrorConsole(message, minimumVerbosityLevel):
 
 def getXMLRoot(zipFile, xmlFileName):
     """get the xml root of the XML File in the given zip File."""
+    import zipfile
+    import xml.etree.ElementTree as ET
     ret = None
     with zipfile.ZipFile(zipFile, 'r') as zf:
         with zf.open(xmlFileName, 'r') as xf:
@@ -73,9 +93,24 @@ def getXMLRoot(zipFile, xmlFileName):
     return ret
 
 
+def readFileFromZip(zipFile, fileName):
+    """get the content (bytes) of the file in the given zip File."""
+    import zipfile
+    with zipfile.ZipFile(zipFile, 'r') as zf:
+        return zf.read(fileName)
+
+
+def parseXML(content):
+    """get the xml root of the given XML content (bytes)."""
+    import io
+    import xml.etree.ElementTree as ET
+    return ET.parse(io.BytesIO(content))
+
+
 def getFilesThatEndWith(zipFile, endswith):
     """get a list of the files in the given zip file which names end with
     the given string."""
+    import zipfile
     ret = list()
     with zipfile.ZipFile(zipFile, 'r') as zf:
         namelist = zf.namelist()
@@ -109,15 +144,111 @@ def determineOutFile(defaultFilenameToDeriveFrom=None, defaultExtensionInfix=Non
         return outFile
 
 
+def infixFileName(fileName, infix):
+    """Insert infix before the extension: ('foo.scad', 'bar') becomes 'foo.bar.scad'."""
+    base, extension = os.path.splitext(fileName)
+    return "{}.{}{}".format(base, infix, extension)
+
+
+def fileHash(fileName):
+    """The sha256 hash of the content of the file or None if it does not
+    exist or is not a regular file."""
+    import hashlib
+    h = hashlib.sha256()
+    if not os.path.isfile(fileName):
+        return None
+    try:
+        with open(fileName, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 16), b""):
+                h.update(chunk)
+    except FileNotFoundError:
+        return None
+    return h.hexdigest()
+
+
+def _replaceFile(fileName, write):
+    """Write the file with write(f) into a temporary file next to it,
+    which then replaces the file in one step. So nobody sees a half
+    written file."""
+    import tempfile
+    directory = os.path.dirname(os.path.abspath(fileName))
+    fd, tmpFileName = tempfile.mkstemp(prefix="." + os.path.basename(fileName) + ".", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        if os.path.exists(fileName):
+            import shutil
+            shutil.copymode(fileName, tmpFileName)
+        else:
+            # mkstemp creates the file only readable for the owner
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(tmpFileName, 0o666 & ~umask)
+        os.replace(tmpFileName, fileName)
+    except BaseException:
+        if os.path.exists(tmpFileName):
+            os.remove(tmpFileName)
+        raise
+
+
+def writeFileIfChanged(fileName, content):
+    """Write content (str or bytes) to the file, but only if it differs
+    from what is in the file. The content is written to a temporary file
+    next to it, which then replaces the file in one step. So an unchanged
+    file keeps its mtime and nobody sees a half written file.
+    return True if the file was written, False if it was unchanged."""
+    import hashlib
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    if hashlib.sha256(content).hexdigest() == fileHash(fileName):
+        printConsole("INFO: '{}' is unchanged.", 2, fileName)
+        return False
+    if os.path.exists(fileName) and not os.path.isfile(fileName):
+        # e.g. /dev/stdout or a named pipe
+        with open(fileName, 'wb') as f:
+            f.write(content)
+        return True
+    _replaceFile(fileName, lambda f: f.write(content))
+    return True
+
+
+def copyFileIfChanged(sourceFileName, fileName):
+    """Copy the file like writeFileIfChanged() writes content.
+    return True if the file was written, False if it was unchanged."""
+    if fileHash(sourceFileName) == fileHash(fileName):
+        printConsole("INFO: '{}' is unchanged.", 2, fileName)
+        return False
+
+    def copy(f):
+        import shutil
+        with open(sourceFileName, 'rb') as source:
+            shutil.copyfileobj(source, f)
+    _replaceFile(fileName, copy)
+    return True
+
+
 def outputHelper(fileContent, outFile):
+    """Write fileContent to outFile (see writeFileIfChanged()) or to the
+    console if outFile is None. If outFile exists and its content differs,
+    --override and --dont-override decide, otherwise the user is asked.
+    Without a terminal to ask, it is not overridden."""
     global args
     override = True
-    if outFile is not None and os.path.exists(outFile):
+    if outFile is not None and os.path.exists(outFile) and fileHash(outFile) is not None:
+        import hashlib
+        if hashlib.sha256(fileContent.encode("utf-8")).hexdigest() == fileHash(outFile):
+            printConsole("INFO: '{}' is unchanged.", 1, outFile)
+            return
         if args.override:
             override = True
             pass
         elif args.dont_override:
             override = False
+        elif not sys.stdin.isatty():
+            printErrorConsole("WARNING: '{}' already exists and there is no terminal to ask. Use --override to override it. Printing to console instead.".format(outFile), 0)
+            override = False
         else:
             ans = None
             while ans is None:
@@ -136,27 +267,239 @@ def outputHelper(fileContent, outFile):
     if outFile is None or override is False:
         printConsole(fileContent, 0)
     else:
-        with open(outFile, 'w') as f:
-            f.write(fileContent)
+        writeFileIfChanged(outFile, fileContent)
+
+# ####################### MEMORY ACCOUNTING ########################
+
+
+def parseByteSize(string):
+    """Parse a size like '512M', '1.5G', '100k' or '4096' (bytes)."""
+    import re
+    factors = {"": 1, "b": 1, "k": 1024, "m": 1024 ** 2, "g": 1024 ** 3}
+    match = re.fullmatch(r"\s*([0-9.]+)\s*([kmg]?)i?b?\s*", string.lower())
+    if match is None:
+        raise ValueError("Can't interpret the size '{}'! Use something like '512M' or '1G'.".format(string))
+    return int(float(match.group(1)) * factors[match.group(2)])
+
+
+def formatByteSize(size):
+    for unit in ("B", "KiB", "MiB"):
+        if abs(size) < 1024:
+            return "{:.1f} {}".format(size, unit)
+        size = size / 1024
+    return "{:.1f} GiB".format(size)
+
+
+class MemoryExceededError(MemoryError):
+    pass
+
+
+class MemoryReport:
+    """Measures the peak memory allocation (tracemalloc) of each stage of
+    the conversion. Does nothing if it is not enabled.
+
+    with memoryReport.stage("parse"):
+        ...
+
+    Long loops call checkMemory(), so --max-memory fails while a stage
+    runs, not after it.
+    """
+
+    def __init__(self, enabled=False, maxMemory=None, topSites=5):
+        self.enabled = enabled or maxMemory is not None
+        self.maxMemory = maxMemory
+        self.topSites = topSites
+        self.stages = list()  # (name, peak, peakIncrease, [(site, size), ...])
+        self.currentStage = None
+        if self.enabled:
+            import tracemalloc
+            self._tracemalloc = tracemalloc
+            tracemalloc.start()
+
+    def stage(self, name):
+        return _MemoryStage(self, name)
+
+    def check(self, peak=None):
+        """Raise MemoryExceededError if the peak of the current stage is
+        above the budget."""
+        if self.maxMemory is None:
+            return
+        if peak is None:
+            peak = self._tracemalloc.get_traced_memory()[1]
+        if peak > self.maxMemory:
+            raise MemoryExceededError("The stage '{}' needed {} which is more than the budget of {} (--max-memory).".format(self.currentStage, formatByteSize(peak), formatByteSize(self.maxMemory)))
+
+    def reportString(self):
+        ret = ["MEMORY: {:<14} {:>12} {:>12}".format("stage", "peak", "increase")]
+        for name, peak, increase, sites in self.stages:
+            ret.append("MEMORY: {:<14} {:>12} {:>12}".format(name, formatByteSize(peak), formatByteSize(increase)))
+            for site, size in sites:
+                ret.append("MEMORY:     {:>12}  {}".format(formatByteSize(size), site))
+        return "\n".join(ret)
+
+
+class _MemoryStage:
+
+    def __init__(self, report, name):
+        self.report = report
+        self.name = name
+
+    def __enter__(self):
+        if self.report.enabled:
+            tracemalloc = self.report._tracemalloc
+            self.snapshot = tracemalloc.take_snapshot() if self.report.topSites > 0 else None
+            tracemalloc.reset_peak()
+            self.start = tracemalloc.get_traced_memory()[0]
+            self.report.currentStage = self.name
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        if not self.report.enabled:
+            return False
+        tracemalloc = self.report._tracemalloc
+        peak = tracemalloc.get_traced_memory()[1]
+        sites = list()
+        if self.snapshot is not None:
+            ownFrames = tracemalloc.Filter(False, tracemalloc.__file__)
+            statistics = tracemalloc.take_snapshot().filter_traces([ownFrames]).compare_to(self.snapshot.filter_traces([ownFrames]), "lineno")
+            for statistic in statistics[:self.report.topSites]:
+                if statistic.size_diff > 0:
+                    frame = statistic.traceback[0]
+                    sites.append(("{}:{}".format(os.path.basename(frame.filename), frame.lineno), statistic.size_diff))
+        self.report.stages.append((self.name, peak, peak - self.start, sites))
+        printConsole("INFO: Memory peak of stage '{}': {}", 2, self.name, formatByteSize(peak))
+        if excType is None:
+            self.report.check(peak)
+        self.report.currentStage = None
+        return False
+
+
+# The MemoryReport of the conversion (see checkMemory()) or None.
+memoryReport = None
+
+
+def checkMemory():
+    """Fail fast if the current stage of memoryReport is above the budget
+    (--max-memory). Cheap enough to be called for each part."""
+    if memoryReport is not None and memoryReport.currentStage is not None:
+        memoryReport.check()
 
 # ####################### HELPERS #####################################
 
 
 def update(d, u):
     # from http://stackoverflow.com/a/3233356/1635906
+    import collections.abc
     for k, v in u.items():
-        if isinstance(v, collections.Mapping):
+        if isinstance(v, collections.abc.Mapping):
             r = update(d.get(k, {}), v)
             d[k] = r
         else:
             d[k] = u[k]
     return d
 
+# The compiled title expressions of the attributes (see titleAttributes()).
+_titlePatterns = dict()
+
+
+def titleAttributes(title, attributes):
+    """Merge copies of the attributes whose title expression matches the
+    title of a part. Each expression is compiled on first use.
+    return dict()"""
+    import copy
+    ret = dict()
+    for titleExpression, attribute_data in attributes.items():
+        if titleExpression not in _titlePatterns:
+            import re
+            _titlePatterns[titleExpression] = re.compile(titleExpression)
+        if _titlePatterns[titleExpression].fullmatch(title):
+            ret = update(ret, copy.deepcopy(attribute_data))
+    return ret
+
 # static dictionary with information about the different parts.
 # key: moduleIdRef
 # value: dict() (see getPrototype())
 partPrototypes = dict()
 
+# The bundled table of prototypes of Fritzing core parts (see
+# generate_prototype_table.py). It is loaded on first use.
+PROTOTYPE_TABLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fzz2scad_prototypes.json")
+PROTOTYPE_TABLE_VERSION = 1
+usePrototypeTable = True
+_prototypeTable = None
+
+# The index of local parts (fzz2scadPartsIndex.PartsIndex) for the parts
+# that are not embedded in the sketch, or None.
+partsIndex = None
+
+
+def getPrototypeTable():
+    """Get the bundled table of prototypes.
+    return dict(moduleIdRef: dict() (see getPrototype()))"""
+    global _prototypeTable
+    if _prototypeTable is None:
+        import json
+        _prototypeTable = dict()
+        try:
+            with open(PROTOTYPE_TABLE_FILE, 'r') as f:
+                jsonData = json.load(f)
+        except (IOError, ValueError) as err:
+            printConsole("WARNING: Can't read the prototype table '{}': {}", 1, PROTOTYPE_TABLE_FILE, err)
+            return _prototypeTable
+        if jsonData.get("version") != PROTOTYPE_TABLE_VERSION:
+            printConsole("WARNING: The prototype table '{}' has the version '{}' but '{}' is needed. It is ignored.", 1, PROTOTYPE_TABLE_FILE, jsonData.get("version"), PROTOTYPE_TABLE_VERSION)
+            return _prototypeTable
+        for moduleIdRef, prototype in jsonData["prototypes"].items():
+            _prototypeTable[moduleIdRef] = {key: Dimension(value) for key, value in prototype.items()}
+    return _prototypeTable
+
+
+def prototypeFromXml(fzpRoot, svgRoot):
+    """Create the prototype (see getPrototype()) of a part from its .fzp
+    and the svg of its PCB footprint."""
+    ret = dict()
+    connector0svgId = fzpRoot.find("./connectors/connector[@id='connector0']/views/pcbView/p[@layer='copper0']").attrib['svgId']
+
+    viewBoxValues = svgRoot.find(".").attrib['viewBox'].split()
+
+    viewBoxWidthOfAUnit = Dimension(svgRoot.find(".").attrib['width']) / Dimension(viewBoxValues[2])
+    viewBoxHeightOfAUnit = Dimension(svgRoot.find(".").attrib['height']) / Dimension(viewBoxValues[3])
+
+    svgConnector0Element = svgRoot.find(".//*[@id='" + connector0svgId + "']")
+
+    # width and height of the svg (important for correct rotations)
+    ret['svgWidth'] = Dimension(svgRoot.find(".").attrib['width'])
+    ret['svgHeight'] = Dimension(svgRoot.find(".").attrib['height'])
+
+    # positionInSketch of connector0 IN the svg.
+    ret['svgOffsetX'] = Dimension(svgConnector0Element.attrib['cx']) * viewBoxWidthOfAUnit
+    ret['svgOffsetY'] = Dimension(svgConnector0Element.attrib['cy']) * viewBoxHeightOfAUnit
+
+    # negating on purpose! We need to transform the coordinate system from positive y to negative y:
+    ret['svgOffsetY'] = -ret['svgOffsetY']
+    return ret
+
+
+def fzpFileNameInArchive(xmlRoot, moduleIdRef):
+    """The name of the .fzp of the part in the archive of the sketch."""
+    fzpFileNamePath = xmlRoot.find("./instances/instance[@moduleIdRef='" + moduleIdRef + "']").attrib['path']
+    return "part." + os.path.basename(fzpFileNamePath)
+
+
+def prototypesFromArchive(fzzFileName, fzpFileNames):
+    """Create the prototypes of the given parts (.fzp files in the
+    archive). This does not use any globals, so it can run in a worker
+    process (see buildPrototypes()).
+    return a list of prototypes in the order of fzpFileNames"""
+    import zipfile
+    ret = list()
+    with zipfile.ZipFile(fzzFileName, 'r') as zf:
+        for fzpFileName in fzpFileNames:
+            fzpRoot = parseXML(zf.read(fzpFileName))
+            svgFileName = (fzpRoot.find("./views/pcbView/layers").attrib['image']).replace("/", ".")
+            ret.append(prototypeFromXml(fzpRoot, parseXML(zf.read("svg." + svgFileName))))
+    return ret
+
 
 def getPrototype(moduleIdRef):
     """Get static Information about this part.
@@ -164,9 +507,12 @@ def getPrototype(moduleIdRef):
     svgWidth/Height: Size of the SVG that represents this parts PCB
     footprint. Needed for rotation.
     Offset: Position of connector0 IN the SVG
+    Core parts are taken from the bundled prototype table (unless
+    usePrototypeTable is False), all others from the sketch. Parts that
+    are not embedded in the sketch are taken from the partsIndex.
     """
     if moduleIdRef not in partPrototypes:
-        printConsole("INFO: Creating Prototype for moduleIdRef='" + moduleIdRef + "'...", 2)
+        printConsole("INFO: Creating Prototype for moduleIdRef='{moduleIdRef}'...", 2, moduleIdRef=moduleIdRef)
         partPrototypes[moduleIdRef] = dict()
 
         if moduleIdRef == "HoleModuleID":
@@ -178,36 +524,25 @@ def getPrototype(moduleIdRef):
             partPrototypes[moduleIdRef]['svgOffsetX'] = Dimension("27.7") * (Dimension("0.075in") / Dimension("75"))
             partPrototypes[moduleIdRef]['svgOffsetY'] = -(Dimension("27.7") * (Dimension("0.075in") / Dimension("75")))
 
+        elif usePrototypeTable and moduleIdRef in getPrototypeTable():
+            printConsole("      Taking the Prototype from the prototype table.", 3)
+            partPrototypes[moduleIdRef] = dict(getPrototypeTable()[moduleIdRef])
+
         else:
             global inputFzzFileName
             global xmlRoot
 
-            fzpFileNamePath = xmlRoot.find("./instances/instance[@moduleIdRef='" + moduleIdRef + "']").attrib['path']
-            fzpRoot = getXMLRoot(inputFzzFileName, "part." + os.path.basename(fzpFileNamePath))
-            connector0svgId = fzpRoot.find("./connectors/connector[@id='connector0']/views/pcbView/p[@layer='copper0']").attrib['svgId']
-
-            svgFileName = (fzpRoot.find("./views/pcbView/layers").attrib['image']).replace("/", ".")
-            svgRoot = getXMLRoot(inputFzzFileName, "svg." + svgFileName)
-
-            viewBoxValues = svgRoot.find(".").attrib['viewBox'].split()
-
-            viewBoxWidthOfAUnit = Dimension(svgRoot.find(".").attrib['width']) / Dimension(viewBoxValues[2])
-            viewBoxHeightOfAUnit = Dimension(svgRoot.find(".").attrib['height']) / Dimension(viewBoxValues[3])
+            try:
+                partPrototypes[moduleIdRef] = prototypesFromArchive(inputFzzFileName, [fzpFileNameInArchive(xmlRoot, moduleIdRef)])[0]
+            except KeyError:
+                # The part is not embedded in the sketch.
+                prototype = partsIndex.lookup(moduleIdRef) if partsIndex is not None else None
+                if prototype is None:
+                    raise
+                printConsole("      Taking the Prototype from the parts index.", 3)
+                partPrototypes[moduleIdRef] = prototype
 
-            svgConnector0Element = svgRoot.find(".//*[@id='" + connector0svgId + "']")
-
-            # width and height of the svg (important for correct rotations)
-            partPrototypes[moduleIdRef]['svgWidth'] = Dimension(svgRoot.find(".").attrib['width'])
-            partPrototypes[moduleIdRef]['svgHeight'] = Dimension(svgRoot.find(".").attrib['height'])
-
-            # positionInSketch of connector0 IN the svg.
-            partPrototypes[moduleIdRef]['svgOffsetX'] = Dimension(svgConnector0Element.attrib['cx']) * viewBoxWidthOfAUnit
-            partPrototypes[moduleIdRef]['svgOffsetY'] = Dimension(svgConnector0Element.attrib['cy']) * viewBoxHeightOfAUnit
-
-            # negating on purpose! We need to transform the coordinate system from positive y to negative y:
-            partPrototypes[moduleIdRef]['svgOffsetY'] = -partPrototypes[moduleIdRef]['svgOffsetY']
-
-        printConsole("      Prototype '" + moduleIdRef + "': " + repr(partPrototypes[moduleIdRef]), 2)
+        printConsole("      Prototype '{}': {!r}", 2, moduleIdRef, partPrototypes[moduleIdRef])
 
     return partPrototypes[moduleIdRef]
 
@@ -215,6 +550,8 @@ def getPrototype(moduleIdRef):
 
 
 def txt_from_note(noteXmlElement):
+    import html
+    import xml.etree.ElementTree as ET
     text = noteXmlElement.find("text").text
     text = html.unescape(text)
     htmlRoot = ET.fromstring(text)
@@ -256,6 +593,56 @@ def txt_prefix_each_line(string, prefix, ignorefirst=False, ignorelast=False):
     return "\n".join(ret)
 
 
+class PartFilter:
+    """Decides which instances of a sketch become parts. An instance is
+    used if the layer of its pcbView matches one of the layers patterns
+    and its moduleIdRef matches none of the exclude patterns (unless it
+    matches one of the include patterns).
+    Each set of patterns is compiled (on first use) into a single
+    pattern and the decision is remembered for each moduleIdRef and layer."""
+
+    def __init__(self, exclude=moduleIdRef_blacklist, include=frozenset(), layers=pcbView_layer_whitelist):
+        self.patterns = {"exclude": frozenset(exclude), "include": frozenset(include), "layers": frozenset(layers)}
+        self._compiled = None
+        self._moduleIdRefDecisions = dict()
+        self._layerDecisions = dict()
+
+    def _compile(self):
+        import re
+        self._compiled = dict()
+        for name, patterns in self.patterns.items():
+            if patterns:
+                self._compiled[name] = re.compile("|".join(["(?:{})".format(p) for p in sorted(patterns)]))
+            else:
+                self._compiled[name] = None
+
+    def _matches(self, name, string):
+        if self._compiled is None:
+            self._compile()
+        return self._compiled[name] is not None and self._compiled[name].fullmatch(string) is not None
+
+    def acceptsModuleIdRef(self, moduleIdRef):
+        if moduleIdRef not in self._moduleIdRefDecisions:
+            self._moduleIdRefDecisions[moduleIdRef] = self._matches("include", moduleIdRef) or not self._matches("exclude", moduleIdRef)
+        return self._moduleIdRefDecisions[moduleIdRef]
+
+    def acceptsLayer(self, layer):
+        if layer not in self._layerDecisions:
+            self._layerDecisions[layer] = self._matches("layers", layer)
+        return self._layerDecisions[layer]
+
+
+def getPartFilter(configuration=dict(), exclude=(), include=(), layers=()):
+    """Create the PartFilter from the built-in lists, the 'filter'
+    section of the configuration and the given additional patterns."""
+    filterConfig = configuration.get("filter", dict())
+    return PartFilter(
+        moduleIdRef_blacklist | frozenset(filterConfig.get("exclude", ())) | frozenset(exclude),
+        frozenset(filterConfig.get("include", ())) | frozenset(include),
+        pcbView_layer_whitelist | frozenset(filterConfig.get("layers", ())) | frozenset(layers)
+    )
+
+
 def txt_match_in_patternset(string, patternset):
     for pattern in patternset:
         if pattern.fullmatch(string):
@@ -282,11 +669,7 @@ class AbstractPart:
         self.rotation = rotationAndTranslationVectors[0]
         self.translationRotation = rotationAndTranslationVectors[1]
 
-        self.attributes = dict()
-        for titleExpression, attribute_data in attributes.items():
-            titlePattern = re.compile(titleExpression)
-            if titlePattern.fullmatch(self.title):
-                self.attributes = update(self.attributes, copy.deepcopy(attribute_data))
+        self.attributes = titleAttributes(self.title, attributes)
 
         zPos = Dimension(0)
 
@@ -315,6 +698,37 @@ class AbstractPart:
         else:
             return None
 
+    def transformMatrix(self):
+        """get the 4x4 matrix (in mm) of the transformations asScad()
+        applies to the model of this part."""
+        m = translationMatrix(Dimension.dimensionList2MmList(self.positionInSketch))
+        m = matrixMultiply(m, translationMatrix(Dimension.dimensionList2MmList(self.translationRotation)))
+        m = matrixMultiply(m, rotationMatrix(self.rotation))
+        return m
+
+    def modelCall(self, fn=None):
+        """The call of the model of this part, e.g. 'mResistorModuleID(height=5.0);'.
+        fn is the expression of its $fn, if given."""
+        arguments = self.parametersAsString()
+        if fn is not None:
+            arguments = ",".join([a for a in (arguments, "$fn=" + fn) if a])
+        return "{}({});".format(self.module_name, arguments)
+
+    def _callAsScad(self, data, indent, placeholder=None, modelFiles=None):
+        """The call of the model of this part, the lines after the first
+        indented by indent. With a placeholder the level of detail chooses
+        between both (see createLodString()), the model gets the $fn
+        fzz2scad_fn then. If modelFiles (dict(modelCall(): STL file)) has
+        the call, the STL is imported instead (see fzz2scadModels.py)."""
+        call = self.modelCall()
+        if modelFiles is not None and call in modelFiles:
+            call = "import(\"{}\"); //{}".format(modelFiles[call], call)
+        elif placeholder is not None:
+            call = self.modelCall("fzz2scad_fn")
+        if placeholder is not None:
+            call = lodSwitch(placeholder, call)
+        return txt_prefix_each_line(call, indent, True)
+
     def parametersAsString(self):
         ret = []
         for k, v in self.parameters.items():
@@ -408,6 +822,14 @@ class Part(AbstractPart):
         else:
             return AbstractPart.export(self, internal_name)
 
+    def transformMatrix(self, withSvgOffset=True):
+        m = AbstractPart.transformMatrix(self)
+        if self.bottom:
+            m = matrixMultiply(m, mirrorMatrix((0, 0, 1)))
+        if withSvgOffset:
+            m = matrixMultiply(m, translationMatrix(Dimension.dimensionList2MmList(self.svgOffset)))
+        return m
+
     def _getInfoText(self, showGroundplate=False):
         data = AbstractPart._getInfoText(self)
 
@@ -427,10 +849,28 @@ class Part(AbstractPart):
 
         return data
 
-    def asScad(self, showGroundplate=False):
-        """get a string representation to be used in an scad file."""
+    def asScad(self, showGroundplate=False, multmatrix=False, lod=False, modelFiles=None):
+        """get a string representation to be used in an scad file.
+        With multmatrix all transformations are combined into a single
+        multmatrix(). With lod the bounding box of the footprint can
+        replace the model (see createLodString()). With modelFiles the
+        model can be imported from an STL (see _callAsScad())."""
         data = self._getInfoText(showGroundplate)
         data["selfStr"] = str(self)
+        placeholder = None
+        if lod:
+            placeholder = "translate({}) mirror([0, 1, 0]) cube([{!r}, {!r}, fzz2scad_lod_height]); //bounding box of the footprint".format(
+                [-v for v in data['svgOffset']], data['svgDimension'][0], data['svgDimension'][1])
+        if multmatrix:
+            data["matrix"] = matrixAsScad(self.transformMatrix())
+            data["call"] = self._callAsScad(data, "  ", placeholder, modelFiles)
+            if showGroundplate:
+                data["groundplate"] = "multmatrix({}) {}\n".format(matrixAsScad(self.transformMatrix(False)), data["groundplate"])
+            return """// {selfStr}
+{groundplate}multmatrix({matrix}) //position in the sketch, rotation, mirror and position of connector0 in the svg
+  {call}
+""".format(**data)
+        data["call"] = self._callAsScad(data, "          ", placeholder, modelFiles)
         return """// {selfStr}
 translate({positionInSketch}) //position in the Sketch
   translate({translationRotation}) //translation that corrects the rotation
@@ -439,7 +879,7 @@ translate({positionInSketch}) //position in the Sketch
       {{
         {groundplate}
         translate({svgOffset}) /* translation for the position of connector0 in the svg */
-          {module_name}({parameters});
+          {call}
       }}
 """.format(**data)
 
@@ -508,6 +948,11 @@ class Hole(AbstractPart):
         else:
             return AbstractPart.export(self, internal_name)
 
+    def transformMatrix(self):
+        m = AbstractPart.transformMatrix(self)
+        m = matrixMultiply(m, translationMatrix(Dimension.dimensionList2MmList(self.svgOffset)))
+        return m
+
     def _getInfoText(self, showGroundplate=False):
         data = AbstractPart._getInfoText(self)
 
@@ -525,10 +970,27 @@ class Hole(AbstractPart):
 
         return data
 
-    def asScad(self, showGroundplate=False):
-        """get a string representation to be used in an scad file."""
+    def asScad(self, showGroundplate=False, multmatrix=False, lod=False, modelFiles=None):
+        """get a string representation to be used in an scad file.
+        With multmatrix all transformations are combined into a single
+        multmatrix(). With lod a coarse cylinder can replace the model
+        (see createLodString())."""
         data = self._getInfoText(showGroundplate)
         data["selfStr"] = str(self)
+        placeholder = None
+        if lod:
+            placeholder = "cylinder(d={!r}, h={!r}, center=true, $fn=fzz2scad_lod_fn); //the drill".format(data['diameter'], Dimension(self.parameters['drillDepth']).asMm())
+        if multmatrix:
+            data["matrix"] = matrixAsScad(self.transformMatrix())
+            data["call"] = self._callAsScad(data, "  ", placeholder, modelFiles)
+            return """// {selfStr}
+multmatrix({matrix}) //position in the sketch, rotation and xy position in the svg
+{{
+  {groundplate}
+  {call}
+}}
+""".format(**data)
+        data["call"] = self._callAsScad(data, "        ", placeholder, modelFiles)
         return """// {selfStr}
 translate({positionInSketch}) //position in the sketch
   translate({translationRotation}) //translation that corrects the rotation
@@ -536,7 +998,7 @@ translate({positionInSketch}) //position in the sketch
       translate({svgOffset}) /* translation for the xy position in the svg */
       {{
         {groundplate}
-        {module_name}({parameters});
+        {call}
       }}
 """.format(**data)
 
@@ -593,15 +1055,30 @@ class PCB(AbstractPart):
         data = AbstractPart._getInfoText(self)
         return data
 
-    def asScad(self, showGroundplate=False):
-        """get a string representation to be used in an scad file."""
+    def asScad(self, showGroundplate=False, multmatrix=False, lod=False, modelFiles=None):
+        """get a string representation to be used in an scad file.
+        With multmatrix all transformations are combined into a single
+        multmatrix(). With lod a plain board can replace the model (see
+        createLodString())."""
         data = self._getInfoText(showGroundplate)
         data["selfStr"] = str(self)
+        placeholder = None
+        if lod:
+            width, depth, height = Dimension.dimensionList2MmList(self.dimensions)
+            placeholder = "mirror([0, 1, 0]) translate([0, 0, {!r}]) cube([{!r}, {!r}, {!r}]); //the board".format(-height, width, depth, height)
+        if multmatrix:
+            data["matrix"] = matrixAsScad(self.transformMatrix())
+            data["call"] = self._callAsScad(data, "  ", placeholder, modelFiles)
+            return """// {selfStr}
+multmatrix({matrix}) //position in the sketch and rotation
+  {call}
+""".format(**data)
+        data["call"] = self._callAsScad(data, "      ", placeholder, modelFiles)
         return """// {selfStr}
 translate({positionInSketch}) //position in the sketch
   translate({translationRotation}) //translation that corrects the rotation
     rotate({rotation}) //rotation
-      {module_name}({parameters});
+      {call}
 """.format(**data)
 
     def __str__(self):
@@ -840,47 +1317,274 @@ def transformElement2MatrixString(element):
 [ 0         , 0         , 0         , 1         ]
 ]""".format(**data)
 
+# ####################### MATRIX HELPERS ########################
+
+
+def roundedFloat(v, digits):
+    """v rounded to digits, -0.0 becomes 0.0."""
+    return round(v, digits) + 0.0
+
+
+def matrixMultiply(a, b):
+    """Multiply the 4x4 matrices a and b (a list of rows each)."""
+    return [[sum(a[i][k] * b[k][j] for k in range(4)) for j in range(4)] for i in range(4)]
+
+
+def translationMatrix(v):
+    """The 4x4 matrix of OpenSCADs translate(v)."""
+    return [
+        [1, 0, 0, v[0]],
+        [0, 1, 0, v[1]],
+        [0, 0, 1, v[2]],
+        [0, 0, 0, 1]
+    ]
+
+
+def rotationMatrix(r):
+    """The 4x4 matrix of OpenSCADs rotate(r). r is given in degrees.
+    OpenSCAD rotates around the x axis first, then y, then z."""
+    sx, cx = math.sin(math.radians(r[0])), math.cos(math.radians(r[0]))
+    sy, cy = math.sin(math.radians(r[1])), math.cos(math.radians(r[1]))
+    sz, cz = math.sin(math.radians(r[2])), math.cos(math.radians(r[2]))
+    rx = [[1, 0, 0, 0], [0, cx, -sx, 0], [0, sx, cx, 0], [0, 0, 0, 1]]
+    ry = [[cy, 0, sy, 0], [0, 1, 0, 0], [-sy, 0, cy, 0], [0, 0, 0, 1]]
+    rz = [[cz, -sz, 0, 0], [sz, cz, 0, 0], [0, 0, 1, 0], [0, 0, 0, 1]]
+    return matrixMultiply(rz, matrixMultiply(ry, rx))
+
+
+def mirrorMatrix(n):
+    """The 4x4 matrix of OpenSCADs mirror(n)."""
+    length2 = n[0] * n[0] + n[1] * n[1] + n[2] * n[2]
+    ret = translationMatrix((0, 0, 0))
+    for i in range(3):
+        for j in range(3):
+            ret[i][j] = ret[i][j] - 2 * n[i] * n[j] / length2
+    return ret
+
+
+def matrixAsScad(m, digits=12):
+    """The 4x4 matrix m as OpenSCAD vector of rows (see multmatrix()).
+    The values are rounded to digits, so cos(90) becomes 0."""
+    return "[" + ", ".join(["[" + ", ".join([repr(roundedFloat(v, digits)) for v in row]) + "]" for row in m]) + "]"
+
+
+def applyMatrix(m, p):
+    """Transform the point p=(x, y, z) with the 4x4 matrix m."""
+    return tuple(m[i][0] * p[0] + m[i][1] * p[1] + m[i][2] * p[2] + m[i][3] for i in range(3))
+
+# ####################### BOARD INDEX ########################
+
+
+def boardOutline(pcb):
+    """The corners (x, y in mm) of the PCB as it is placed in the sketch."""
+    m = pcb.transformMatrix()
+    width = pcb.dimensions[0].asMm()
+    depth = pcb.dimensions[1].asMm()
+    return [applyMatrix(m, p)[0:2] for p in ((0, -depth, 0), (width, -depth, 0), (width, 0, 0), (0, 0, 0))]
+
+
+def xyInConvexPolygon(xy, polygon):
+    """Check if the point xy is inside (or on the edge of) the convex polygon."""
+    sign = 0
+    for i in range(len(polygon)):
+        x1, y1 = polygon[i - 1]
+        x2, y2 = polygon[i]
+        cross = (x2 - x1) * (xy[1] - y1) - (y2 - y1) * (xy[0] - x1)
+        if cross > 1e-9:
+            if sign < 0:
+                return False
+            sign = 1
+        elif cross < -1e-9:
+            if sign > 0:
+                return False
+            sign = -1
+    return True
+
+
+class BoardIndex:
+    """A uniform grid over the outlines of boards. A point is only tested
+    against the boards that overlap the cell of the point, so finding
+    the boards of n points is about linear in n."""
+
+    def __init__(self, outlines):
+        """outlines: a list of (key, outline). If boards overlap, the
+        first one in the list wins."""
+        self.keys = list()
+        self.outlines = list()
+        self.cells = dict()
+
+        bounds = list()
+        for key, outline in outlines:
+            xs = [p[0] for p in outline]
+            ys = [p[1] for p in outline]
+            self.keys.append(key)
+            self.outlines.append(outline)
+            bounds.append((min(xs), max(xs), min(ys), max(ys)))
+
+        extents = [max(b[1] - b[0], b[3] - b[2]) for b in bounds]
+        # cells of about the size of a board, but a single huge board must not create too many cells
+        self.cellSize = max(sum(extents) / len(extents), max(extents) / 16) if extents else 1
+        if self.cellSize <= 0:
+            self.cellSize = 1
+
+        for i, (x1, x2, y1, y2) in enumerate(bounds):
+            for cx in range(self._cell(x1), self._cell(x2) + 1):
+                for cy in range(self._cell(y1), self._cell(y2) + 1):
+                    self.cells.setdefault((cx, cy), list()).append(i)
+
+    def _cell(self, v):
+        return int(math.floor(v / self.cellSize))
+
+    def find(self, xy):
+        """The key of the first board the point xy (in mm) is on or None."""
+        for i in self.cells.get((self._cell(xy[0]), self._cell(xy[1])), ()):
+            if xyInConvexPolygon(xy, self.outlines[i]):
+                return self.keys[i]
+        return None
+
+
+def getPcbMembers(parts, pcbTitles):
+    """Find the parts and holes whose positionAbsolute is on one of the
+    given PCBs. A part that is on more than one of them belongs to the
+    first one in pcbTitles.
+    return dict(pcbTitle: [partTitle, ...]) for the PCBs found in parts"""
+    outlines = list()
+    ret = dict()
+    for pcbTitle in pcbTitles:
+        if pcbTitle in parts and isinstance(parts[pcbTitle], PCB) and pcbTitle not in ret:
+            outlines.append((pcbTitle, boardOutline(parts[pcbTitle])))
+            ret[pcbTitle] = [pcbTitle]
+
+    index = BoardIndex(outlines)
+    for partTitle in sorted(parts.keys()):
+        part = parts[partTitle]
+        if isinstance(part, (Part, Hole)):
+            pcbTitle = index.find(part.export("positionAbsolute")[0:2])
+            if pcbTitle is not None:
+                ret[pcbTitle].append(partTitle)
+    return ret
+
+# ####################### LEVEL OF DETAIL ########################
+
+# The defaults of createLodString().
+LOD_HEIGHT = 5.0
+LOD_FN = 8
+
+
+def createLodString(height=LOD_HEIGHT, fn=LOD_FN):
+    """The variables that switch the level of detail of modules created
+    with lod (see createModuleString()). A file that includes the output
+    can assign them again, e.g. fzz2scad_lod_low = true; to always see the
+    placeholders. The boxes and boards have no curves, the holes use
+    fzz2scad_lod_fn and the models fzz2scad_fn."""
+    return """// Placeholders instead of the models of the parts? Default: in the preview (F5) only.
+fzz2scad_lod_low = $preview;
+// The height (mm) of the bounding boxes that replace parts.
+fzz2scad_lod_height = {!r};
+// The $fn of the cylinders that replace holes.
+fzz2scad_lod_fn = {:d};
+// The $fn of the models of the parts, holes and PCBs. Default: the $fn of the including file.
+fzz2scad_fn = $fn;""".format(height, fn)
+
+
+def lodSwitch(placeholder, call):
+    """Use the placeholder instead of the call in the low level of detail."""
+    return "if (fzz2scad_lod_low)\n" + txt_prefix_each_line(placeholder, "  ") + "\nelse\n" + txt_prefix_each_line(call, "  ")
+
 # ####################### WORKHORSES ########################
 
 
-def getParts(xmlRoot, attributes=dict()):
+def getRelevantInstances(xmlRoot, partFilter=None):
+    """Get the instances in the sketch that become parts (see PartFilter).
+    return a list of (instanceXmlElement, isBoard)"""
+    if partFilter is None:
+        partFilter = PartFilter()
+
     boardsTitles = list()  # which of the parts are boards?
     for boardElement in xmlRoot.findall("./boards/board"):
         boardsTitles = boardsTitles + [boardElement.attrib['instance']]
 
-    relevantParts = dict()
+    ret = list()
 
     for instance in xmlRoot.findall("./instances/instance"):
         try:
-            if not txt_match_in_patternset(instance.find("./views/pcbView").attrib['layer'], pcbView_layer_whitelist_pattern):
-                printConsole("INFO: Ignoring '{}' as it is not whitelisted!".format(instance.attrib['moduleIdRef']), 3)
+            if not partFilter.acceptsLayer(instance.find("./views/pcbView").attrib['layer']):
+                printConsole("INFO: Ignoring '{}' as it is not whitelisted!", 3, instance.attrib['moduleIdRef'])
                 continue
         except AttributeError:
             continue
-        if not txt_match_in_patternset(str(instance.attrib['moduleIdRef']), moduleIdRef_blacklist_pattern):
+        if partFilter.acceptsModuleIdRef(str(instance.attrib['moduleIdRef'])):
             geometry = instance.find("./views/pcbView/geometry")
             if geometry is not None:
-                instanceTitle = instance.find("./title").text
-                if instanceTitle in boardsTitles:
-                    p = PCB.buildFromInstanceXmlElement(instance, xmlRoot, attributes)
-                elif instance.attrib['moduleIdRef'] == "HoleModuleID":
-                    p = Hole.buildFromInstanceXmlElement(instance, attributes)
-                else:
-                    p = Part.buildFromInstanceXmlElement(instance, attributes)
-                printConsole("INFO: Adding '{}' title='{}'".format(instance.attrib['moduleIdRef'], p.title), 2)
-                relevantParts[p.title] = p
+                ret.append((instance, instance.find("./title").text in boardsTitles))
             else:
-                printConsole("INFO: Strange! '{}' does not have XPath:'{}' that IS strange!".format(instance.attrib, "./views/pcbView/geometry"), 2)
+                printConsole("INFO: Strange! '{}' does not have XPath:'{}' that IS strange!", 2, instance.attrib, "./views/pcbView/geometry")
+        else:
+            printConsole("INFO: Ignoring '{}' as it is blacklisted!", 2, instance.attrib['moduleIdRef'])
+    return ret
+
+
+# Starting worker processes costs more than reading a few parts from the
+# archive, so buildPrototypes() only uses them for at least this many parts.
+PROTOTYPE_PROCESS_THRESHOLD = 16
+
+
+def buildPrototypes(xmlRoot, partFilter=None, jobs=None):
+    """Create the prototypes (see getPrototype()) of all parts in the
+    sketch before the parts are created. If at least
+    PROTOTYPE_PROCESS_THRESHOLD parts have to be read from the archive,
+    they are split between jobs (default: number of CPUs) worker
+    processes."""
+    moduleIdRefs = sorted(set([instance.attrib['moduleIdRef'] for instance, isBoard in getRelevantInstances(xmlRoot, partFilter) if not isBoard]))
+    fromArchive = [m for m in moduleIdRefs if m not in partPrototypes and m != "HoleModuleID" and not (usePrototypeTable and m in getPrototypeTable())]
+    # parts that are not embedded are left to getPrototype()
+    embedded = set(getFilesThatEndWith(inputFzzFileName, ".fzp"))
+    fromArchive = [m for m in fromArchive if fzpFileNameInArchive(xmlRoot, m) in embedded]
+
+    jobs = min(jobs or os.cpu_count() or 1, len(fromArchive))
+    if jobs > 1 and len(fromArchive) >= PROTOTYPE_PROCESS_THRESHOLD:
+        import concurrent.futures
+        import concurrent.futures.process
+        printConsole("INFO: Creating {} Prototypes in {} processes...", 2, len(fromArchive), jobs)
+        chunks = [fromArchive[i::jobs] for i in range(jobs)]
+        try:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+                futures = [executor.submit(prototypesFromArchive, inputFzzFileName, [fzpFileNameInArchive(xmlRoot, m) for m in chunk]) for chunk in chunks]
+                for chunk, future in zip(chunks, futures):
+                    for moduleIdRef, prototype in zip(chunk, future.result()):
+                        partPrototypes[moduleIdRef] = prototype
+                        printConsole("      Prototype '{}': {!r}", 2, moduleIdRef, prototype)
+        except (OSError, NotImplementedError, concurrent.futures.process.BrokenProcessPool) as err:
+            # e.g. no working multiprocessing on this platform, getPrototype() does the work.
+            printConsole("INFO: Can't create the Prototypes in parallel: {}", 2, err)
+
+    for moduleIdRef in moduleIdRefs:
+        getPrototype(moduleIdRef)
+        checkMemory()
+
+
+def getParts(xmlRoot, attributes=dict(), partFilter=None):
+    relevantParts = dict()
+
+    for instance, isBoard in getRelevantInstances(xmlRoot, partFilter):
+        if isBoard:
+            p = PCB.buildFromInstanceXmlElement(instance, xmlRoot, attributes)
+        elif instance.attrib['moduleIdRef'] == "HoleModuleID":
+            p = Hole.buildFromInstanceXmlElement(instance, attributes)
         else:
-            printConsole("INFO: Ignoring '{}' as it is blacklisted!".format(instance.attrib['moduleIdRef']), 2)
+            p = Part.buildFromInstanceXmlElement(instance, attributes)
+        printConsole("INFO: Adding '{moduleIdRef}' title='{title}'", 2, moduleIdRef=instance.attrib['moduleIdRef'], title=p.title)
+        relevantParts[p.title] = p
+        checkMemory()
     return relevantParts
 
 
 def getConfig(xmlRoot, moduleNameOrPrefix):
     """Extract the configuration from the sketch.
     TODO: Allow more than one note and merging of configuration notes"""
+    import json
 
-    ret = dict({"attributes": dict(), "modules": dict()})
+    ret = dict({"attributes": dict(), "modules": dict(), "filter": dict(), "check": dict()})
     for instance in xmlRoot.findall("./instances/instance[@moduleIdRef='NoteModuleID']"):
         try:
             title = instance.find("./title").text
@@ -895,6 +1599,11 @@ def getConfig(xmlRoot, moduleNameOrPrefix):
                     raise err
                 if "attributes" in jsonData.keys():
                     update(ret["attributes"], jsonData["attributes"])
+                if "filter" in jsonData.keys():
+                    for key, patterns in jsonData["filter"].items():
+                        ret["filter"][key] = ret["filter"].get(key, list()) + list(patterns)
+                if "check" in jsonData.keys():
+                    update(ret["check"], jsonData["check"])
                 if "modules" in jsonData.keys():
                     for moduleName in list(jsonData["modules"].keys()):
                         ret["modules"][moduleNameOrPrefix + "_" + moduleName] = jsonData["modules"].pop(moduleName)
@@ -905,6 +1614,49 @@ def getConfig(xmlRoot, moduleNameOrPrefix):
     return ret
 
 
+def loadSketch(fzzFileName, moduleNameOrPrefix=None):
+    """Read the given sketch, its configuration and its parts. This sets
+    the globals inputFzzFileName and xmlRoot (see getPrototype()).
+    return (xmlRoot, configuration, parts)"""
+    global inputFzzFileName
+    global xmlRoot
+
+    if moduleNameOrPrefix is None:
+        moduleNameOrPrefix = str(os.path.split(fzzFileName)[-1]).split(".")[0]
+
+    # Prototypes are taken from the sketch, an other sketch might have other parts.
+    partPrototypes.clear()
+
+    inputFzzFileName = fzzFileName
+    xmlRoot = getXMLRoot(fzzFileName, getFilesThatEndWith(fzzFileName, ".fz")[0])
+    configuration = getConfig(xmlRoot, moduleNameOrPrefix)
+    parts = getParts(xmlRoot, configuration['attributes'], getPartFilter(configuration))
+    return (xmlRoot, configuration, parts)
+
+
+def getPartRecords(parts, modules, precision=6):
+    """Get a plain (json serializable) record of each resolved part (see
+    getParts(), before splitPartsToModules() takes them out of the dict),
+    also of the parts that are in no module. 'modules' lists
+    the names of the modules (see splitPartsToModules()) the part is in.
+    Lengths are in mm, rounded to precision digits.
+    return dict(title: record)"""
+    ret = dict()
+    for title, part in parts.items():
+        record = dict()
+        record['title'] = title
+        record['kind'] = type(part).__name__
+        record['moduleIdRef'] = part.moduleIdRef
+        record['modules'] = sorted([moduleName for moduleName, moduleParts in modules.items() if title in moduleParts])
+        record['positionAbsolute'] = [roundedFloat(v, precision) for v in part.export("positionAbsolute")]
+        record['rotation'] = [roundedFloat(v, precision) for v in part.export("rotation")]
+        record['bottom'] = bool(getattr(part, "bottom", False))
+        record['attributes'] = part.attributes
+        record['parameters'] = dict(part.parameters)
+        ret[title] = record
+    return ret
+
+
 def xyInAbcd(xy=(), abcd=dict()):
     if xy is None or abcd is None:
         return False
@@ -920,14 +1672,17 @@ def splitPartsToModules(xmlRoot, parts, configModules):
     ret = dict()
     defaultModuleName = None
 
+    pcbTitles = [pcbTitle for modelConfig in configModules.values() for pcbTitle in modelConfig.get("pcbs", list())]
+    pcbMembers = getPcbMembers(parts, pcbTitles) if pcbTitles else dict()
+
     for moduleName, modelConfig in configModules.items():
-        printConsole("INFO: Processing module '{}'.".format(moduleName), 2)
+        printConsole("INFO: Processing module '{}'.", 2, moduleName)
         ret[moduleName] = dict()
         if "frames" in modelConfig:
-            printConsole("INFO: Found 'frames' list in configuration for module '{}'.".format(moduleName), 2)
+            printConsole("INFO: Found 'frames' list in configuration for module '{}'.", 2, moduleName)
             for frameTitle in modelConfig['frames']:
                 # find frame from schema, find items in this frame, add to list
-                printConsole("INFO: Looking for frame '{}'.".format(frameTitle), 2)
+                printConsole("INFO: Looking for frame '{}'.", 2, frameTitle)
                 instance = xmlRoot.find("./instances/instance[@moduleIdRef='SchematicFrameModuleID'][title='" + frameTitle + "']")
                 if instance:
                     # get coordinates of the frame
@@ -937,42 +1692,78 @@ def splitPartsToModules(xmlRoot, parts, configModules):
                     x2 = x1 + Dimension(instance.find(".property[@name='width']").attrib["value"], unit="mm")
                     y2 = y1 + Dimension(instance.find(".property[@name='height']").attrib["value"], unit="mm")
                     abcd = (x1, x2, y1, y2)
-                    printConsole("INFO: Found Frame '{}' for model '{}' with Coordinates '(x1,x2,y1,y2)={}'.".format(frameTitle, moduleName, abcd), 2)
+                    printConsole("INFO: Found Frame '{}' for model '{}' with Coordinates '(x1,x2,y1,y2)={}'.", 2, frameTitle, moduleName, abcd)
 
                     # find parts that are in abcd
                     for partTitle in sorted(list(parts.keys())):
                         if isinstance(parts[partTitle], Part) and xyInAbcd(parts[partTitle].schematicCoords, abcd):
-                            printConsole("INFO: Part '{}' in Frame '{}' {}.".format(partTitle, frameTitle, str(parts[partTitle].schematicCoords)), 2)
+                            printConsole("INFO: Part '{}' in Frame '{}' {}.", 2, partTitle, frameTitle, str(parts[partTitle].schematicCoords))
                             ret[moduleName][partTitle] = parts.pop(partTitle)
                 else:
-                    printConsole("WARNING: Frame '{}' not found but it was set in the configuration for the model '{}'.".format(frameTitle, moduleName), 1)
-
-        if "pcb" in modelConfig:
-            # TODO find the pcb and the items on this pcb, add to list
-            pass
+                    printConsole("WARNING: Frame '{}' not found but it was set in the configuration for the model '{}'.", 1, frameTitle, moduleName)
+
+        if "pcbs" in modelConfig:
+            printConsole("INFO: Found 'pcbs' list in configuration for module '{}'.", 2, moduleName)
+            for pcbTitle in modelConfig["pcbs"]:
+                if pcbTitle not in pcbMembers:
+                    printConsole("WARNING: PCB '{}' not found but it was set in the configuration for the module '{}'.", 1, pcbTitle, moduleName)
+                    continue
+                for partTitle in pcbMembers[pcbTitle]:
+                    if partTitle in parts:
+                        printConsole("INFO: Part '{}' on PCB '{}'.", 2, partTitle, pcbTitle)
+                        ret[moduleName][partTitle] = parts.pop(partTitle)
         if "default" in modelConfig:
             defaultModuleName = moduleName
         if "parts" in modelConfig:
-            printConsole("INFO: Found 'parts' list in cofiguration for module '{}'.".format(moduleName), 2)
+            printConsole("INFO: Found 'parts' list in cofiguration for module '{}'.", 2, moduleName)
             for partTitle in modelConfig["parts"]:
                 if partTitle in parts:
-                    printConsole("INFO: Adding Part '{}' to Module '{}' as it is set in the 'parts' list in the configuration.".format(partTitle, moduleName), 2)
+                    printConsole("INFO: Adding Part '{}' to Module '{}' as it is set in the 'parts' list in the configuration.", 2, partTitle, moduleName)
                     ret[moduleName][partTitle] = parts.pop(partTitle)
                 else:
-                    printConsole("WARNING: Part '{}' not found but it was set in the configuration for the module '{}'.".format(partTitle, moduleName), 1)
+                    printConsole("WARNING: Part '{}' not found but it was set in the configuration for the module '{}'.", 1, partTitle, moduleName)
 
     if defaultModuleName is not None:
-        printConsole("INFO: Found the default module '{}'.".format(defaultModuleName), 2)
+        printConsole("INFO: Found the default module '{}'.", 2, defaultModuleName)
         for partTitle in list(parts.keys()):
-            printConsole("INFO: Adding the part '{}' to the default module '{}'.".format(partTitle, defaultModuleName), 2)
+            printConsole("INFO: Adding the part '{}' to the default module '{}'.", 2, partTitle, defaultModuleName)
             ret[defaultModuleName][partTitle] = parts.pop(partTitle)
     elif defaultModuleName is None and parts:  # parts is not empty
         printConsole("WARINING: There is no default module. But there are parts without a module.", 1)
-        printConsole("WARINING: These parts do not belong to any module:\n          " + repr(parts.keys()) + "\n          Check your Sketch. You may add {\"default\" : true} to a module.", 1)
+        printConsole("WARINING: These parts do not belong to any module:\n          {!r}\n          Check your Sketch. You may add {{\"default\" : true}} to a module.", 1, parts.keys())
     return ret
 
 
-def createModuleString(moduleName, moduleParts, configuration, showGroundplate):
+def getModuleTranslation(moduleName, moduleParts, configuration):
+    """Get the translation [x, y, z] (in mm) of the whole module that
+    results from 'center' and 'z' in the module configuration."""
+    translate = [0, 0, 0]
+    if "modules" in configuration.keys():
+        if moduleName in configuration["modules"].keys():
+            module = configuration["modules"][moduleName]
+            if "z" in module.keys():
+                translate[2] = Dimension(module["z"]).asMm()
+            if "center" in module.keys():
+                if module["center"] in moduleParts.keys():
+                    printConsole("INFO: centering '{}'", 3, module["center"])
+                    centerEntity = moduleParts[module["center"]]
+                    if isinstance(centerEntity, PCB):
+                        translate[0] = - (centerEntity.dimensions[0].asMm() / 2) - centerEntity.positionInSketch[0].asMm()
+                        translate[1] = (centerEntity.dimensions[1].asMm() / 2) - centerEntity.positionInSketch[1].asMm()
+                    elif isinstance(centerEntity, Hole):
+                        proto = getPrototype("HoleModuleID")
+                        translate[0] = (-(centerEntity.positionInSketch[0] + (proto['svgOffsetX'] * Dimension(centerEntity.parameters["diameter"])))).asMm()
+                        translate[1] = (-(centerEntity.positionInSketch[1] + (proto['svgOffsetY'] * Dimension(centerEntity.parameters["diameter"])))).asMm()
+#                    elif isinstance(centerEntity, Part):
+#                         # TODO Test
+#                         translate[0] = -(centerEntity.positionInSketch[0].asMm() + proto['svgOffsetX'].asMm())
+#                         translate[1] = -(centerEntity.positionInSketch[1].asMm() + proto['svgOffsetY'].asMm())
+                    else:
+                        raise RuntimeError("Can only center PCBs and Holes.")
+    return translate
+
+
+def createModuleString(moduleName, moduleParts, configuration, showGroundplate, multmatrix=False, lod=False, modelFiles=None):
     moduleCommentTemplate = """
 @created-with: fzz2scad v{version!s} (https://github.com/htho/fzz2scad)
 {module-dependencies}
@@ -998,29 +1789,10 @@ module {module_name}(){{
 
     values["export"] = dict()  # external_name, value
 
-    translate = [0, 0, 0]
+    translate = getModuleTranslation(moduleName, moduleParts, configuration)
     if "modules" in configuration.keys():
         if moduleName in configuration["modules"].keys():
             module = configuration["modules"][moduleName]
-            if "z" in module.keys():
-                translate[2] = Dimension(module["z"]).asMm()
-            if "center" in module.keys():
-                if module["center"] in moduleParts.keys():
-                    printConsole("INFO: centering '{}'".format(module["center"]), 3)
-                    centerEntity = moduleParts[module["center"]]
-                    if isinstance(centerEntity, PCB):
-                        translate[0] = - (centerEntity.dimensions[0].asMm() / 2) - centerEntity.positionInSketch[0].asMm()
-                        translate[1] = (centerEntity.dimensions[1].asMm() / 2) - centerEntity.positionInSketch[1].asMm()
-                    elif isinstance(centerEntity, Hole):
-                        proto = Part.getPrototype("HoleModuleID")
-                        translate[0] = (-(centerEntity.positionInSketch[0] + (proto['svgOffsetX'] * Dimension(centerEntity.parameters["diameter"])))).asMm()
-                        translate[1] = (-(centerEntity.positionInSketch[1] + (proto['svgOffsetY'] * Dimension(centerEntity.parameters["diameter"])))).asMm()
-#                    elif isinstance(centerEntity, Part):
-#                         # TODO Test
-#                         translate[0] = -(centerEntity.positionInSketch[0].asMm() + proto['svgOffsetX'].asMm())
-#                         translate[1] = -(centerEntity.positionInSketch[1].asMm() + proto['svgOffsetY'].asMm())
-                    else:
-                        raise RuntimeError("Can only center PCBs and Holes.")
             if "export" in module.keys():
                 for internal_name, external_name in module["export"].items():
                     if internal_name == "z":
@@ -1036,11 +1808,11 @@ module {module_name}(){{
 
     for partName, partInstance in moduleParts.items():
         if isinstance(partInstance, Hole):
-            values['holes'].append(partInstance.asScad(showGroundplate))
+            values['holes'].append(partInstance.asScad(showGroundplate, multmatrix, lod, modelFiles))
         elif isinstance(partInstance, PCB):
-            values['parts'].append(partInstance.asScad())
+            values['parts'].append(partInstance.asScad(False, multmatrix, lod, modelFiles))
         else:
-            values['parts'].append(partInstance.asScad(showGroundplate))
+            values['parts'].append(partInstance.asScad(showGroundplate, multmatrix, lod, modelFiles))
 
         values['module-dependencies'].append("@module-dependency: " + partInstance.module_name)
 
@@ -0,0 +1,116 @@
+'''
+    fzz2scadModels.py from fzz2scad: Renders the models of the parts once
+    into a cache of STL files, so the created modules can import them
+    instead of evaluating the models of the library again and again.
+
+    Copyright (C) 2015  Hauke Thorenz <htho@thorenz.net>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+    A model is the call of the module of a part with its parameters (see
+    fzz2scadLib.AbstractPart.modelCall()). Its STL is cached as
+    CACHE/HASH.stl, HASH is the hash of the call and the content of the
+    library files (and the files they include or use), so a changed
+    library renders the models again.
+'''
+
+import concurrent.futures
+import hashlib
+import os
+import fzz2scadLib as lib
+import fzz2scadRender as render
+
+
+def collectModelCalls(modules):
+    """The distinct models of the parts (not the holes and PCBs, their
+    models are simple) of the modules.
+    return a sorted list of calls"""
+    calls = set()
+    for moduleParts in modules.values():
+        for part in moduleParts.values():
+            if isinstance(part, lib.Part):
+                calls.add(part.modelCall())
+    return sorted(calls)
+
+
+def libraryHash(libraryFiles):
+    """The hash of the content of the library files and the files they
+    include or use (see fzz2scadRender.libraryDependencies())."""
+    h = hashlib.sha256()
+    for libraryFile in render.libraryDependencies(libraryFiles):
+        with open(libraryFile, 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+def modelKey(call, libraryDigest):
+    """The cache key of a model (libraryDigest: see libraryHash())."""
+    return hashlib.sha256("{}\n{}".format(libraryDigest, call).encode("utf-8")).hexdigest()
+
+
+def createModelDriverString(call, libraryFiles):
+    """The content of a .scad file that renders only the model."""
+    includes = "\n".join(["include <{}>".format(os.path.abspath(f)) for f in libraryFiles])
+    return "/**\n * @created-with: fzz2scad v{} (https://github.com/htho/fzz2scad)\n */\n{}\n\n{}\n".format(lib.VERSION, includes, call)
+
+
+def _renderModel(call, driverString, key, cacheDir, executable):
+    cachedFile = os.path.join(cacheDir, key + ".stl")
+    driverFile = os.path.join(cacheDir, key + ".scad")
+    lib.writeFileIfChanged(driverFile, driverString)
+    # render next to the cache entry first, so an aborted run does not leave a broken one.
+    tmpFile = cachedFile + ".{}.tmp.stl".format(os.getpid())
+    returncode, output = render.renderDriver(executable, driverFile, tmpFile)
+    if returncode != 0 or not os.path.exists(tmpFile):
+        if os.path.exists(tmpFile):
+            os.remove(tmpFile)
+        return (call, "failed", output)
+    os.replace(tmpFile, cachedFile)
+    return (call, "rendered", output)
+
+
+def prepareModels(modules, libraryFiles, cacheDir, executable=render.DEFAULT_EXECUTABLE, jobs=None, relativeTo="."):
+    """Render the models of the parts of the modules that are not in
+    cacheDir yet, at most jobs (default: number of CPUs) at the same time.
+    Models that fail to render keep their call.
+    return (modelFiles, results) with modelFiles as dict(call: STL file
+    relative to relativeTo) for createModuleString() and results as a list
+    of (call, 'cached'|'rendered'|'failed', output)"""
+    os.makedirs(cacheDir, exist_ok=True)
+    libraryDigest = libraryHash(libraryFiles)
+
+    modelFiles = dict()
+    results = list()
+    keys = dict()
+    missing = list()
+    for call in collectModelCalls(modules):
+        keys[call] = modelKey(call, libraryDigest)
+        if os.path.exists(os.path.join(cacheDir, keys[call] + ".stl")):
+            results.append((call, "cached", ""))
+        else:
+            missing.append(call)
+
+    if missing:
+        lib.printConsole("INFO: Rendering {} of {} models...", 1, len(missing), len(keys))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=jobs or os.cpu_count() or 1) as executor:
+            futures = [executor.submit(_renderModel, call, createModelDriverString(call, libraryFiles), keys[call], cacheDir, executable) for call in missing]
+            for future in futures:
+                results.append(future.result())
+
+    for call, status, output in results:
+        lib.printConsole("INFO: Model '{}': {}", 2, call, status)
+        if status != "failed":
+            # OpenSCAD wants / in paths on all platforms
+            modelFiles[call] = os.path.relpath(os.path.join(cacheDir, keys[call] + ".stl"), relativeTo).replace(os.sep, "/")
+    return modelFiles, sorted(results)
@@ -0,0 +1,186 @@
+'''
+    fzz2scadPartsIndex.py from fzz2scad: Indexes local Fritzing parts
+    directories into an SQLite database, so parts that are not embedded in
+    a sketch can be resolved.
+
+    Copyright (C) 2015  Hauke Thorenz <htho@thorenz.net>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+    A parts directory is laid out like a checkout of fritzing-parts or the
+    parts directory of a Fritzing user:
+        FOLDER/*.fzp            the parts (FOLDER: core, contrib, user, obsolete)
+        svg/FOLDER/pcb/*.svg    their PCB footprints
+'''
+import argparse
+import os
+import sqlite3
+import xml.etree.ElementTree as ET
+import fzz2scadLib as lib
+
+VERSION = 0.1
+
+# Changing the tables needs a new version, older indexes are rebuilt.
+SCHEMA_VERSION = 1
+
+# The folders of a parts directory. If a moduleId is in more than one
+# folder, the first one wins.
+FOLDERS = ("core", "contrib", "user", "obsolete")
+
+PROTOTYPE_KEYS = ("svgWidth", "svgHeight", "svgOffsetX", "svgOffsetY")
+
+# Reading a part fails with one of these if it has no usable PCB footprint.
+partErrors = (AttributeError, KeyError, TypeError, ValueError, IOError, ET.ParseError)
+
+
+def _mtime(fileName):
+    try:
+        return os.stat(fileName).st_mtime_ns
+    except OSError:
+        return None
+
+
+def findSvgFileName(partsDir, folder, image):
+    """The footprint of a part is searched in the svg folder of the part
+    first, then in the others (like Fritzing does).
+    return the file name or None"""
+    for svgFolder in (folder,) + FOLDERS:
+        svgFileName = os.path.join(partsDir, "svg", svgFolder, image)
+        if os.path.isfile(svgFileName):
+            return svgFileName
+    return None
+
+
+class PartsIndex:
+    """An SQLite index of local Fritzing parts. Each .fzp is a row with its
+    moduleId, the paths and mtimes of the .fzp and its PCB footprint and
+    the prototype (see fzz2scadLib.getPrototype()) as Dimension strings."""
+
+    def __init__(self, fileName):
+        self.fileName = fileName
+        self.connection = sqlite3.connect(fileName)
+        version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+        if version != SCHEMA_VERSION:
+            if version != 0:
+                lib.printConsole("INFO: The parts index '{}' has the version '{}' but '{}' is needed. It is rebuilt.", 1, fileName, version, SCHEMA_VERSION)
+            with self.connection:
+                self.connection.execute("DROP TABLE IF EXISTS parts")
+                self.connection.execute("""CREATE TABLE parts (
+                    fzpPath TEXT PRIMARY KEY,
+                    partsDir TEXT NOT NULL,
+                    priority INTEGER NOT NULL,
+                    moduleId TEXT,
+                    svgPath TEXT,
+                    fzpMtime INTEGER,
+                    svgMtime INTEGER,
+                    svgWidth TEXT,
+                    svgHeight TEXT,
+                    svgOffsetX TEXT,
+                    svgOffsetY TEXT,
+                    error TEXT)""")
+                self.connection.execute("CREATE INDEX partsByModuleId ON parts (moduleId, priority)")
+                self.connection.execute("PRAGMA user_version = {:d}".format(SCHEMA_VERSION))
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excInfo):
+        self.close()
+
+    def _indexPart(self, partsDir, priority, folder, fzpFileName, fzpMtime):
+        row = {"fzpPath": fzpFileName, "partsDir": partsDir, "priority": priority, "moduleId": None, "svgPath": None,
+               "fzpMtime": fzpMtime, "svgMtime": None, "error": None}
+        row.update({key: None for key in PROTOTYPE_KEYS})
+        try:
+            fzpRoot = ET.parse(fzpFileName)
+            row["moduleId"] = fzpRoot.getroot().attrib['moduleId']
+            image = fzpRoot.find("./views/pcbView/layers").attrib['image']
+            row["svgPath"] = findSvgFileName(partsDir, folder, image)
+            if row["svgPath"] is None:
+                raise IOError("The footprint '{}' is missing.".format(image))
+            row["svgMtime"] = _mtime(row["svgPath"])
+            prototype = lib.prototypeFromXml(fzpRoot, ET.parse(row["svgPath"]))
+            row.update({key: str(prototype[key]) for key in PROTOTYPE_KEYS})
+        except partErrors as err:
+            row["error"] = repr(err)
+            lib.printConsole("INFO: Skipping '{}': {!r}", 3, fzpFileName, err)
+        columns = sorted(row.keys())
+        self.connection.execute("INSERT OR REPLACE INTO parts ({}) VALUES ({})".format(", ".join(columns), ", ".join(["?"] * len(columns))),
+                                [row[c] for c in columns])
+
+    def update(self, partsDir):
+        """Index the parts of partsDir. Only parts whose .fzp or footprint
+        changed (mtime) since the last update or that could not be read
+        are read again, parts that are gone are removed.
+        return dict('indexed':?, 'unchanged':?, 'removed':?)"""
+        partsDir = os.path.abspath(partsDir)
+        known = {fzpPath: (fzpMtime, svgPath, svgMtime, error) for fzpPath, fzpMtime, svgPath, svgMtime, error in
+                 self.connection.execute("SELECT fzpPath, fzpMtime, svgPath, svgMtime, error FROM parts WHERE partsDir = ?", (partsDir,))}
+        stats = {"indexed": 0, "unchanged": 0, "removed": 0}
+        with self.connection:
+            for priority, folder in enumerate(FOLDERS):
+                folderDir = os.path.join(partsDir, folder)
+                if not os.path.isdir(folderDir):
+                    continue
+                for entry in sorted(os.scandir(folderDir), key=lambda e: e.name):
+                    if not entry.name.endswith(".fzp") or not entry.is_file():
+                        continue
+                    fzpMtime = entry.stat().st_mtime_ns
+                    old = known.pop(entry.path, None)
+                    # parts that failed (e.g. a missing footprint) are read again, the cause might be gone
+                    if old is not None and old[0] == fzpMtime and old[1] is not None and _mtime(old[1]) == old[2] and old[3] is None:
+                        stats["unchanged"] = stats["unchanged"] + 1
+                        continue
+                    self._indexPart(partsDir, priority, folder, entry.path, fzpMtime)
+                    stats["indexed"] = stats["indexed"] + 1
+            for fzpPath in known:
+                self.connection.execute("DELETE FROM parts WHERE fzpPath = ?", (fzpPath,))
+                stats["removed"] = stats["removed"] + 1
+        lib.printConsole("INFO: Parts index '{}': {indexed} indexed, {unchanged} unchanged and {removed} removed parts in '{}'.", 2, self.fileName, partsDir, **stats)
+        return stats
+
+    def lookup(self, moduleIdRef):
+        """Get the prototype (see fzz2scadLib.getPrototype()) of a part.
+        return dict() or None if the part is not in the index"""
+        row = self.connection.execute("SELECT {} FROM parts WHERE moduleId = ? AND error IS NULL ORDER BY priority LIMIT 1".format(", ".join(PROTOTYPE_KEYS)),
+                                      (moduleIdRef,)).fetchone()
+        if row is None:
+            return None
+        return {key: lib.Dimension(value) for key, value in zip(PROTOTYPE_KEYS, row)}
+
+# ####################### SCRIPT PART ########################
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Indexes local Fritzing parts directories into an SQLite database that fzz2scad.py uses with --parts-index. Only changed parts are read again.")
+    parser.add_argument("INDEX", help="The index file (SQLite) to create or update.")
+    parser.add_argument("PARTS_DIRS", nargs="*", metavar="PARTS_DIR", help="A checkout of https://github.com/fritzing/fritzing-parts or the parts directory of a Fritzing user.")
+    parser.add_argument("--lookup", action="append", default=[], metavar="MODULE_ID", help="Print the prototype of this part. (may be given more than once)")
+    parser.add_argument("-v", "--verbose", action="count", default=0, help="-v -vv- -vvv increase output verbosity")
+    parser.add_argument('-V', '--version', action='version', version="%(prog)s " + str(VERSION))
+
+    args = parser.parse_args()
+    lib.args = args
+
+    if not args.PARTS_DIRS and not args.lookup:
+        parser.error("PARTS_DIR or --lookup is required")
+
+    with PartsIndex(args.INDEX) as index:
+        for partsDir in args.PARTS_DIRS:
+            stats = index.update(partsDir)
+            lib.printConsole("'{}': {indexed} indexed, {unchanged} unchanged, {removed} removed.".format(partsDir, **stats), 0)
+        for moduleIdRef in args.lookup:
+            lib.printConsole("{}: {!r}".format(moduleIdRef, index.lookup(moduleIdRef)), 0)
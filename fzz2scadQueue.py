@@ -0,0 +1,300 @@
+'''
+    fzz2scadQueue.py from fzz2scad: Spreads the conversion of many Fritzing
+    Sketches over several workers (e.g. build machines that share a
+    directory).
+
+    Copyright (C) 2015  Hauke Thorenz <htho@thorenz.net>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+    The spool directory:
+        queue/JOB.fzz       waiting jobs
+        claimed/JOB.WORKER.fzz  jobs a worker is working on
+        done/JOB.fzz        finished jobs
+        failed/JOB.fzz      jobs whose conversion failed
+        results/JOB.json    the result record of each finished or failed job
+        out/JOB/            the output of each job (JOB.scad, ...)
+
+    A worker claims a job by renaming it from queue/ to a name of its own
+    in claimed/. Only one worker can win that rename. While it works, it
+    touches the claimed file. A claimed file that was not touched for
+    --stale-after seconds (by the clock of the file server) belongs to a
+    dead worker and is put back into queue/. A worker only files a job
+    under done/ or failed/ if its claim is still there, the output is
+    written to a directory of its own and moved to out/JOB/ after that.
+'''
+import argparse
+import json
+import multiprocessing
+import os
+import re
+import shlex
+import shutil
+import socket
+import subprocess
+import sys
+import threading
+import time
+import fzz2scadLib as lib
+
+VERSION = 0.1
+
+SPOOL_DIRS = ("queue", "claimed", "done", "failed", "results", "out")
+
+FZZ2SCAD = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fzz2scad.py")
+
+
+def spoolPath(spoolDir, *names):
+    return os.path.join(spoolDir, *names)
+
+
+def initSpool(spoolDir):
+    for d in SPOOL_DIRS:
+        os.makedirs(spoolPath(spoolDir, d), exist_ok=True)
+
+
+def jobName(fzzFileName):
+    return os.path.basename(fzzFileName).rsplit(".", 1)[0]
+
+
+def workerToken(workerId):
+    """The workerId as it is used in file names (no dots)."""
+    return re.sub("[^A-Za-z0-9_-]", "_", workerId)
+
+
+def claimedFileName(spoolDir, name, workerId):
+    return spoolPath(spoolDir, "claimed", "{}.{}.fzz".format(name, workerToken(workerId)))
+
+
+def claimedJobs(spoolDir):
+    """return dict(file name in claimed/: job name)"""
+    ret = dict()
+    for fileName in os.listdir(spoolPath(spoolDir, "claimed")):
+        if fileName.endswith(".fzz") and not fileName.startswith(".") and fileName.count(".") >= 2:
+            ret[fileName] = fileName.rsplit(".", 2)[0]
+    return ret
+
+
+def serverTime(spoolDir, workerId):
+    """The time of the file server of the spool. The mtimes of the files
+    are set by its clock, so staleness is measured with it, not with the
+    (maybe skewed) clock of this machine."""
+    probe = spoolPath(spoolDir, ".clock.{}".format(workerToken(workerId)))
+    with open(probe, 'a'):
+        pass
+    os.utime(probe)  # without times, the server sets its own time
+    return os.stat(probe).st_mtime
+
+
+def submitJob(spoolDir, fzzFileName):
+    """Copy the sketch into the queue. It is copied to a temporary name
+    first, so workers never see a half copied job.
+    return the name of the job"""
+    initSpool(spoolDir)
+    name = jobName(fzzFileName)
+    if os.path.exists(spoolPath(spoolDir, "queue", name + ".fzz")) or name in claimedJobs(spoolDir).values():
+        raise FileExistsError("The job '{}' is already queued or claimed.".format(name))
+    tmpFileName = spoolPath(spoolDir, "queue", ".{}.{}.tmp".format(name, os.getpid()))
+    shutil.copyfile(fzzFileName, tmpFileName)
+    os.replace(tmpFileName, spoolPath(spoolDir, "queue", name + ".fzz"))
+    return name
+
+
+def recoverStaleClaims(spoolDir, staleAfter, workerId):
+    """Put the claimed jobs that were not touched for staleAfter seconds
+    (see serverTime()) back into the queue.
+    return the names of the recovered jobs"""
+    ret = list()
+    now = serverTime(spoolDir, workerId)
+    for fileName, name in sorted(claimedJobs(spoolDir).items()):
+        claimedFile = spoolPath(spoolDir, "claimed", fileName)
+        try:
+            if now - os.stat(claimedFile).st_mtime < staleAfter:
+                continue
+            os.rename(claimedFile, spoolPath(spoolDir, "queue", name + ".fzz"))
+        except FileNotFoundError:
+            continue  # finished or recovered by someone else
+        lib.printConsole("WARNING: Recovered the stale job '{}'.", 1, fileName)
+        ret.append(name)
+    return ret
+
+
+def claimJob(spoolDir, workerId):
+    """Claim the next job of the queue (see claimedFileName()).
+    return the name of the job or None if the queue is empty"""
+    for fileName in sorted(os.listdir(spoolPath(spoolDir, "queue"))):
+        if not fileName.endswith(".fzz") or fileName.startswith("."):
+            continue
+        queuedFile = spoolPath(spoolDir, "queue", fileName)
+        try:
+            # touch before the rename, so the claim is never taken as stale
+            os.utime(queuedFile)
+            os.rename(queuedFile, claimedFileName(spoolDir, fileName[:-len(".fzz")], workerId))
+        except FileNotFoundError:
+            continue  # an other worker was faster
+        return fileName[:-len(".fzz")]
+    return None
+
+
+class _Heartbeat:
+    """Touches the claimed file of a job every interval seconds, so it is
+    not taken as stale."""
+
+    def __init__(self, fileName, interval):
+        self.fileName = fileName
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                os.utime(self.fileName)
+            except FileNotFoundError:
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *excInfo):
+        self._stopped.set()
+        self._thread.join()
+
+
+def runJob(spoolDir, name, workerId, extraArgs=(), staleAfter=600):
+    """Convert the claimed job with fzz2scad.py and file it under done/
+    or failed/. The output goes to out/JOB/, relative paths in extraArgs
+    are relative to that directory. If the claim was lost (see
+    recoverStaleClaims()) in the meantime, nothing is filed.
+    return the result record"""
+    claimedFile = claimedFileName(spoolDir, name, workerId)
+    # an other worker may work on the same job after a lost claim, so each has its own directory
+    workDir = spoolPath(spoolDir, "out", ".{}.{}.tmp".format(name, workerToken(workerId)))
+    outDir = spoolPath(spoolDir, "out", name)
+    shutil.rmtree(workDir, ignore_errors=True)
+    os.makedirs(workDir)
+    command = [sys.executable, FZZ2SCAD, os.path.abspath(claimedFile), "-o", name + ".scad", "--override"] + list(extraArgs)
+
+    record = {"job": name, "worker": workerId, "command": command, "started": time.time()}
+    lib.printConsole("INFO: {} is working on '{}'.", 1, workerId, name)
+    with _Heartbeat(claimedFile, staleAfter / 4):
+        completed = subprocess.run(command, cwd=workDir, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL)
+    record["finished"] = time.time()
+    record["duration"] = record["finished"] - record["started"]
+    record["returncode"] = completed.returncode
+    record["output"] = completed.stdout.decode("utf-8", "replace")
+    record["status"] = "done" if completed.returncode == 0 else "failed"
+    record["outputs"] = sorted(os.listdir(workDir))
+
+    try:
+        # the claim is still ours if it is still there under our name
+        os.rename(claimedFile, spoolPath(spoolDir, record["status"], name + ".fzz"))
+    except FileNotFoundError:
+        # the claim was taken as stale, an other worker does the job again
+        shutil.rmtree(workDir, ignore_errors=True)
+        record["status"] = "lost"
+        lib.printConsole("WARNING: {} lost the claim of '{}'.", 1, workerId, name)
+        return record
+    if os.path.exists(outDir):
+        oldDir = workDir + ".old"
+        os.rename(outDir, oldDir)
+        shutil.rmtree(oldDir)
+    os.rename(workDir, outDir)
+    lib.writeFileIfChanged(spoolPath(spoolDir, "results", name + ".json"), json.dumps(record, sort_keys=True, indent=4) + "\n")
+    lib.printConsole("{}: {} ({:.2f}s, {})".format(name, record["status"], record["duration"], workerId), 0)
+    return record
+
+
+def work(spoolDir, workerId=None, extraArgs=(), staleAfter=600, poll=2, exitWhenEmpty=False):
+    """Claim and run jobs until the queue is empty (exitWhenEmpty) or
+    forever.
+    return the number of jobs that failed"""
+    if workerId is None:
+        workerId = "{}:{}".format(socket.gethostname(), os.getpid())
+    initSpool(spoolDir)
+    failed = 0
+    while True:
+        recoverStaleClaims(spoolDir, staleAfter, workerId)
+        name = claimJob(spoolDir, workerId)
+        if name is None:
+            if exitWhenEmpty and not claimedJobs(spoolDir):
+                return failed
+            time.sleep(poll)
+            continue
+        if runJob(spoolDir, name, workerId, extraArgs, staleAfter)["status"] == "failed":
+            failed = failed + 1
+
+
+def _workProcess(spoolDir, extraArgs, staleAfter, poll, exitWhenEmpty, verbose):
+    lib.args = argparse.Namespace(verbose=verbose)
+    sys.exit(1 if work(spoolDir, None, extraArgs, staleAfter, poll, exitWhenEmpty) else 0)
+
+
+def spoolStatus(spoolDir):
+    """return dict(state: [job, ...]) of the states queue, claimed, done and failed."""
+    ret = dict()
+    for d in ("queue", "claimed", "done", "failed"):
+        if d == "claimed":
+            ret[d] = sorted(claimedJobs(spoolDir).values())
+        else:
+            ret[d] = sorted([f[:-len(".fzz")] for f in os.listdir(spoolPath(spoolDir, d)) if f.endswith(".fzz") and not f.startswith(".")])
+    return ret
+
+# ####################### SCRIPT PART ########################
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Spreads the conversion of many Fritzing Sketches over several workers that share the SPOOL directory.")
+    parser.add_argument("-v", "--verbose", action="count", default=0, help="-v -vv- -vvv increase output verbosity")
+    parser.add_argument('-V', '--version', action='version', version="%(prog)s " + str(VERSION))
+    subparsers = parser.add_subparsers(dest="command")
+
+    submitParser = subparsers.add_parser("submit", help="Put sketches into the queue.")
+    submitParser.add_argument("SPOOL", help="The spool directory.")
+    submitParser.add_argument("INPUT_FILES", nargs="+", help="The Fritzing Sketch Files (.fzz).")
+
+    workParser = subparsers.add_parser("work", help="Claim and convert jobs from the queue.")
+    workParser.add_argument("SPOOL", help="The spool directory.")
+    workParser.add_argument("-n", "--processes", type=int, default=1, help="The number of worker processes on this machine. (default: 1)")
+    workParser.add_argument("--args", default="", help="Additional arguments for fzz2scad.py (e.g. '--multmatrix --stl').")
+    workParser.add_argument("--stale-after", type=float, default=600, metavar="SECONDS", help="Put claimed jobs that were not touched for SECONDS back into the queue. (default: 600)")
+    workParser.add_argument("--poll", type=float, default=2, metavar="SECONDS", help="Look for new jobs every SECONDS. (default: 2)")
+    workParser.add_argument("--exit-when-empty", action="store_true", help="Exit when there are no jobs left instead of waiting for new ones.")
+
+    statusParser = subparsers.add_parser("status", help="List the jobs of each state.")
+    statusParser.add_argument("SPOOL", help="The spool directory.")
+
+    args = parser.parse_args()
+    lib.args = args
+
+    if args.command == "submit":
+        for fzzFileName in args.INPUT_FILES:
+            lib.printConsole("Submitted '{}'.".format(submitJob(args.SPOOL, fzzFileName)), 0)
+    elif args.command == "work":
+        extraArgs = shlex.split(args.args)
+        if args.processes <= 1:
+            sys.exit(1 if work(args.SPOOL, None, extraArgs, args.stale_after, args.poll, args.exit_when_empty) else 0)
+        initSpool(args.SPOOL)
+        processes = [multiprocessing.Process(target=_workProcess, args=(args.SPOOL, extraArgs, args.stale_after, args.poll, args.exit_when_empty, args.verbose)) for i in range(args.processes)]
+        for p in processes:
+            p.start()
+        for p in processes:
+            p.join()
+        sys.exit(1 if any([p.exitcode != 0 for p in processes]) else 0)
+    elif args.command == "status":
+        initSpool(args.SPOOL)
+        for state, jobs in spoolStatus(args.SPOOL).items():
+            lib.printConsole("{}: {}".format(state, " ".join(jobs)), 0)
+    else:
+        parser.print_help()
@@ -0,0 +1,162 @@
+'''
+    fzz2scadRender.py from fzz2scad: Renders the modules created by
+    fzz2scad in parallel with OpenSCAD and caches the results.
+
+    Copyright (C) 2015  Hauke Thorenz <htho@thorenz.net>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import concurrent.futures
+import hashlib
+import os
+import shlex
+import subprocess
+import fzz2scadLib as lib
+
+DEFAULT_EXECUTABLE = "openscad"
+
+
+def createDriverString(moduleName, moduleString, exportString, libraryFiles):
+    """Create the content of a .scad file that renders only the given
+    module. The library files are included."""
+    driverTemplate = """/**
+ * @filename: {module_name}.scad
+ * @created-with: fzz2scad v{version!s} (https://github.com/htho/fzz2scad)
+ */
+{includes}
+
+{export}
+
+{module}
+
+{module_name}();
+"""
+    values = dict()
+    values['version'] = lib.VERSION
+    values['module_name'] = moduleName
+    values['includes'] = "\n".join(["include <{}>".format(os.path.abspath(f)) for f in libraryFiles])
+    values['export'] = exportString
+    values['module'] = moduleString
+    return driverTemplate.format(**values)
+
+
+def _findScadFile(name, includingDir):
+    """Find the file of 'include <name>' like OpenSCAD does: next to the
+    including file, then in the directories of OPENSCADPATH.
+    return the path or None"""
+    for directory in [includingDir] + [d for d in os.environ.get("OPENSCADPATH", "").split(os.pathsep) if d]:
+        fileName = os.path.join(directory, name)
+        if os.path.isfile(fileName):
+            return os.path.normpath(fileName)
+    return None
+
+
+def libraryDependencies(libraryFiles):
+    """The library files and all files they include or use (transitively).
+    Files that can't be found (e.g. in the library directory of the
+    OpenSCAD installation) are left out.
+    return a list of files, each once, in the order they were found"""
+    import re
+    statement = re.compile(r"^\s*(?:include|use)\s*<([^>]+)>", re.MULTILINE)
+    ret = list()
+    todo = [os.path.normpath(f) for f in libraryFiles]
+    while todo:
+        fileName = todo.pop(0)
+        if fileName in ret:
+            continue
+        ret.append(fileName)
+        with open(fileName, 'r', encoding="utf-8", errors="replace") as f:
+            content = f.read()
+        for name in statement.findall(content):
+            found = _findScadFile(name.strip(), os.path.dirname(fileName))
+            if found is None:
+                lib.printConsole("INFO: Can't find '{}' (used by '{}'), changes to it are not noticed.", 2, name, fileName)
+            else:
+                todo.append(found)
+    return ret
+
+
+def cacheKey(driverString, libraryFiles):
+    """The hash of the driver and the content of the included files
+    (libraryFiles: see libraryDependencies())."""
+    h = hashlib.sha256()
+    h.update(driverString.encode("utf-8"))
+    for libraryFile in libraryFiles:
+        with open(libraryFile, 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+def renderDriver(executable, driverFile, stlFile):
+    """Run the OpenSCAD compatible executable to render driverFile to
+    stlFile. executable may contain arguments (e.g. 'xvfb-run openscad').
+    return (returncode, output), returncode is 127 if the executable can't be run"""
+    command = shlex.split(executable) + ["-o", stlFile, driverFile]
+    lib.printConsole("INFO: Running {}", 2, command)
+    try:
+        completed = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    except OSError as err:
+        return (127, "ERROR: Can't run '{}': {}".format(executable, err))
+    return (completed.returncode, completed.stdout.decode("utf-8", "replace"))
+
+
+def _renderModule(moduleName, driverString, key, outDir, cacheDir, executable):
+    stlFile = os.path.join(outDir, moduleName + ".stl")
+    driverFile = os.path.join(outDir, moduleName + ".scad")
+    lib.writeFileIfChanged(driverFile, driverString)
+
+    cachedFile = os.path.join(cacheDir, key + ".stl")
+    if os.path.exists(cachedFile):
+        lib.copyFileIfChanged(cachedFile, stlFile)
+        return (moduleName, "cached", stlFile, "")
+
+    # render into the cache first, so an aborted run does not leave a broken cache entry.
+    tmpFile = cachedFile + ".{}.tmp.stl".format(os.getpid())
+    returncode, output = renderDriver(executable, driverFile, tmpFile)
+    if returncode != 0 or not os.path.exists(tmpFile):
+        if os.path.exists(tmpFile):
+            os.remove(tmpFile)
+        return (moduleName, "failed", None, output)
+    os.replace(tmpFile, cachedFile)
+    lib.copyFileIfChanged(cachedFile, stlFile)
+    return (moduleName, "rendered", stlFile, output)
+
+
+def renderModules(moduleStrings, exportString, libraryFiles, outDir, executable=DEFAULT_EXECUTABLE, jobs=None, cacheDir=None):
+    """Render each module (dict(moduleName: moduleString)) to
+    outDir/moduleName.stl. A driver file (outDir/moduleName.scad) is
+    written for each module. At most jobs (default: number of CPUs)
+    renders run at the same time. Modules whose driver and included
+    files (see libraryDependencies()) did not change are copied from
+    cacheDir (default: outDir/.cache).
+    return a list of (moduleName, 'cached'|'rendered'|'failed', stlFile, output)"""
+    if cacheDir is None:
+        cacheDir = os.path.join(outDir, ".cache")
+    os.makedirs(outDir, exist_ok=True)
+    os.makedirs(cacheDir, exist_ok=True)
+
+    dependencies = libraryDependencies(libraryFiles)
+    ret = list()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs or os.cpu_count() or 1) as executor:
+        futures = list()
+        for moduleName, moduleString in sorted(moduleStrings.items()):
+            driverString = createDriverString(moduleName, moduleString, exportString, libraryFiles)
+            key = cacheKey(driverString, dependencies)
+            futures.append(executor.submit(_renderModule, moduleName, driverString, key, outDir, cacheDir, executable))
+        for future in futures:
+            result = future.result()
+            lib.printConsole("INFO: Module '{}': {}", 1, result[0], result[1])
+            ret.append(result)
+    return ret
@@ -0,0 +1,398 @@
+'''
+    fzz2scadStl.py from fzz2scad: Creates printable frontplates (binary STL)
+    directly from the parts in a Fritzing Sketch - without OpenSCAD.
+
+    Copyright (C) 2015  Hauke Thorenz <htho@thorenz.net>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import struct
+import fzz2scadLib as lib
+import fzz2scadGeometry as geometry
+
+# NumPy is optional. It only speeds up writing large meshes.
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# ####################### MESH ########################
+
+
+class FrontplateError(ValueError):
+    pass
+
+
+
+class Mesh:
+    """A triangle mesh. Triangles are counter clockwise when seen from
+    the outside."""
+
+    def __init__(self):
+        self.vertices = list()
+        self.triangles = list()
+
+    def addVertex(self, xyz):
+        self.vertices.append(tuple(float(v) for v in xyz))
+        return len(self.vertices) - 1
+
+    def addTriangle(self, a, b, c):
+        self.triangles.append((a, b, c))
+
+    def extend(self, other):
+        offset = len(self.vertices)
+        self.vertices.extend(other.vertices)
+        for a, b, c in other.triangles:
+            self.addTriangle(a + offset, b + offset, c + offset)
+
+    def bounds(self):
+        """return ((xMin, yMin, zMin), (xMax, yMax, zMax))"""
+        if not self.vertices:
+            return None
+        return (tuple(min(v[i] for v in self.vertices) for i in range(3)), tuple(max(v[i] for v in self.vertices) for i in range(3)))
+
+    def asBinaryStl(self, name=""):
+        """get the mesh as binary STL (bytes)."""
+        header = ("fzz2scad v{} {}".format(lib.VERSION, name)).encode("ascii", "replace")[:80].ljust(80, b" ")
+        if numpy is not None:
+            return header + self._binaryStlTrianglesNumpy()
+        return header + self._binaryStlTriangles()
+
+    def _binaryStlTriangles(self):
+        ret = [struct.pack("<I", len(self.triangles))]
+        for a, b, c in self.triangles:
+            va, vb, vc = self.vertices[a], self.vertices[b], self.vertices[c]
+            u = (vb[0] - va[0], vb[1] - va[1], vb[2] - va[2])
+            v = (vc[0] - va[0], vc[1] - va[1], vc[2] - va[2])
+            n = (u[1] * v[2] - u[2] * v[1], u[2] * v[0] - u[0] * v[2], u[0] * v[1] - u[1] * v[0])
+            length = (n[0] * n[0] + n[1] * n[1] + n[2] * n[2]) ** 0.5
+            if length > 0:
+                n = (n[0] / length, n[1] / length, n[2] / length)
+            ret.append(struct.pack("<12fH", n[0], n[1], n[2], va[0], va[1], va[2], vb[0], vb[1], vb[2], vc[0], vc[1], vc[2], 0))
+        return b"".join(ret)
+
+    def _binaryStlTrianglesNumpy(self):
+        dtype = numpy.dtype([("normal", "<f4", (3,)), ("vertices", "<f4", (3, 3)), ("attribute", "<u2")])
+        data = numpy.zeros(len(self.triangles), dtype=dtype)
+        if self.triangles:
+            v = numpy.asarray(self.vertices, dtype=numpy.float64)[numpy.asarray(self.triangles, dtype=numpy.int64)]
+            n = numpy.cross(v[:, 1] - v[:, 0], v[:, 2] - v[:, 0])
+            length = numpy.linalg.norm(n, axis=1)
+            length[length == 0] = 1
+            data["normal"] = n / length[:, None]
+            data["vertices"] = v
+        return struct.pack("<I", len(self.triangles)) + data.tobytes()
+
+    def writeBinaryStl(self, fileName, name=""):
+        """Write the binary STL (see lib.writeFileIfChanged()).
+        return True if the file was written, False if it was unchanged."""
+        return lib.writeFileIfChanged(fileName, self.asBinaryStl(name))
+
+
+def readStl(fileName):
+    """Read a binary or ASCII STL into a Mesh. Equal vertices are merged."""
+    with open(fileName, 'rb') as f:
+        data = f.read()
+    mesh = Mesh()
+    indices = dict()
+
+    def vertex(xyz):
+        if xyz not in indices:
+            indices[xyz] = mesh.addVertex(xyz)
+        return indices[xyz]
+
+    if len(data) >= 84 and len(data) == 84 + 50 * struct.unpack_from("<I", data, 80)[0]:
+        for i in range(struct.unpack_from("<I", data, 80)[0]):
+            v = struct.unpack_from("<9f", data, 84 + 50 * i + 12)
+            mesh.addTriangle(vertex(v[0:3]), vertex(v[3:6]), vertex(v[6:9]))
+    else:
+        corners = list()
+        for line in data.decode("ascii", "replace").splitlines():
+            words = line.split()
+            if words and words[0] == "vertex":
+                corners.append(vertex(tuple(float(w) for w in words[1:4])))
+                if len(corners) == 3:
+                    mesh.addTriangle(*corners)
+                    corners = list()
+    return mesh
+
+# ####################### TRIANGULATION ########################
+
+
+def _cross(o, a, b):
+    return (a[0] - o[0]) * (b[1] - o[1]) - (a[1] - o[1]) * (b[0] - o[0])
+
+
+def _pointInTriangle(p, a, b, c):
+    """True if p is inside or on the edge of the counter clockwise
+    triangle abc."""
+    return _cross(a, b, p) >= 0 and _cross(b, c, p) >= 0 and _cross(c, a, p) >= 0
+
+
+def _bridgeHole(points, polygon, hole):
+    """Merge the clockwise hole into the counter clockwise polygon by
+    connecting the rightmost vertex of the hole with a visible vertex of
+    the polygon. polygon and hole are lists of indices into points.
+    (David Eberly: Triangulation by Ear Clipping)"""
+    m = max(range(len(hole)), key=lambda i: (points[hole[i]][0], -points[hole[i]][1]))
+    mx, my = points[hole[m]][0:2]
+
+    # cast a ray from M to the right and find the closest edge it hits.
+    # Only the upwards edges of a counter clockwise polygon face M.
+    bestX = None
+    bestIndex = None
+    for i in range(len(polygon)):
+        a = points[polygon[i]]
+        b = points[polygon[(i + 1) % len(polygon)]]
+        if a[1] >= b[1] or a[1] > my or b[1] < my:
+            continue
+        x = a[0] + (my - a[1]) * (b[0] - a[0]) / (b[1] - a[1])
+        if x >= mx and (bestX is None or x < bestX):
+            bestX = x
+            if a[1] == my:
+                bestIndex = i
+            elif b[1] == my:
+                bestIndex = (i + 1) % len(polygon)
+            else:
+                # the endpoint of the edge with the larger x is visible
+                bestIndex = i if a[0] > b[0] else (i + 1) % len(polygon)
+    if bestIndex is None:
+        raise ValueError("A hole is not inside the outline.")
+
+    # a reflex vertex inside the triangle (M, I, P) might hide P
+    p = points[polygon[bestIndex]]
+    intersection = (bestX, my)
+    triangle = (points[hole[m]], intersection, p) if _cross(points[hole[m]], intersection, p) >= 0 else (points[hole[m]], p, intersection)
+    tMin = (min(t[0] for t in triangle), min(t[1] for t in triangle))
+    tMax = (max(t[0] for t in triangle), max(t[1] for t in triangle))
+    bestAngle = None
+    for i in range(len(polygon) if p[1] != my else 0):
+        r = points[polygon[i]]
+        if r[0] < tMin[0] or r[0] > tMax[0] or r[1] < tMin[1] or r[1] > tMax[1]:
+            continue
+        if r == p or i == bestIndex:
+            continue
+        prev = points[polygon[i - 1]]
+        nxt = points[polygon[(i + 1) % len(polygon)]]
+        if _cross(prev, r, nxt) < 0 and _pointInTriangle(r, *triangle):
+            angle = (abs(r[1] - my) / max(r[0] - mx, 1e-12), r[0] - mx)
+            if bestAngle is None or angle < bestAngle:
+                bestAngle = angle
+                bestIndex = i
+
+    return polygon[:bestIndex + 1] + hole[m:] + hole[:m + 1] + polygon[bestIndex:]
+
+
+def triangulate(points, outline, holes=()):
+    """Triangulate the counter clockwise polygon outline (indices into
+    points) with the given clockwise holes.
+    return a list of counter clockwise triangles (indices into points)."""
+    polygon = list(outline)
+    for hole in sorted(holes, key=lambda h: -max(points[i][0] for i in h)):
+        polygon = _bridgeHole(points, polygon, list(hole))
+
+    n = len(polygon)
+    xy = [points[i][0:2] for i in polygon]
+    prev = [(k - 1) % n for k in range(n)]
+    nxt = [(k + 1) % n for k in range(n)]
+
+    # Only reflex vertices can be inside an ear. They are kept in a grid
+    # so an ear only has to be tested against the reflex vertices nearby.
+    xMin, xMax = min(p[0] for p in xy), max(p[0] for p in xy)
+    yMin, yMax = min(p[1] for p in xy), max(p[1] for p in xy)
+    cellSize = max(xMax - xMin, yMax - yMin, 1e-9) / max(1, int(n ** 0.5))
+    grid = dict()
+
+    def cell(p):
+        return (int((p[0] - xMin) / cellSize), int((p[1] - yMin) / cellSize))
+
+    def isReflex(k):
+        return _cross(xy[prev[k]], xy[k], xy[nxt[k]]) < 0
+
+    reflex = set()
+    for k in range(n):
+        if isReflex(k):
+            reflex.add(k)
+            grid.setdefault(cell(xy[k]), set()).add(k)
+
+    def isEar(k):
+        a, b, c = xy[prev[k]], xy[k], xy[nxt[k]]
+        if _cross(a, b, c) <= 0:
+            return False
+        c0 = cell((min(a[0], b[0], c[0]), min(a[1], b[1], c[1])))
+        c1 = cell((max(a[0], b[0], c[0]), max(a[1], b[1], c[1])))
+        for cx in range(c0[0], c1[0] + 1):
+            for cy in range(c0[1], c1[1] + 1):
+                for j in grid.get((cx, cy), ()):
+                    p = xy[j]
+                    if p == a or p == b or p == c:
+                        continue
+                    if _pointInTriangle(p, a, b, c):
+                        return False
+        return True
+
+    ret = list()
+    k = 0
+    remaining = n
+    misses = 0
+    while remaining > 3:
+        if misses > remaining:
+            # Only degenerated (collinear) vertices are left.
+            if _cross(xy[prev[k]], xy[k], xy[nxt[k]]) > 0:
+                ret.append((polygon[prev[k]], polygon[k], polygon[nxt[k]]))
+        elif not isEar(k):
+            misses = misses + 1
+            k = nxt[k]
+            continue
+        else:
+            ret.append((polygon[prev[k]], polygon[k], polygon[nxt[k]]))
+        misses = 0
+        p, q = prev[k], nxt[k]
+        nxt[p] = q
+        prev[q] = p
+        remaining = remaining - 1
+        if k in reflex:
+            reflex.discard(k)
+            grid[cell(xy[k])].discard(k)
+        for j in (p, q):
+            if j in reflex and not isReflex(j):
+                reflex.discard(j)
+                grid[cell(xy[j])].discard(j)
+        k = p
+    if _cross(xy[prev[k]], xy[k], xy[nxt[k]]) > 0:
+        ret.append((polygon[prev[k]], polygon[k], polygon[nxt[k]]))
+    return ret
+
+# ####################### EXTRUSION ########################
+
+
+def extrudeWithHoles(outline, holes, zBottom, thickness):
+    """Extrude the counter clockwise 2D outline from zBottom by thickness
+    and cut the holes into it from the top.
+    holes is a list of (outline, depth). depth=None (or >= thickness)
+    means that the hole goes through the plate.
+    The holes must not overlap each other or the edge of the outline."""
+    mesh = Mesh()
+    zTop = zBottom + thickness
+
+    top = list()
+    bottom = list()
+    for xy in outline:
+        top.append(mesh.addVertex((xy[0], xy[1], zTop)))
+    for xy in outline:
+        bottom.append(mesh.addVertex((xy[0], xy[1], zBottom)))
+
+    topHoles = list()
+    bottomHoles = list()
+    for holeOutline, depth in holes:
+        holeOutline = list(holeOutline)
+        if geometry.polygonArea(holeOutline) < 0:
+            holeOutline.reverse()
+        through = depth is None or depth >= thickness
+        holeTop = list()
+        holeBottom = list()
+        for xy in holeOutline:
+            holeTop.append(mesh.addVertex((xy[0], xy[1], zTop)))
+        for xy in holeOutline:
+            holeBottom.append(mesh.addVertex((xy[0], xy[1], zBottom if through else zTop - depth)))
+
+        # the walls of the hole face inwards
+        n = len(holeOutline)
+        for i in range(n):
+            j = (i + 1) % n
+            mesh.addTriangle(holeBottom[j], holeBottom[i], holeTop[i])
+            mesh.addTriangle(holeBottom[j], holeTop[i], holeTop[j])
+
+        # holes are clockwise in the faces
+        topHoles.append(list(reversed(holeTop)))
+        if through:
+            bottomHoles.append(list(reversed(holeBottom)))
+        else:
+            # the floor of a blind hole faces upwards
+            for a, b, c in triangulate(mesh.vertices, holeBottom):
+                mesh.addTriangle(a, b, c)
+
+    # Top face
+    for a, b, c in triangulate(mesh.vertices, top, topHoles):
+        mesh.addTriangle(a, b, c)
+
+    # Bottom face (facing downwards)
+    for a, b, c in triangulate(mesh.vertices, bottom, bottomHoles):
+        mesh.addTriangle(a, c, b)
+
+    # Outer walls
+    n = len(outline)
+    for i in range(n):
+        j = (i + 1) % n
+        mesh.addTriangle(bottom[i], bottom[j], top[j])
+        mesh.addTriangle(bottom[i], top[j], top[i])
+
+    return mesh
+
+# ####################### FRONTPLATES ########################
+
+
+def createFrontplateMesh(moduleName, moduleParts, configuration, cutoutTable=dict(), thickness=None, fn=geometry.DEFAULT_FN):
+    """Create the frontplate of a module: The outline of each PCB in the
+    module is extruded by thickness (default: its 'pcbHeight') and the
+    holes and cut-outs (see CUTOUTS.md) are cut into it.
+    Raises FrontplateError if holes or cut-outs overlap each other or the
+    edge of a PCB.
+    return a Mesh or None if there is no PCB in the module."""
+    footprints = geometry.getModuleFootprints(moduleName, moduleParts, configuration, cutoutTable, thickness, fn)
+    if not footprints["boards"]:
+        lib.printConsole("WARNING: There is no PCB in the module '{}'. No frontplate is created.", 1, moduleName)
+        return None
+
+    cutoutsPerBoard = [list() for board in footprints["boards"]]
+    for cutout in footprints["cutouts"]:
+        for i, board in enumerate(footprints["boards"]):
+            if geometry.pointInPolygon(cutout["center"], board["outline"]):
+                cutoutsPerBoard[i].append(cutout)
+                break
+        else:
+            lib.printConsole("WARNING: The {} of '{}' is not on a PCB of the module '{}'.", 1, cutout["kind"], cutout["title"], moduleName)
+
+    problems = list()
+    for board, cutouts in zip(footprints["boards"], cutoutsPerBoard):
+        problems = problems + checkCutouts(moduleName, board, cutouts)
+    if problems:
+        raise FrontplateError("The frontplate of the module '{}' would not be a closed mesh:\n{}".format(moduleName, lib.txt_prefix_each_line("\n".join(problems), "    ")))
+
+    mesh = Mesh()
+    for board, cutouts in zip(footprints["boards"], cutoutsPerBoard):
+        lib.printConsole("INFO: Creating the frontplate for '{}' with {} holes and cut-outs.", 2, board["title"], len(cutouts))
+        mesh.extend(extrudeWithHoles(board["outline"], [(cutout["outline"], cutout["depth"]) for cutout in cutouts], board["z"], board["thickness"]))
+    return mesh
+
+
+def checkCutouts(moduleName, board, cutouts):
+    """Find the holes and cut-outs that overlap each other or the edge of
+    the board (see extrudeWithHoles()).
+    return a list of strings"""
+    ret = list()
+    for cutout in cutouts:
+        # its center is on the board, so it is either inside or crosses the edge
+        if geometry.polygonsCross(cutout["outline"], board["outline"]) or geometry.pointInPolygon(board["outline"][0], cutout["outline"]):
+            ret.append("The {} of '{}' overlaps the edge of '{}'.".format(cutout["kind"], cutout["title"], board["title"]))
+    cutouts = sorted(cutouts, key=lambda cutout: min(x for x, y in cutout["outline"]))
+    for i, a in enumerate(cutouts):
+        xMax = max(x for x, y in a["outline"])
+        for b in cutouts[i + 1:]:
+            if min(x for x, y in b["outline"]) > xMax:
+                break
+            if geometry.polygonsOverlap(a["outline"], b["outline"]):
+                ret.append("The {} of '{}' and the {} of '{}' overlap.".format(a["kind"], a["title"], b["kind"], b["title"]))
+    return ret
@@ -0,0 +1,148 @@
+'''
+    fzzdiff.py from fzz2scad: Compares the resolved parts of two Fritzing
+    Sketches (or snapshots of them).
+
+    Copyright (C) 2015  Hauke Thorenz <htho@thorenz.net>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+import argparse
+import hashlib
+import json
+import os
+import sys
+import fzz2scadLib as lib
+
+VERSION = 0.1
+
+# The fields of a part record and how a change of them is reported.
+changeKinds = [
+    ("positionAbsolute", "moved"),
+    ("rotation", "rotation"),
+    ("bottom", "bottom"),
+    ("attributes", "attributes"),
+    ("parameters", "parameters"),
+    ("modules", "modules"),
+    ("moduleIdRef", "moduleIdRef"),
+    ("kind", "kind")
+]
+
+
+def createSnapshot(fzzFileName, moduleNameOrPrefix=None, precision=6):
+    """Resolve the parts of the sketch and put them into modules. Parts
+    that are in no module are kept as well.
+    return dict('fzz2scad', 'source', 'moduleNameOrPrefix', 'parts': dict(title: record))"""
+    if moduleNameOrPrefix is None:
+        moduleNameOrPrefix = str(os.path.split(fzzFileName)[-1]).split(".")[0]
+    xmlRoot, configuration, parts = lib.loadSketch(fzzFileName, moduleNameOrPrefix)
+    # splitPartsToModules() takes the parts out of the dict
+    modules = lib.splitPartsToModules(xmlRoot, dict(parts), configuration['modules'])
+    return {"fzz2scad": lib.VERSION, "source": fzzFileName, "moduleNameOrPrefix": moduleNameOrPrefix, "parts": lib.getPartRecords(parts, modules, precision)}
+
+
+def loadSnapshot(fileName, moduleNameOrPrefix=None, precision=6):
+    """Load a snapshot (.json) or create it from a sketch (.fzz)."""
+    if fileName.endswith(".json"):
+        with open(fileName, 'r') as f:
+            snapshot = json.load(f)
+        # older snapshots have a single 'module'
+        for record in snapshot["parts"].values():
+            if "modules" not in record:
+                record["modules"] = [record.pop("module")]
+        return snapshot
+    return createSnapshot(fileName, moduleNameOrPrefix, precision)
+
+
+def recordHash(record):
+    return hashlib.sha256(json.dumps(record, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def diffSnapshots(old, new):
+    """Compare the parts of two snapshots.
+    return dict('added': [title], 'removed': [title],
+                'changed': dict(title: dict(kind: [oldValue, newValue])))"""
+    oldHashes = {title: recordHash(record) for title, record in old["parts"].items()}
+    newHashes = {title: recordHash(record) for title, record in new["parts"].items()}
+
+    ret = {"added": list(), "removed": list(), "changed": dict()}
+    for title in sorted(newHashes.keys() - oldHashes.keys()):
+        ret["added"].append(title)
+    for title in sorted(oldHashes.keys() - newHashes.keys()):
+        ret["removed"].append(title)
+    for title in sorted(oldHashes.keys() & newHashes.keys()):
+        if oldHashes[title] == newHashes[title]:
+            continue
+        oldRecord = old["parts"][title]
+        newRecord = new["parts"][title]
+        changes = dict()
+        for field, kind in changeKinds:
+            if oldRecord.get(field) != newRecord.get(field):
+                changes[kind] = [oldRecord.get(field), newRecord.get(field)]
+        ret["changed"][title] = changes
+    return ret
+
+
+def modulesAsString(moduleNames):
+    if not moduleNames:
+        return "no module"
+    return ("module " if len(moduleNames) == 1 else "modules ") + ", ".join(["'{}'".format(moduleName) for moduleName in moduleNames])
+
+
+def diffAsString(diff, old, new):
+    ret = list()
+    for title in diff["added"]:
+        record = new["parts"][title]
+        ret.append("ADDED   '{}' ({}) at {} in {}".format(title, record["moduleIdRef"], record["positionAbsolute"], modulesAsString(record["modules"])))
+    for title in diff["removed"]:
+        record = old["parts"][title]
+        ret.append("REMOVED '{}' ({}) at {} in {}".format(title, record["moduleIdRef"], record["positionAbsolute"], modulesAsString(record["modules"])))
+    for title, changes in diff["changed"].items():
+        ret.append("CHANGED '{}'".format(title))
+        for kind, (oldValue, newValue) in changes.items():
+            ret.append("    {}: {} -> {}".format(kind, json.dumps(oldValue, sort_keys=True), json.dumps(newValue, sort_keys=True)))
+    return "\n".join(ret)
+
+# ####################### SCRIPT PART ########################
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compares the resolved parts of two Fritzing Sketches (.fzz) or snapshots (.json). The exit status is 0 if there are no differences and 1 if there are.")
+    parser.add_argument("OLD", help="The old sketch (.fzz) or snapshot (.json).")
+    parser.add_argument("NEW", nargs="?", default=None, help="The new sketch (.fzz) or snapshot (.json).")
+    parser.add_argument("-s", "--snapshot", action="store_true", help="Write the snapshot of OLD to the console instead of comparing.")
+    parser.add_argument("-m", "--module-name", default=None, help="The module name (prefix) used for both sketches. (default: derived from OLD)")
+    parser.add_argument("-p", "--precision", type=int, default=6, help="The number of digits (mm) positions are rounded to. (default: 6)")
+    parser.add_argument("--json", action="store_true", help="Write the differences as JSON.")
+    parser.add_argument("-v", "--verbose", action="count", default=0, help="-v -vv- -vvv increase output verbosity")
+    parser.add_argument('-V', '--version', action='version', version="%(prog)s " + str(VERSION))
+
+    args = parser.parse_args()
+    lib.args = args
+
+    old = loadSnapshot(args.OLD, args.module_name, args.precision)
+    if args.snapshot:
+        lib.printConsole(json.dumps(old, sort_keys=True, indent=4), 0)
+        exit(0)
+    if args.NEW is None:
+        parser.error("NEW is required unless --snapshot is given")
+
+    # Both sketches need the same module names, otherwise every part would have changed its module.
+    new = loadSnapshot(args.NEW, args.module_name or old.get("moduleNameOrPrefix"), args.precision)
+    diff = diffSnapshots(old, new)
+
+    if args.json:
+        lib.printConsole(json.dumps(diff, sort_keys=True, indent=4), 0)
+    elif diff["added"] or diff["removed"] or diff["changed"]:
+        lib.printConsole(diffAsString(diff, old, new), 0)
+
+    sys.exit(1 if diff["added"] or diff["removed"] or diff["changed"] else 0)
@@ -0,0 +1,129 @@
+'''
+    generate_prototype_table.py from fzz2scad: Creates the table of
+    prototypes (fzz2scad_prototypes.json) of the Fritzing core parts.
+
+    Copyright (C) 2015  Hauke Thorenz <htho@thorenz.net>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+import argparse
+import glob
+import json
+import os
+import subprocess
+import xml.etree.ElementTree as ET
+import fzz2scadLib as lib
+
+VERSION = 0.1
+
+# Reading a part fails with one of these if it has no usable PCB footprint.
+partErrors = (AttributeError, KeyError, TypeError, ValueError, IOError, ET.ParseError)
+
+
+def getPartsRevision(partsDir):
+    """The git revision of the fritzing-parts checkout or None."""
+    try:
+        completed = subprocess.run(["git", "-C", partsDir, "rev-parse", "HEAD"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True)
+    except OSError:
+        return None
+    if completed.returncode != 0:
+        return None
+    return completed.stdout.strip()
+
+
+def prototypesFromPartsDir(partsDir):
+    """Create the prototypes of the core parts in a fritzing-parts
+    checkout (core/*.fzp and svg/core/...).
+    return dict(moduleIdRef: prototype)"""
+    ret = dict()
+    for fzpFileName in sorted(glob.glob(os.path.join(partsDir, "core", "*.fzp"))):
+        try:
+            fzpRoot = ET.parse(fzpFileName)
+            moduleIdRef = fzpRoot.getroot().attrib['moduleId']
+            svgFileName = os.path.join(partsDir, "svg", "core", fzpRoot.find("./views/pcbView/layers").attrib['image'])
+            ret[moduleIdRef] = lib.prototypeFromXml(fzpRoot, ET.parse(svgFileName))
+        except partErrors as err:
+            lib.printConsole("INFO: Skipping '{}': {!r}", 1, fzpFileName, err)
+    return ret
+
+
+def prototypesFromSketch(fzzFileName):
+    """Create the prototypes of the core parts that are embedded in a
+    sketch.
+    return dict(moduleIdRef: prototype)"""
+    ret = dict()
+    seen = set()
+    embeddedFiles = set(lib.getFilesThatEndWith(fzzFileName, ".fzp"))
+    xmlRoot = lib.getXMLRoot(fzzFileName, lib.getFilesThatEndWith(fzzFileName, ".fz")[0])
+    for instance in xmlRoot.findall("./instances/instance"):
+        moduleIdRef = instance.attrib['moduleIdRef']
+        if moduleIdRef in seen or "/parts/core/" not in instance.attrib.get('path', ""):
+            continue
+        seen.add(moduleIdRef)
+        fzpFileName = "part." + os.path.basename(instance.attrib['path'])
+        if fzpFileName not in embeddedFiles:
+            continue
+        try:
+            fzpRoot = lib.getXMLRoot(fzzFileName, fzpFileName)
+            svgFileName = "svg." + fzpRoot.find("./views/pcbView/layers").attrib['image'].replace("/", ".")
+            ret[moduleIdRef] = lib.prototypeFromXml(fzpRoot, lib.getXMLRoot(fzzFileName, svgFileName))
+        except partErrors as err:
+            lib.printConsole("INFO: Skipping '{}' in '{}': {!r}", 1, fzpFileName, fzzFileName, err)
+    return ret
+
+
+def createTable(prototypes, sources):
+    return {
+        "version": lib.PROTOTYPE_TABLE_VERSION,
+        "sources": sources,
+        "prototypes": {moduleIdRef: {key: str(value) for key, value in prototype.items()} for moduleIdRef, prototype in prototypes.items()}
+    }
+
+# ####################### SCRIPT PART ########################
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Creates the table of prototypes of the Fritzing core parts that fzz2scad uses instead of reading the parts from the sketch.")
+    parser.add_argument("PARTS_DIR", nargs="?", default=None, help="A checkout of https://github.com/fritzing/fritzing-parts")
+    parser.add_argument("--fzz", action="append", default=[], metavar="FZZ_FILE", help="Also take the core parts embedded in this sketch. (may be given more than once)")
+    parser.add_argument("-u", "--update", action="store_true", help="Keep the parts of the existing table that are not found again.")
+    parser.add_argument("-o", "--output", default=lib.PROTOTYPE_TABLE_FILE, help="The table to write. (default: {})".format(lib.PROTOTYPE_TABLE_FILE))
+    parser.add_argument("-v", "--verbose", action="count", default=0, help="-v -vv- -vvv increase output verbosity")
+    parser.add_argument('-V', '--version', action='version', version="%(prog)s " + str(VERSION))
+
+    args = parser.parse_args()
+    lib.args = args
+
+    if args.PARTS_DIR is None and not args.fzz:
+        parser.error("PARTS_DIR or --fzz is required")
+
+    prototypes = dict()
+    sources = list()
+    if args.update and os.path.exists(args.output):
+        with open(args.output, 'r') as f:
+            table = json.load(f)
+        prototypes.update({moduleIdRef: {key: lib.Dimension(value) for key, value in prototype.items()} for moduleIdRef, prototype in table["prototypes"].items()})
+        sources.extend(table.get("sources", list()))
+
+    if args.PARTS_DIR is not None:
+        revision = getPartsRevision(args.PARTS_DIR)
+        prototypes.update(prototypesFromPartsDir(args.PARTS_DIR))
+        sources.append("fritzing-parts" + ("@" + revision if revision else ""))
+    for fzzFileName in args.fzz:
+        prototypes.update(prototypesFromSketch(fzzFileName))
+        sources.append(os.path.basename(fzzFileName))
+
+    with open(args.output, 'w') as f:
+        json.dump(createTable(prototypes, sorted(set(sources))), f, sort_keys=True, indent=4)
+        f.write("\n")
+    lib.printConsole("Wrote {} prototypes to '{}'.".format(len(prototypes), args.output), 0)
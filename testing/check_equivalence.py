@@ -0,0 +1,318 @@
+'''
+    check_equivalence.py from fzz2scad: Checks that the fast paths of
+    fzz2scadLib create the same output as their reference implementations.
+    Exits with 1 at the first divergence.
+
+    Copyright (C) 2015  Hauke Thorenz <htho@thorenz.net>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+    Each sketch (the sketches in testing/fritzing and randomly changed
+    copies of them) is converted twice: once with the reference paths and
+    once with the fast paths. The resolved parts (see
+    fzz2scadLib.getPartRecords()) are compared with the given tolerance,
+    the output of createExportString() and createModuleString() (with each
+    of the output modes) byte by byte.
+'''
+import argparse
+import glob
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import zipfile
+import xml.etree.ElementTree as ET
+
+repositoryDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repositoryDir)
+import fzz2scadLib as lib  # noqa: E402
+
+# The output modes: (showGroundplate, multmatrix, lod)
+VARIANTS = [(False, False, False), (True, False, False), (False, True, False), (False, False, True)]
+
+# Instances of these are not copied into the random sketches.
+NOT_COPIED = frozenset(["WireModuleID", "NoteModuleID", "SchematicFrameModuleID", "HoleModuleID"])
+
+# ####################### REFERENCE PATHS ########################
+
+
+class ReferencePartFilter(lib.PartFilter):
+    """Tests each pattern on its own, every time (no compiled pattern, no
+    remembered decisions)."""
+
+    def _patterns(self, name):
+        import re
+        return [re.compile(p) for p in self.patterns[name]]
+
+    def acceptsModuleIdRef(self, moduleIdRef):
+        return lib.txt_match_in_patternset(moduleIdRef, self._patterns("include")) or not lib.txt_match_in_patternset(moduleIdRef, self._patterns("exclude"))
+
+    def acceptsLayer(self, layer):
+        return lib.txt_match_in_patternset(layer, self._patterns("layers"))
+
+
+class LinearBoardIndex:
+    """Tests a point against every board in order (no grid)."""
+
+    def __init__(self, outlines):
+        self.outlines = list(outlines)
+
+    def find(self, xy):
+        for key, outline in self.outlines:
+            if lib.xyInConvexPolygon(xy, outline):
+                return key
+        return None
+
+
+FAST = {"PartFilter": lib.PartFilter, "BoardIndex": lib.BoardIndex}
+
+# The fast paths that have a reference implementation.
+PATHS = ("prototype-table", "prototype-processes", "part-filter", "board-index")
+
+
+def usePaths(reference):
+    """Switch the paths named in reference to their reference
+    implementation and all others to the fast one.
+    return the number of jobs for buildPrototypes()"""
+    lib.usePrototypeTable = "prototype-table" not in reference
+    lib.PartFilter = ReferencePartFilter if "part-filter" in reference else FAST["PartFilter"]
+    lib.BoardIndex = LinearBoardIndex if "board-index" in reference else FAST["BoardIndex"]
+    # the test sketches have fewer parts than the threshold
+    lib.PROTOTYPE_PROCESS_THRESHOLD = 0
+    return 1 if "prototype-processes" in reference else 2
+
+# ####################### CONVERSION ########################
+
+
+def convert(fzzFileName, reference, precision):
+    """Convert the sketch like fzz2scad.py does.
+    return dict('records', 'export', 'modules' (dict(variant: dict(moduleName: str))))"""
+    jobs = usePaths(reference)
+    lib.partPrototypes.clear()
+    lib.inputFzzFileName = fzzFileName
+    lib.xmlRoot = lib.getXMLRoot(fzzFileName, lib.getFilesThatEndWith(fzzFileName, ".fz")[0])
+    configuration = lib.getConfig(lib.xmlRoot, str(os.path.split(fzzFileName)[-1]).split(".")[0])
+    partFilter = lib.getPartFilter(configuration)
+    lib.buildPrototypes(lib.xmlRoot, partFilter, jobs)
+    parts = lib.getParts(lib.xmlRoot, configuration['attributes'], partFilter)
+    allParts = dict(parts)  # splitPartsToModules() takes the parts out of parts
+    modules = lib.splitPartsToModules(lib.xmlRoot, parts, configuration['modules'])
+    ret = {"records": lib.getPartRecords(allParts, modules, precision), "export": lib.createExportString(parts, configuration), "modules": dict()}
+    for variant in VARIANTS:
+        ret["modules"][variant] = {moduleName: lib.createModuleString(moduleName, moduleParts, configuration, *variant) for moduleName, moduleParts in modules.items()}
+    return ret
+
+# ####################### RANDOM SKETCHES ########################
+
+
+def createRandomSketch(fzzFileName, outFileName, rng, copies):
+    """Write a copy of the sketch with copies more parts (copies of the
+    parts in it) at random positions (in the PCB and in the schematic
+    view), with random rotations and on random sides."""
+    with zipfile.ZipFile(fzzFileName, 'r') as zf:
+        members = [(info, zf.read(info.filename)) for info in zf.infolist()]
+    fzFileName = [info.filename for info, content in members if info.filename.endswith(".fz")][0]
+    fzContent = [content for info, content in members if info.filename == fzFileName][0]
+    root = ET.fromstring(fzContent)
+    instances = root.find("./instances")
+    boardTitles = frozenset([board.attrib['instance'] for board in root.findall("./boards/board")])
+
+    candidates = list()
+    pcbPositions = list()
+    schematicPositions = list()
+    for instance in instances.findall("./instance"):
+        pcbGeometry = instance.find("./views/pcbView/geometry")
+        schematicGeometry = instance.find("./views/schematicView/geometry")
+        if pcbGeometry is None or schematicGeometry is None or instance.attrib['moduleIdRef'] in NOT_COPIED:
+            continue
+        pcbPositions.append((float(pcbGeometry.attrib['x']), float(pcbGeometry.attrib['y'])))
+        schematicPositions.append((float(schematicGeometry.attrib['x']), float(schematicGeometry.attrib['y'])))
+        if instance.find("./title").text not in boardTitles:
+            candidates.append(instance)
+
+    def randomPosition(positions):
+        xs = [p[0] for p in positions]
+        ys = [p[1] for p in positions]
+        marginX = (max(xs) - min(xs)) * 0.2 + 10
+        marginY = (max(ys) - min(ys)) * 0.2 + 10
+        return (rng.uniform(min(xs) - marginX, max(xs) + marginX), rng.uniform(min(ys) - marginY, max(ys) + marginY))
+
+    for n in range(copies):
+        copy = ET.fromstring(ET.tostring(rng.choice(candidates)))
+        copy.attrib['modelIndex'] = str(900000 + n)
+        title = copy.find("./title")
+        title.text = "{}_{}".format(title.text, n)
+
+        pcbView = copy.find("./views/pcbView")
+        geometry = pcbView.find("./geometry")
+        geometry.attrib['x'], geometry.attrib['y'] = ["{:.4f}".format(v) for v in randomPosition(pcbPositions)]
+        if rng.random() < 0.3:
+            pcbView.attrib['bottom'] = "true"
+        else:
+            pcbView.attrib.pop('bottom', None)
+
+        transform = geometry.find("./transform")
+        if transform is not None:
+            geometry.remove(transform)
+        if rng.random() < 0.8:
+            angle = rng.choice([90, 180, 270, rng.uniform(0, 360)])
+            c, s = math.cos(math.radians(angle)), math.sin(math.radians(angle))
+            cx, cy = rng.uniform(0, 40), rng.uniform(0, 40)
+            ET.SubElement(geometry, "transform", {
+                "m11": repr(c), "m12": repr(s), "m13": "0",
+                "m21": repr(-s), "m22": repr(c), "m23": "0",
+                "m31": repr(cx - c * cx + s * cy), "m32": repr(cy - s * cx - c * cy), "m33": "1"})
+
+        schematicGeometry = copy.find("./views/schematicView/geometry")
+        schematicGeometry.attrib['x'], schematicGeometry.attrib['y'] = ["{:.4f}".format(v) for v in randomPosition(schematicPositions)]
+        instances.append(copy)
+
+    if boardTitles and rng.random() < 0.5:
+        randomizeConfiguration(root, rng, sorted(boardTitles), [copy.find("./title").text for copy in instances.findall("./instance")[-copies:]])
+
+    with zipfile.ZipFile(outFileName, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for info, content in members:
+            if info.filename == fzFileName:
+                content = ET.tostring(root, encoding="utf-8")
+            zf.writestr(info.filename, content)
+
+
+def randomizeConfiguration(root, rng, boardTitles, titles):
+    """Add a module that takes the parts by the boards they are on (in a
+    random order of the boards) and attributes for some of the titles to
+    the configuration note of the sketch."""
+    import html
+    import json
+    for note in root.findall("./instances/instance[@moduleIdRef='NoteModuleID']"):
+        if note.find("./title").text.startswith("fzz2scad_config"):
+            configuration = json.loads(lib.txt_from_note(note))
+            break
+    else:
+        return
+    boards = list(boardTitles)
+    rng.shuffle(boards)
+    configuration.setdefault("modules", dict())["boards"] = {"pcbs": boards}
+    attributes = configuration.setdefault("attributes", dict())
+    for title in rng.sample(titles, min(3, len(titles))):
+        attributes[title.rsplit("_", 1)[0] + "_.*"] = {"z": "{:.2f}mm".format(rng.uniform(0, 5)), "parameters": {"height": "{:.1f}mm".format(rng.uniform(1, 10))}}
+    lines = json.dumps(configuration, indent=4, sort_keys=True).split("\n")
+    note.find("./text").text = "<html><body>" + "".join(["<p>{}</p>".format(html.escape(line)) for line in lines]) + "</body></html>"
+
+# ####################### COMPARISON ########################
+
+
+def firstRecordDivergence(reference, fast, absTol, relTol, path="records"):
+    """The first difference of the records (floats with the tolerance).
+    return a string or None"""
+    if isinstance(reference, dict) and isinstance(fast, dict):
+        for key in sorted(set(reference.keys()) | set(fast.keys()), key=str):
+            if key not in fast:
+                return "{}[{!r}] is missing in the fast path".format(path, key)
+            if key not in reference:
+                return "{}[{!r}] is missing in the reference path".format(path, key)
+            divergence = firstRecordDivergence(reference[key], fast[key], absTol, relTol, "{}[{!r}]".format(path, key))
+            if divergence is not None:
+                return divergence
+        return None
+    if isinstance(reference, list) and isinstance(fast, list) and len(reference) == len(fast):
+        for i, (r, f) in enumerate(zip(reference, fast)):
+            divergence = firstRecordDivergence(r, f, absTol, relTol, "{}[{}]".format(path, i))
+            if divergence is not None:
+                return divergence
+        return None
+    if isinstance(reference, float) and isinstance(fast, float):
+        if math.isclose(reference, fast, rel_tol=relTol, abs_tol=absTol):
+            return None
+    elif reference == fast and type(reference) == type(fast):
+        return None
+    return "{}: reference {!r}, fast {!r}".format(path, reference, fast)
+
+
+def firstTextDivergence(reference, fast):
+    """The first line that differs.
+    return a string or None"""
+    if reference == fast:
+        return None
+    referenceLines = reference.split("\n")
+    fastLines = fast.split("\n")
+    for i in range(max(len(referenceLines), len(fastLines))):
+        r = referenceLines[i] if i < len(referenceLines) else "<end>"
+        f = fastLines[i] if i < len(fastLines) else "<end>"
+        if r != f:
+            return "line {}:\n    reference: {!r}\n    fast:      {!r}".format(i + 1, r, f)
+    return "the line endings differ"
+
+
+def firstDivergence(reference, fast, absTol, relTol):
+    divergence = firstRecordDivergence(reference["records"], fast["records"], absTol, relTol)
+    if divergence is not None:
+        return divergence
+    divergence = firstTextDivergence(reference["export"], fast["export"])
+    if divergence is not None:
+        return "createExportString() " + divergence
+    for variant in VARIANTS:
+        divergence = firstRecordDivergence(sorted(reference["modules"][variant].keys()), sorted(fast["modules"][variant].keys()), 0, 0, "modules")
+        if divergence is not None:
+            return divergence
+        for moduleName in sorted(reference["modules"][variant].keys()):
+            divergence = firstTextDivergence(reference["modules"][variant][moduleName], fast["modules"][variant][moduleName])
+            if divergence is not None:
+                return "createModuleString('{}', showGroundplate={}, multmatrix={}, lod={}) {}".format(moduleName, *(variant + (divergence,)))
+    return None
+
+# ####################### SCRIPT PART ########################
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Checks that the fast paths of fzz2scadLib create the same output as their reference implementations.")
+    parser.add_argument("SKETCHES", nargs="*", help="The sketches to check. (default: testing/fritzing/*.fzz)")
+    parser.add_argument("-p", "--path", action="append", choices=PATHS, default=[], help="Only compare this fast path, the others are fast in both runs. (may be given more than once, default: all)")
+    parser.add_argument("-r", "--random", type=int, default=5, help="The number of random sketches created from each sketch. (default: 5)")
+    parser.add_argument("-c", "--copies", type=int, default=30, help="The number of parts added to a random sketch. (default: 30)")
+    parser.add_argument("-s", "--seed", type=int, default=0, help="The seed of the random sketches. (default: 0)")
+    parser.add_argument("--abs-tol", type=float, default=0.0, help="The absolute tolerance of floats in the part records. (default: 0)")
+    parser.add_argument("--rel-tol", type=float, default=0.0, help="The relative tolerance of floats in the part records. (default: 0)")
+    parser.add_argument("--precision", type=int, default=12, help="The digits the part records are rounded to. (default: 12)")
+    parser.add_argument("--keep", default=None, metavar="DIRECTORY", help="Keep the random sketches in DIRECTORY, to reproduce a divergence with fzz2scad.py.")
+    args = parser.parse_args()
+
+    lib.args = argparse.Namespace(verbose=0, log_json=False)
+    sketches = args.SKETCHES or sorted(glob.glob(os.path.join(repositoryDir, "testing", "fritzing", "*.fzz")))
+    reference = frozenset(args.path or PATHS)
+
+    directory = args.keep or tempfile.mkdtemp(prefix="fzz2scad_equivalence_")
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(args.seed)
+    for sketch in list(sketches):
+        for i in range(args.random):
+            randomSketch = os.path.join(directory, "{}_random{}.fzz".format(os.path.basename(sketch).rsplit(".", 1)[0], i))
+            createRandomSketch(sketch, randomSketch, rng, args.copies)
+            sketches.append(randomSketch)
+
+    failed = False
+    try:
+        for sketch in sketches:
+            divergence = firstDivergence(convert(sketch, reference, args.precision), convert(sketch, frozenset(), args.precision), args.abs_tol, args.rel_tol)
+            if divergence is not None:
+                print("FAIL: '{}' ({}):\n    {}".format(sketch, ", ".join(sorted(reference)), lib.txt_prefix_each_line(divergence, "    ", True)))
+                failed = True
+                break
+            print("OK: '{}'".format(sketch))
+    finally:
+        usePaths(frozenset())
+        if args.keep is None:
+            shutil.rmtree(directory)
+
+    exit(1 if failed else 0)
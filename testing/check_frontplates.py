@@ -0,0 +1,132 @@
+'''
+    check_frontplates.py from fzz2scad: Checks the frontplates of --stl
+    for the sketches in testing/fritzing. Exits with 1 if a mesh has the
+    wrong number of vertices, the wrong bounds or is not closed, or if
+    overlapping cut-outs are not rejected.
+
+    Copyright (C) 2015  Hauke Thorenz <htho@thorenz.net>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+    Each board is extruded with its holes and cut-outs, so its mesh has
+    2 * (4 + the segments of its holes and cut-outs) vertices: a copy of
+    each outline at the top and at the bottom (or the floor of a blind
+    cut-out). The bounds are the outlines of the boards from their bottom
+    to their top. In a closed mesh each edge is used once in each direction.
+'''
+import argparse
+import collections
+import glob
+import json
+import math
+import os
+import sys
+
+repositoryDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repositoryDir)
+import fzz2scadLib as lib  # noqa: E402
+import fzz2scadGeometry as geometry  # noqa: E402
+import fzz2scadStl as stl  # noqa: E402
+
+CUTOUTS = os.path.join(repositoryDir, "testing", "cutouts", "example_cutouts.json")
+
+
+def cutoutTables(fileName):
+    """The cut-out tables to check with: none, the example, the example
+    with blind cut-outs and the example with cut-outs that overlap.
+    return a list of (name, table, must be rejected)"""
+    with open(fileName, 'r') as f:
+        cutouts = json.load(f)["cutouts"]
+    blind = {m: dict(cutout, depth="0.5mm") for m, cutout in cutouts.items()}
+    huge = {m: dict(cutout, diameter="200mm", width="200mm", height="200mm") for m, cutout in cutouts.items()}
+    ret = list()
+    for name, table, rejected in (("no cut-outs", dict(), False), ("cut-outs", cutouts, False), ("blind cut-outs", blind, False), ("overlapping cut-outs", huge, True)):
+        # like geometry.loadCutoutTable(), which reads a file
+        ret.append((name, {m: c if isinstance(c, list) else [c] for m, c in table.items()}, rejected))
+    return ret
+
+
+def expectedVertices(footprints, fn):
+    segments = {"circle": fn, "rect": 4}
+    ret = 0
+    for board in footprints["boards"]:
+        ret = ret + 2 * 4
+    for cutout in footprints["cutouts"]:
+        if any([geometry.pointInPolygon(cutout["center"], board["outline"]) for board in footprints["boards"]]):
+            ret = ret + 2 * segments[cutout["shape"]]
+    return ret
+
+
+def expectedBounds(footprints):
+    points = [xy for board in footprints["boards"] for xy in board["outline"]]
+    zMin = min([board["z"] for board in footprints["boards"]])
+    zMax = max([board["z"] + board["thickness"] for board in footprints["boards"]])
+    return ((min(x for x, y in points), min(y for x, y in points), zMin), (max(x for x, y in points), max(y for x, y in points), zMax))
+
+
+def openEdges(mesh):
+    """The directed edges that are not used exactly once in each direction."""
+    edges = collections.Counter()
+    for a, b, c in mesh.triangles:
+        for edge in ((a, b), (b, c), (c, a)):
+            edges[edge] = edges[edge] + 1
+    return sorted([edge for edge, count in edges.items() if count != 1 or edges.get((edge[1], edge[0])) != 1])
+
+
+def checkModule(moduleName, moduleParts, configuration, table, rejected, fn):
+    """return a list of problems"""
+    try:
+        mesh = stl.createFrontplateMesh(moduleName, moduleParts, configuration, table, None, fn)
+    except stl.FrontplateError:
+        return list() if rejected else ["the frontplate was rejected"]
+    if rejected:
+        return ["the overlapping cut-outs were not rejected"]
+    if mesh is None:
+        return list()
+    footprints = geometry.getModuleFootprints(moduleName, moduleParts, configuration, table, None, fn)
+    ret = list()
+    if len(mesh.vertices) != expectedVertices(footprints, fn):
+        ret.append("{} vertices instead of {}".format(len(mesh.vertices), expectedVertices(footprints, fn)))
+    bounds, expected = mesh.bounds(), expectedBounds(footprints)
+    if not all([math.isclose(v, e, abs_tol=1e-9) for corner, expectedCorner in zip(bounds, expected) for v, e in zip(corner, expectedCorner)]):
+        ret.append("the bounds are {} instead of {}".format(bounds, expected))
+    edges = openEdges(mesh)
+    if edges:
+        ret.append("the mesh is not closed, {} edges are open (e.g. {})".format(len(edges), edges[:3]))
+    return ret
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Checks the vertex counts, bounds and closedness of the frontplates of --stl.")
+    parser.add_argument("SKETCHES", nargs="*", help="The sketches to check. (default: testing/fritzing/*.fzz)")
+    parser.add_argument("--cutouts", default=CUTOUTS, metavar="JSON_FILE", help="The table of cut-outs. (default: %(default)s)")
+    parser.add_argument("--fn", type=int, default=32, help="The number of segments of holes and round cut-outs. (default: 32)")
+    args = parser.parse_args()
+
+    lib.args = argparse.Namespace(verbose=0, log_json=False)
+    sketches = args.SKETCHES or sorted(glob.glob(os.path.join(repositoryDir, "testing", "fritzing", "*.fzz")))
+    tables = cutoutTables(args.cutouts)
+
+    failed = False
+    for sketch in sketches:
+        xmlRoot, configuration, parts = lib.loadSketch(sketch)
+        modules = lib.splitPartsToModules(xmlRoot, parts, configuration['modules'])
+        for name, table, rejected in tables:
+            for moduleName, moduleParts in sorted(modules.items()):
+                for problem in checkModule(moduleName, moduleParts, configuration, table, rejected, args.fn):
+                    print("FAIL: '{}' {} ({}): {}".format(sketch, moduleName, name, problem))
+                    failed = True
+        print("{}: '{}'".format("FAIL" if failed else "OK", sketch))
+
+    exit(1 if failed else 0)
@@ -0,0 +1,81 @@
+'''
+    check_import_time.py from fzz2scad: Checks that importing fzz2scadLib
+    stays cheap. Exits with 1 if the import takes longer than the budget
+    or if it imports modules it should only import on first use.
+
+    Copyright (C) 2015  Hauke Thorenz <htho@thorenz.net>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+import argparse
+import compileall
+import os
+import subprocess
+import sys
+
+# Modules fzz2scadLib may import when it is imported.
+allowedModules = frozenset([
+    "fzz2scadLib",
+    "math"
+])
+
+repositoryDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def runPython(code, *options):
+    completed = subprocess.run([sys.executable] + list(options) + ["-c", code], cwd=repositoryDir, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    return completed
+
+
+def importTime(moduleName):
+    """The cumulative import time (microseconds) of the module as reported by python -X importtime."""
+    stderr = runPython("import " + moduleName, "-X", "importtime").stderr
+    for line in stderr.splitlines():
+        fields = line.split("|")
+        if line.startswith("import time:") and len(fields) == 3 and fields[2].strip() == moduleName:
+            return int(fields[1])
+    raise RuntimeError("No import time for '{}' found.".format(moduleName))
+
+
+def newModules(moduleName):
+    """The modules that are imported by importing the module."""
+    before = set(runPython("import sys; print('\\n'.join(sys.modules))").stdout.split())
+    after = set(runPython("import sys; import {}; print('\\n'.join(sys.modules))".format(moduleName)).stdout.split())
+    return after - before
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Checks that importing fzz2scadLib stays cheap.")
+    parser.add_argument("-b", "--budget", type=int, default=5000, help="The import time budget in microseconds. (default: 5000)")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="Take the best of this many measurements. (default: 5)")
+    args = parser.parse_args()
+
+    # Measure the import with bytecode, like an installed copy is imported.
+    compileall.compile_file(os.path.join(repositoryDir, "fzz2scadLib.py"), quiet=1)
+
+    failed = False
+
+    unexpected = sorted(newModules("fzz2scadLib") - allowedModules)
+    if unexpected:
+        print("FAIL: importing fzz2scadLib imports {}".format(unexpected))
+        failed = True
+
+    best = min(importTime("fzz2scadLib") for i in range(args.repeat))
+    if best > args.budget:
+        print("FAIL: importing fzz2scadLib takes {}us, the budget is {}us".format(best, args.budget))
+        failed = True
+    else:
+        print("OK: importing fzz2scadLib takes {}us, the budget is {}us".format(best, args.budget))
+
+    exit(1 if failed else 0)
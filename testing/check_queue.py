@@ -0,0 +1,119 @@
+'''
+    check_queue.py from fzz2scad: Checks that several workers of
+    fzz2scadQueue.py on one spool directory do each job exactly once.
+    Exits with 1 if a job is lost, done twice or has no result record.
+
+    Copyright (C) 2015  Hauke Thorenz <htho@thorenz.net>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+    Copies of the sketches in testing/fritzing (and a few broken sketches,
+    which must fail) are submitted to a temporary spool, then the workers
+    are started as separate processes and work until the queue is empty.
+'''
+import argparse
+import glob
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+repositoryDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+QUEUE = os.path.join(repositoryDir, "fzz2scadQueue.py")
+
+
+def runQueue(*arguments, **kwargs):
+    return subprocess.run([sys.executable, QUEUE] + list(arguments), cwd=repositoryDir, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True, **kwargs)
+
+
+def submitJobs(spoolDir, jobs, broken):
+    """Submit jobs copies of the test sketches and broken broken sketches.
+    return dict(job: expected status)"""
+    sketches = sorted(glob.glob(os.path.join(repositoryDir, "testing", "fritzing", "*.fzz")))
+    sourceDir = os.path.join(spoolDir, "..", "sources")
+    os.makedirs(sourceDir)
+    ret = dict()
+    for i in range(jobs):
+        name = "job{:03d}".format(i)
+        shutil.copyfile(sketches[i % len(sketches)], os.path.join(sourceDir, name + ".fzz"))
+        ret[name] = "done"
+    for i in range(broken):
+        name = "broken{:03d}".format(i)
+        with open(os.path.join(sourceDir, name + ".fzz"), 'w') as f:
+            f.write("not a sketch")
+        ret[name] = "failed"
+    runQueue("submit", spoolDir, *[os.path.join(sourceDir, name + ".fzz") for name in sorted(ret)], check=True)
+    return ret
+
+
+def checkSpool(spoolDir, expected):
+    """return a list of problems"""
+    ret = list()
+    states = dict()
+    for d in ("queue", "claimed", "done", "failed"):
+        for fileName in os.listdir(os.path.join(spoolDir, d)):
+            if fileName.endswith(".fzz"):
+                states.setdefault(fileName.split(".", 1)[0], list()).append(d)
+    for name, status in sorted(expected.items()):
+        if states.get(name) != [status]:
+            ret.append("'{}' is in {} instead of {}".format(name, states.get(name, []), [status]))
+        resultFile = os.path.join(spoolDir, "results", name + ".json")
+        if not os.path.isfile(resultFile):
+            ret.append("'{}' has no result record".format(name))
+        else:
+            with open(resultFile, 'r') as f:
+                record = json.load(f)
+            if record["status"] != status:
+                ret.append("the result record of '{}' says '{}' instead of '{}'".format(name, record["status"], status))
+        if status == "done" and not os.path.isfile(os.path.join(spoolDir, "out", name, name + ".scad")):
+            ret.append("'{}' has no output".format(name))
+    for name in sorted(set(states) - set(expected)):
+        ret.append("'{}' is an unknown job in {}".format(name, states[name]))
+    leftovers = [f for f in os.listdir(os.path.join(spoolDir, "out")) if f.startswith(".")]
+    if leftovers:
+        ret.append("the output directories {} were left behind".format(leftovers))
+    return ret
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Checks that several workers of fzz2scadQueue.py on one spool directory do each job exactly once.")
+    parser.add_argument("-w", "--workers", type=int, default=4, help="The number of worker processes. (default: 4)")
+    parser.add_argument("-j", "--jobs", type=int, default=20, help="The number of jobs. (default: 20)")
+    parser.add_argument("-b", "--broken", type=int, default=2, help="The number of broken sketches that must fail. (default: 2)")
+    parser.add_argument("--stale-after", type=float, default=600, metavar="SECONDS", help="The --stale-after of the workers. Small values let workers take over each others jobs. (default: 600)")
+    parser.add_argument("--keep", action="store_true", help="Keep the spool directory.")
+    args = parser.parse_args()
+
+    tmpDir = tempfile.mkdtemp(prefix="fzz2scad_queue_")
+    spoolDir = os.path.join(tmpDir, "spool")
+    try:
+        expected = submitJobs(spoolDir, args.jobs, args.broken)
+        workers = [subprocess.Popen([sys.executable, QUEUE, "work", spoolDir, "--exit-when-empty", "--poll", "0.1", "--stale-after", str(args.stale_after)],
+                                    cwd=repositoryDir, stdout=subprocess.PIPE, stderr=subprocess.STDOUT) for i in range(args.workers)]
+        for worker in workers:
+            worker.communicate()
+        problems = checkSpool(spoolDir, expected)
+    finally:
+        if args.keep:
+            print("The spool is '{}'.".format(spoolDir))
+        else:
+            shutil.rmtree(tmpDir)
+
+    for problem in problems:
+        print("FAIL: {}".format(problem))
+    if not problems:
+        print("OK: {} workers did {} jobs, each exactly once".format(args.workers, len(expected)))
+    exit(1 if problems else 0)
@@ -0,0 +1,108 @@
+'''
+    check_render.py from fzz2scad: Checks the cache of --render with a
+    stub instead of OpenSCAD. Exits with 1 if a module is not rendered,
+    not taken from the cache or not rendered again after a change.
+
+    Copyright (C) 2015  Hauke Thorenz <htho@thorenz.net>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+    The sketch is rendered three times with a library file that uses
+    another one: the first run renders, the second takes the STLs from the
+    cache, the third (after the used file changed) renders again.
+'''
+import argparse
+import os
+import shlex
+import shutil
+import subprocess
+import sys
+import tempfile
+
+repositoryDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FZZ2SCAD = os.path.join(repositoryDir, "fzz2scad.py")
+
+# called like 'openscad -o OUT.stl IN.scad'
+STUB = '''import sys
+with open(sys.argv[2], 'w') as f:
+    f.write("solid stub\\nendsolid stub\\n")
+'''
+
+
+def render(sketch, outDir, libraryFile, executable):
+    """Render the sketch like the user would.
+    return dict(moduleName: status)"""
+    completed = subprocess.run([sys.executable, FZZ2SCAD, sketch, "--render", outDir, "--include", libraryFile, "--openscad", executable],
+                               cwd=repositoryDir, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+    ret = dict()
+    for line in completed.stdout.splitlines():
+        moduleName, sep, rest = line.partition(": ")
+        if sep and rest.split(" ", 1)[0] in ("rendered", "cached", "failed"):
+            ret[moduleName] = rest.split(" ", 1)[0]
+    if completed.returncode != 0 or not ret:
+        ret[None] = "exit status {}:\n{}".format(completed.returncode, completed.stdout)
+    return ret
+
+
+def checkRun(name, results, expected, outDir):
+    """return a list of problems"""
+    ret = list()
+    for moduleName, status in sorted(results.items(), key=lambda item: str(item[0])):
+        if moduleName is None:
+            ret.append("{}: {}".format(name, status))
+        elif status != expected:
+            ret.append("{}: '{}' was {} instead of {}".format(name, moduleName, status, expected))
+        elif not os.path.isfile(os.path.join(outDir, moduleName + ".stl")):
+            ret.append("{}: '{}' has no STL".format(name, moduleName))
+    return ret
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Checks the cache of --render with a stub instead of OpenSCAD.")
+    parser.add_argument("-s", "--sketch", default=os.path.join("testing", "fritzing", "switch_and_led_advanced.fzz"), help="The sketch to render. (default: %(default)s)")
+    parser.add_argument("--keep", action="store_true", help="Keep the output directory.")
+    args = parser.parse_args()
+
+    tmpDir = tempfile.mkdtemp(prefix="fzz2scad_render_")
+    outDir = os.path.join(tmpDir, "out")
+    stubFile = os.path.join(tmpDir, "stubscad.py")
+    libraryFile = os.path.join(tmpDir, "library.scad")
+    usedFile = os.path.join(tmpDir, "parts", "used.scad")
+    executable = "{} {}".format(shlex.quote(sys.executable), shlex.quote(stubFile))
+    problems = list()
+    try:
+        os.makedirs(os.path.dirname(usedFile))
+        with open(stubFile, 'w') as f:
+            f.write(STUB)
+        with open(libraryFile, 'w') as f:
+            f.write("use <parts/used.scad>\n")
+        with open(usedFile, 'w') as f:
+            f.write("module unused() {}\n")
+
+        problems = problems + checkRun("first run", render(args.sketch, outDir, libraryFile, executable), "rendered", outDir)
+        problems = problems + checkRun("second run", render(args.sketch, outDir, libraryFile, executable), "cached", outDir)
+        with open(usedFile, 'a') as f:
+            f.write("module changed() {}\n")
+        problems = problems + checkRun("after a change", render(args.sketch, outDir, libraryFile, executable), "rendered", outDir)
+    finally:
+        if args.keep:
+            print("The output is in '{}'.".format(tmpDir))
+        else:
+            shutil.rmtree(tmpDir)
+
+    for problem in problems:
+        print("FAIL: {}".format(problem))
+    if not problems:
+        print("OK: rendered, taken from the cache and rendered again after a change")
+    exit(1 if problems else 0)
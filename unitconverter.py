@@ -18,10 +18,23 @@
     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 '''
 import argparse
-import fzz2scad
+import csv
+import json
+import re
+import sys
+import fzz2scadLib as lib
+
+# NumPy is optional. It speeds up converting large tables.
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 VERSION = 0.1
 
+# Chunks with at least this many values of one unit are converted with NumPy.
+NUMPY_THRESHOLD = 256
+
 
 class ListAction(argparse.Action):
     def __call__(self, parser, *args, **kwargs):
@@ -40,30 +53,141 @@ Available Input and Output Units
 
 """)
 
-parser = argparse.ArgumentParser()
-
-parser.add_argument("input", help="Any length with any of the supported units.")
-parser.add_argument("-s", "--setunit", help="Set input unit", default="")
-parser.add_argument("-o", "--outputunit", help="Specify the output unit (default: mm)", default="mm")
-parser.add_argument("-a", "--appendunit", help="append unit to output", action="store_true")
-parser.add_argument("--isillustrator", help="passes isIllustrator to the convert function. This affects the conversion from px. Fritzing developers might know what this does.", action="store_true")
-parser.add_argument('-l', "--list", action=ListAction, nargs=0, help="List available units and exit.")
-parser.add_argument("-v", "--verbose", action="count", default=0, help="increase output verbosity")
-parser.add_argument('-V', '--version', action='version', version="%(prog)s " + str(VERSION))
-
-args = parser.parse_args()
-
-fzz2scad.args = args
-
-fzz2scad.printConsole("converter " + str(VERSION), 1)
-fzz2scad.printConsole("From fzz2scad (https://github.com/htho/fzz2scad)\n", 1)
-
-dimension = fzz2scad.Dimension(args.input, args.setunit, args.isillustrator)
-
-outString = str(dimension.getAs(args.outputunit))
-if args.appendunit:
-    outString = outString + args.outputunit
-
-fzz2scad.printConsole(outString, 0)
 
-exit(0)
+def splitValueAndUnit(string, defaultUnit="", isIllustrator=False):
+    """Split '1.2mm' into ('1.2', 'mm'). Like Dimension() does it."""
+    unit = ""
+    value = string
+    while value and not value[-1].isdigit():
+        unit = value[-1] + unit
+        value = value[:-1]
+    if unit == "":
+        unit = defaultUnit
+    if unit == "":
+        unit = "px"
+    if isIllustrator:
+        if unit == "px":
+            unit = unit + "I"
+        else:
+            raise ValueError("Only the unit 'px' can have isIllustrator==true, '{}' dont.".format(unit))
+    if unit not in lib.Dimension.unit_conversion_table:
+        raise ValueError("The unit '{}' is not known!".format(unit))
+    return (value, unit)
+
+
+def convertValues(values, unit, outputUnit, useNumpy=True):
+    """Convert a list of value strings (without unit) from unit to
+    outputUnit. The results are the same as Dimension(value, unit).getAs(outputUnit)."""
+    if useNumpy and numpy is not None and len(values) >= NUMPY_THRESHOLD:
+        a = numpy.array(values, dtype=numpy.float64)
+        a = a / lib.Dimension.unit_conversion_table[unit]
+        return (a * lib.Dimension.unit_conversion_table[outputUnit]).tolist()
+    return [lib.Dimension(v, unit).getAs(outputUnit) for v in values]
+
+
+def convertLines(lines, outputUnit, defaultUnit="", isIllustrator=False, useNumpy=True):
+    """Convert each value in each of the given lines. The values in a line
+    are separated by whitespace, ',' or ';' and may have their own unit.
+    return a list of rows (one for each line). Each row is a list of the
+    converted values. Values that can not be converted are None."""
+    if outputUnit not in lib.Dimension.unit_conversion_table:
+        raise ValueError("The unit '{}' is not known!".format(outputUnit))
+    rows = list()
+    byUnit = dict()  # unit: ([value, ...], [(row, column), ...])
+    for lineNumber, line in enumerate(lines):
+        tokens = [t for t in re.split(r"[\s,;]+", line.strip()) if t != ""]
+        row = [None] * len(tokens)
+        for column, token in enumerate(tokens):
+            try:
+                value, unit = splitValueAndUnit(token, defaultUnit, isIllustrator)
+                float(value)
+            except ValueError as err:
+                lib.printErrorConsole("ERROR: Line {}: Can't convert '{}': {}".format(lineNumber + 1, token, err), 0)
+                continue
+            byUnit.setdefault(unit, (list(), list()))
+            byUnit[unit][0].append(value)
+            byUnit[unit][1].append((lineNumber, column))
+        rows.append(row)
+
+    for unit, (values, positions) in byUnit.items():
+        for (lineNumber, column), converted in zip(positions, convertValues(values, unit, outputUnit, useNumpy)):
+            rows[lineNumber][column] = converted
+    return rows
+
+
+def writeRows(rows, outputFormat, outputUnit, appendUnit, outStream):
+    """Write the rows (see convertLines) line aligned as 'plain', 'csv' or 'json' (one JSON array per line)."""
+    if outputFormat == "csv":
+        writer = csv.writer(outStream, lineterminator="\n")
+    for row in rows:
+        if outputFormat == "json":
+            outStream.write(json.dumps(row) + "\n")
+        else:
+            strings = ["" if v is None else (str(v) + outputUnit if appendUnit else str(v)) for v in row]
+            if outputFormat == "csv":
+                writer.writerow(strings)
+            else:
+                outStream.write(" ".join(strings) + "\n")
+
+
+def _chunks(inStream, chunkSize):
+    chunk = list()
+    for line in inStream:
+        chunk.append(line)
+        if len(chunk) >= chunkSize:
+            yield chunk
+            chunk = list()
+    if chunk:
+        yield chunk
+
+# ####################### SCRIPT PART ########################
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("input", nargs="?", default=None, help="Any length with any of the supported units.")
+    parser.add_argument("-s", "--setunit", help="Set input unit", default="")
+    parser.add_argument("-o", "--outputunit", help="Specify the output unit (default: mm)", default="mm")
+    parser.add_argument("-a", "--appendunit", help="append unit to output", action="store_true")
+    parser.add_argument("--isillustrator", help="passes isIllustrator to the convert function. This affects the conversion from px. Fritzing developers might know what this does.", action="store_true")
+    parser.add_argument("-b", "--batch", nargs="?", default=None, const="-", metavar="FILE", help="Convert all values in FILE (default: '-' stdin). Each line may hold several values separated by whitespace, ',' or ';'. Values without a unit get the unit from --setunit.")
+    parser.add_argument("-f", "--format", choices=["plain", "csv", "json"], default="plain", help="The output format of --batch. There is one output line for each input line. (default: plain)")
+    parser.add_argument("--chunk-size", type=int, default=4096, help="The number of lines --batch reads before converting and writing them. Use 1 for streaming. (default: 4096)")
+    parser.add_argument("--no-numpy", action="store_true", help="Do not use NumPy for large batches.")
+    parser.add_argument('-l', "--list", action=ListAction, nargs=0, help="List available units and exit.")
+    parser.add_argument("-v", "--verbose", action="count", default=0, help="increase output verbosity")
+    parser.add_argument('-V', '--version', action='version', version="%(prog)s " + str(VERSION))
+
+    args = parser.parse_args()
+
+    lib.args = args
+
+    lib.printConsole("converter " + str(VERSION), 1)
+    lib.printConsole("From fzz2scad (https://github.com/htho/fzz2scad)\n", 1)
+
+    if args.batch is not None:
+        if args.batch == "-":
+            inStream = sys.stdin
+        else:
+            inStream = open(args.batch, 'r')
+        failed = False
+        with inStream:
+            for chunk in _chunks(inStream, max(1, args.chunk_size)):
+                rows = convertLines(chunk, args.outputunit, args.setunit, args.isillustrator, not args.no_numpy)
+                writeRows(rows, args.format, args.outputunit, args.appendunit, sys.stdout)
+                sys.stdout.flush()
+                failed = failed or any(v is None for row in rows for v in row)
+        exit(1 if failed else 0)
+
+    if args.input is None:
+        parser.error("the input or --batch is required")
+
+    dimension = lib.Dimension(args.input, args.setunit, args.isillustrator)
+
+    outString = str(dimension.getAs(args.outputunit))
+    if args.appendunit:
+        outString = outString + args.outputunit
+
+    lib.printConsole(outString, 0)
+
+    exit(0)